@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Format throughput of the compiled characteristic formatters (GUI path).
+# Usage: $ python benchmarks/bench_char_formatter.py [-n N]
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bleak_sigspec.utils import get_xml_char, get_char_value  # noqa: E402
+from bleico.char_formatter import CharFormatter  # noqa: E402
+
+# characteristic --> (service, raw payload)
+SAMPLES = {'Battery Level': ('Battery Service', b'\x60'),
+           'Temperature': ('Environmental Sensing', b'\x10\x09'),
+           'Temperature Range': ('Environmental Sensing', b'\xdc\x05\xf0\x0a'),
+           'Heart Rate Measurement': ('Heart Rate', b'\x10\x46\x00\x04'),
+           'Current Time': ('Current Time Service',
+                            b'\xe4\x07\x09\x0a\x0c\x1e\x05\x04\x00\x00')}
+
+
+class Action:
+    """Stand-in for QAction"""
+
+    def __init__(self):
+        self.text = ''
+
+    def setText(self, text):
+        self.text = text
+
+
+def bench(n=20000):
+    results = {}
+    for char, (service, payload) in SAMPLES.items():
+        xml_char = get_xml_char(char)
+        slots = list(xml_char.fields)
+        for field in xml_char.fields.values():
+            if 'BitField' in field:
+                slots += list(field['BitField'])
+        char_formatter = CharFormatter(char, xml_char, service=service,
+                                       actions={slot: Action() for slot in slots})
+        data = get_char_value(payload, xml_char)
+        t0 = time.perf_counter()
+        for i in range(n):
+            fvalue = char_formatter.format(data)
+            for action, text in fvalue.updates:
+                action.setText(text)
+        dt = time.perf_counter() - t0
+        results[char] = {'updates_per_s': n / dt, 'us_per_update': 1e6 * dt / n}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Characteristic formatter benchmark')
+    parser.add_argument('-n', help='updates per characteristic', type=int, default=20000)
+    args = parser.parse_args()
+    for char, res in bench(args.n).items():
+        print('{:<25} {:>12.0f} updates/s {:>8.2f} us/update'.format(
+            char, res['updates_per_s'], res['us_per_update']))
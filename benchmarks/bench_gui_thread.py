@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Main (GUI) thread busy time of the real tray (SystemTrayIcon on the
+# simulated esp32, offscreen Qt) while a BLE thread decodes and formats
+# notifications through its ValuePipeline and signals the main thread,
+# as subscribe_notify does. Fails (exit 1) if applying an update
+# (receive_notification: texts, tooltip template and tooltip render)
+# costs the main thread more than the budget.
+# Usage: $ python benchmarks/bench_gui_thread.py [-r RATE] [-t SECONDS] [-budget US]
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from run_benchmarks import (SRC_PATH, SRC_PATH_SOUND, bench_log, qt_app,  # noqa: E402
+                            set_backend, SimBackend, esp32_batt_cputemp, ESP32_ADDRESS)
+
+# main thread microseconds per applied update
+BUDGET_US = 50
+
+
+def bench(rate=200, duration=5.0):
+    from PyQt5.QtCore import QEventLoop
+    from PyQt5.QtGui import QIcon
+    from bleico.systrayicon import SystemTrayIcon
+    from bleico.worker import Worker
+    log = bench_log()
+    qt_app()
+    set_backend(SimBackend([esp32_batt_cputemp(latency={'connect': 0, 'read': 0},
+                                               jitter=0, seed=1)]))
+    tray = SystemTrayIcon(QIcon(os.path.join(SRC_PATH, 'UNKNOWN.png')),
+                          device_uuid=ESP32_ADDRESS, logger=log,
+                          SRC_PATH=SRC_PATH, SRC_PATH_SOUND=SRC_PATH_SOUND)
+    dev = tray.esp32_device
+    pipeline = tray.value_pipeline
+    samples = []
+    for char_state in tray.char_states.values():
+        if char_state.notifiable:
+            char_state.desktop_notify = False
+            samples.append((char_state, dev.read_char(char_state.char, data_fmt='raw',
+                                                      handle=char_state.handle)))
+    loop = QEventLoop()
+    busy = []
+
+    def receive_notification(response):
+        # GUI thread: apply only
+        t0 = time.perf_counter()
+        tray.receive_notification(response)
+        busy.append(time.perf_counter() - t0)
+
+    def notify(progress_callback):
+        # BLE thread: the subscribe_notify callback, signal only if the queue was empty
+        period = 1 / rate
+        t_next = time.perf_counter()
+        n = 0
+        while time.perf_counter() - t_start < duration:
+            char_state, raw = samples[n % len(samples)]
+            if pipeline.submit(pipeline.process(char_state, raw, notification=True)):
+                progress_callback.emit('values')
+            n += 1
+            t_next += period
+            time.sleep(max(0, t_next - time.perf_counter()))
+
+    worker = Worker(notify)
+    worker.signals.progress.connect(receive_notification)
+    worker.signals.finished.connect(loop.quit)
+    t_start = time.perf_counter()
+    tray.threadpool.start(worker)
+    loop.exec_()
+    tray.threadpool.waitForDone()
+    elapsed = time.perf_counter() - t_start
+    dev.disconnect(log=False)
+    tray.hide()
+    set_backend(None)
+    applied = pipeline.processed - pipeline.coalesced - pipeline.pending()
+    return {'notifications': pipeline.processed,
+            'applied': applied,
+            'coalesced': pipeline.coalesced,
+            'wakeups': len(busy),
+            'main_thread_busy_fraction': sum(busy) / elapsed,
+            'us_per_applied_update': 1e6 * sum(busy) / max(applied, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='GUI thread busy time benchmark')
+    parser.add_argument('-r', help='notifications per second', type=int, default=200)
+    parser.add_argument('-t', help='duration in seconds', type=float, default=5.0)
+    parser.add_argument('-budget', help='main thread us per applied update, default: {}'.format(
+        BUDGET_US), type=float, default=BUDGET_US)
+    args = parser.parse_args()
+    results = bench(args.r, args.t)
+    for key, val in results.items():
+        print('{:<28} {}'.format(key, round(val, 6) if isinstance(val, float) else val))
+    if not results['applied'] or results['us_per_applied_update'] > args.budget:
+        print('FAIL: {:.1f} us per applied update, budget {} us'.format(
+            results['us_per_applied_update'], args.budget))
+        sys.exit(1)
+    print('ok')
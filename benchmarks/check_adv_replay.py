@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Advertisement monitor check (bleico/adv_monitor.py), no Bluetooth
+# needed: replays the recorded advertisements of benchmarks/data/adverts.ndjson
+# (a SIG Temperature service data sensor, an iBeacon and a device with
+# unknown service and manufacturer data) through ScanService(scan=False)
+# and AdvMonitor, and checks the new/update/lost events, the decoded
+# values and that recording the replay gives back the same advertisements.
+# Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_adv_replay.py
+
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect  # noqa: E402
+from bleico.scan_service import ScanService, NEW, UPDATE, LOST  # noqa: E402
+from bleico.scan_cache import ScanCache  # noqa: E402
+from bleico.adv_monitor import AdvMonitor, AdvRecorder, replay_adverts  # noqa: E402
+
+ADVERTS = os.path.join(ROOT, 'benchmarks', 'data', 'adverts.ndjson')
+THERMO, BEACON, UNKNOWN = '5E:00:00:00:00:11', '5E:00:00:00:00:12', '5E:00:00:00:00:13'
+
+EVENTS = [(NEW, THERMO), (NEW, BEACON), (NEW, UNKNOWN), (UPDATE, THERMO),
+          (LOST, THERMO), (LOST, BEACON), (LOST, UNKNOWN)]
+VALUES = {
+    THERMO: {'Temperature': '21.75 °C'},
+    BEACON: {'iBeacon': 'e2c56db5-dffb-48d2-b060-d0f5a71096e0 major: 1 minor: 10 tx: -59 dBm'},
+    UNKNOWN: {'Xiaomi Inc.': '5020aa01', 'Manufacturer 0x0059': '0102ff'},
+}
+
+
+def check(errors, tmp):
+    scan_service = ScanService(expiry=30, scan=False, cache=ScanCache())
+    recorder = AdvRecorder(os.path.join(tmp, 'recorded.ndjson'))
+    scan_service.add_detection_callback(recorder.on_detection)
+    monitor = AdvMonitor(scan_service)
+    events = []
+    monitor.subscribe(lambda kind, reading: events.append((kind, reading.address,
+                                                           dict(reading.values))))
+    monitor.start()
+    replay_adverts(ADVERTS, scan_service.on_detection, speed=0)
+    values = {address: reading.values for address, reading in monitor.readings.items()}
+    first = {address: values for kind, address, values in events if kind == NEW}
+    scan_service.expire(now=time.time() + scan_service.expiry + 1)
+    monitor.stop()
+    recorder.close()
+    print('{} events: {}'.format(len(events), ', '.join('{} {}'.format(kind, address[-2:])
+                                                        for kind, address, values in events)))
+    kinds = [(kind, address) for kind, address, values in events]
+    expect(errors, kinds == EVENTS, 'events {}'.format(kinds))
+    expect(errors, values == VALUES, 'values {}'.format(values))
+    expect(errors, first.get(THERMO) == {'Temperature': '21.5 °C'},
+           'first Temperature {}'.format(first.get(THERMO)))
+    expect(errors, not monitor.readings,
+           '{} readings left after lost'.format(len(monitor.readings)))
+    keys = ('address', 'name', 'rssi', 'services', 'manufacturer_data', 'service_data')
+    with open(ADVERTS) as adv_file, open(recorder.path) as recorded_file:
+        expected = [{key: record[key] for key in keys} for record in map(json.loads, adv_file)]
+        recorded = [{key: record[key] for key in keys}
+                    for record in map(json.loads, recorded_file)]
+    expect(errors, recorded == expected,
+           'recorded {} of {} advertisements differ'.format(len(recorded), len(expected)))
+
+
+if __name__ == '__main__':
+    main(check, 'bleico advertisement replay check')
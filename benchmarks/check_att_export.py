@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# btsnoop/pcap export check (bleico/att_export.py), no Bluetooth and no
+# Wireshark needed: captures N synthetic reads, notifications and writes
+# of the simulated esp32 table and of a BlueZ style table (declaration
+# handles), exports them, then parses the btsnoop file back (H4, ACL,
+# L2CAP and ATT) and checks the discovery against the table and every
+# value against the capture, and that the pcap has the same packets.
+# Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_att_export.py [-n VALUES]
+
+import os
+import struct
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect  # noqa: E402
+from bleico.gatt_capture import (GattCapture, gatt_table, READ, NOTIFY,  # noqa: E402
+                                 WRITE, WRITE_COMMAND)
+from bleico.att_export import export_capture, uuid_bytes, BTSNOOP_EPOCH_DELTA  # noqa: E402
+from bleico.sim_backend import esp32_batt_cputemp, peripheral_from_table  # noqa: E402
+
+SIM_ADDRESS = '5E:00:00:00:00:01'
+BLUEZ_ADDRESS = '5E:00:00:00:00:02'
+KINDS = (READ, NOTIFY, WRITE, WRITE_COMMAND)
+
+
+def bluez_table(table):
+    """Same table with BlueZ numbering: declaration handles, value at + 1"""
+    handle = 0
+    for service in table:
+        handle += 1
+        service['handle'] = handle
+        for char in service['chars']:
+            char['handle'] = handle + 1
+            handle += 2
+            for descriptor in char['descriptors']:
+                handle += 1
+                descriptor['handle'] = handle
+    return table
+
+
+def read_btsnoop(path):
+    with open(path, 'rb') as snoop_file:
+        data = snoop_file.read()
+    assert data[:8] == b'btsnoop\0' and struct.unpack('>II', data[8:16]) == (1, 1002)
+    offset = 16
+    while offset < len(data):
+        orig, incl, flags, drops, ts = struct.unpack_from('>IIIIq', data, offset)
+        offset += 24
+        yield (ts - BTSNOOP_EPOCH_DELTA) / 1e6, flags, data[offset:offset + incl]
+        offset += incl
+
+
+def read_pcap(path):
+    with open(path, 'rb') as pcap_file:
+        data = pcap_file.read()
+    assert struct.unpack_from('<IHHiIII', data) == (0xa1b2c3d4, 2, 4, 0, 0, 65535, 201)
+    offset = 24
+    while offset < len(data):
+        seconds, micros, incl, orig = struct.unpack_from('<IIII', data, offset)
+        offset += 16
+        yield data[offset:offset + incl]
+        offset += incl
+
+
+def att_pdus(packets, errors):
+    """btsnoop packets --> (connection, received, ATT pdu), checking the framing"""
+    for t, flags, packet in packets:
+        if packet[0] == 0x04:
+            if flags != 3 or packet[2] != len(packet) - 3:
+                errors.append('bad event {}'.format(packet.hex()))
+            continue
+        connection, acl_length = struct.unpack_from('<HH', packet, 1)
+        l2cap_length, cid = struct.unpack_from('<HH', packet, 5)
+        if packet[0] != 0x02 or acl_length != len(packet) - 5 or \
+                l2cap_length != len(packet) - 9 or cid != 4 or flags not in (0, 1):
+            errors.append('bad ACL packet {}'.format(packet.hex()))
+            continue
+        yield connection & 0x0FFF, flags == 1, packet[9:]
+
+
+def check_device(pdus, table, values, errors, name):
+    """Discovery of ``table`` then ``values`` [(kind, recorded handle, data)]"""
+    # discovery: services, characteristics (recorded handle --> value handle)
+    services = []
+    value_handles = {}
+    uuids = {bytes(uuid_bytes(char['uuid'])): char for service in table
+             for char in service['chars']}
+    pdus = iter(pdus)
+    for received, pdu in pdus:
+        opcode = pdu[0]
+        if opcode == 0x11:
+            services.append(pdu[6:])
+        elif opcode == 0x09:
+            declaration, properties, value = struct.unpack_from('<HBH', pdu, 2)
+            char = uuids.get(pdu[7:])
+            if char is None:
+                errors.append('{}: unknown characteristic {}'.format(name, pdu.hex()))
+            else:
+                value_handles[char['handle']] = value
+        elif opcode in (0x0A, 0x1B, 0x12, 0x52):
+            break
+    expected_services = [uuid_bytes(service['uuid']) for service in table]
+    expect(errors, services == expected_services,
+           '{}: services {}'.format(name, [s.hex() for s in services]))
+    n_chars = sum(len(service['chars']) for service in table)
+    expect(errors, len(value_handles) == n_chars,
+           '{}: {} of {} characteristics'.format(name, len(value_handles), n_chars))
+    # values
+    opcodes = {READ: (0x0A, 0x0B), NOTIFY: (0x1B,), WRITE: (0x12, 0x13),
+               WRITE_COMMAND: (0x52,)}
+    pending = [(False, pdu)]
+    n_values = 0
+    for kind, handle, data in values:
+        for i, opcode in enumerate(opcodes[kind]):
+            if pending:
+                received, pdu = pending.pop()
+            else:
+                received, pdu = next(pdus, (None, b'\0'))
+            expected_handle = value_handles.get(handle)
+            ok = pdu[0] == opcode
+            if opcode in (0x0A, 0x1B, 0x12, 0x52):
+                ok = ok and struct.unpack_from('<H', pdu, 1)[0] == expected_handle
+            if opcode in (0x1B, 0x12, 0x52):
+                ok = ok and pdu[3:] == data
+            if opcode == 0x0B:
+                ok = ok and pdu[1:] == data
+            if not ok:
+                errors.append('{}: value {} {} handle {}: {}'.format(name, n_values, kind,
+                                                                      handle, pdu.hex()))
+                return
+        n_values += 1
+    return n_values
+
+
+def check(errors, tmp, n=20000):
+    path = os.path.join(tmp, 'capture.bcap')
+    capture = GattCapture(max_bytes=64 << 10, flush_interval=0.05, max_pending=n * 4)
+    capture.start(path)
+    sim_services = esp32_batt_cputemp().services
+    capture.set_profile(SIM_ADDRESS, sim_services)
+    sim_table = gatt_table(sim_services)
+    bluez = bluez_table(gatt_table(esp32_batt_cputemp().services))
+    capture.set_profile(BLUEZ_ADDRESS,
+                        peripheral_from_table(BLUEZ_ADDRESS, 'esp32', bluez).services)
+    tables = {SIM_ADDRESS: sim_table, BLUEZ_ADDRESS: bluez}
+    values = {SIM_ADDRESS: [], BLUEZ_ADDRESS: []}
+    for i in range(n):
+        for address, table in tables.items():
+            chars = [char for service in table for char in service['chars']]
+            char = chars[i % len(chars)]
+            kind = KINDS[i % len(KINDS)]
+            data = i.to_bytes(4, 'little') + bytes(i % 7)
+            capture.record(kind, address, char['handle'], data)
+            values[address].append((kind, char['handle'], data))
+    capture.stop()
+    t0 = time.perf_counter()
+    btsnoop_path = os.path.join(tmp, 'capture.btsnoop')
+    exporter = export_capture(path, btsnoop_path)
+    elapsed = time.perf_counter() - t0
+    print('exported {} values ({} packets, {} capture files) in {:.2f} s, {:.0f} values/s, '
+          '{} KiB'.format(exporter.values, exporter.packets, capture.files, elapsed,
+                          exporter.values / elapsed, os.path.getsize(btsnoop_path) >> 10))
+    packets = list(read_btsnoop(btsnoop_path))
+    expect(errors, len(packets) == exporter.packets, '{} packets read back'.format(len(packets)))
+    by_connection = {}
+    for connection, received, pdu in att_pdus(packets, errors):
+        by_connection.setdefault(connection, []).append((received, pdu))
+    for connection, address in zip(sorted(by_connection), (SIM_ADDRESS, BLUEZ_ADDRESS)):
+        n_values = check_device(by_connection[connection], tables[address], values[address],
+                                errors, address)
+        expect(errors, n_values is None or n_values == n,
+               '{}: {} values'.format(address, n_values))
+    # BlueZ handles kept: the value handle follows the declaration
+    pdus = by_connection.get(sorted(by_connection)[-1], []) if by_connection else []
+    notified = [pdu for received, pdu in pdus if pdu[0] == 0x1B]
+    first = values[BLUEZ_ADDRESS][1]
+    expect(errors, notified and struct.unpack_from('<H', notified[0], 1)[0] == first[1] + 1,
+           'BlueZ handles not kept')
+    pcap_path = os.path.join(tmp, 'capture.pcap')
+    export_capture(path, pcap_path)
+    pcap_packets = [packet[4:] for packet in read_pcap(pcap_path)]
+    expect(errors, pcap_packets == [packet for t, flags, packet in packets],
+           'pcap: {} packets differ'.format(len(pcap_packets)))
+
+
+if __name__ == '__main__':
+    main(check, 'bleico btsnoop/pcap export check',
+         ('-n', {'help': 'values per device, default: 20000', 'type': int}))
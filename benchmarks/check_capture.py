@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Raw capture check (bleico/gatt_capture.py), no Bluetooth needed: writes
+# N synthetic values from two threads through GattCapture with a small
+# rotation size, then reads every file back (CaptureReader), checks the
+# values, the GATT table kept in every file, the time index and a file
+# cut short, and prints the record() cost on the caller side. Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_capture.py [-n VALUES]
+
+import os
+import shutil
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect, costs_text  # noqa: E402
+from bleico.gatt_capture import (GattCapture, CaptureReader, rotated_paths,  # noqa: E402
+                                 gatt_table, READ, NOTIFY)
+from bleico.sim_backend import esp32_batt_cputemp  # noqa: E402
+
+ADDRESSES = ('5E:00:00:00:00:01', '5E:00:00:00:00:02')
+
+
+def produce(capture, address, n, costs):
+    for i in range(n):
+        kind = NOTIFY if i % 4 else READ
+        data = i.to_bytes(4, 'little') + bytes(i % 17)
+        t0 = time.perf_counter_ns()
+        capture.record(kind, address, 10 + i % 3, data)
+        costs.append(time.perf_counter_ns() - t0)
+
+
+def check(errors, tmp, n=20000):
+    path = os.path.join(tmp, 'capture.bcap')
+    # about 6 files whatever n
+    capture = GattCapture(max_bytes=n * 13, index_interval=512, flush_interval=0.05,
+                          max_pending=n * 2)
+    capture.start(path)
+    services = esp32_batt_cputemp().services
+    capture.set_profile(ADDRESSES[0], services)
+    costs = [[], []]
+    threads = [threading.Thread(target=produce, args=(capture, address, n, cost))
+               for address, cost in zip(ADDRESSES, costs)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    capture.stop()
+    elapsed = time.perf_counter() - t0
+    print('record(): {}; {} values written in {:.2f} s, {} files, {} dropped'.format(
+        costs_text(costs[0] + costs[1]), capture.records, elapsed, capture.files,
+        capture.dropped))
+    paths = rotated_paths(path)
+    expect(errors, len(paths) >= 2, 'no rotation: {} files'.format(len(paths)))
+    seen = {address: [] for address in ADDRESSES}
+    t_read = time.perf_counter()
+    n_read = 0
+    for file_path in paths:
+        with CaptureReader(file_path) as reader:
+            expect(errors, reader.index() is not None,
+                   '{}: no index'.format(os.path.basename(file_path)))
+            n_before = len(seen[ADDRESSES[0]])
+            for t, kind, address, handle, data in reader:
+                i = int.from_bytes(data[:4], 'little')
+                if kind != ('notify' if i % 4 else 'read') or handle != 10 + i % 3 \
+                        or len(data) != 4 + i % 17:
+                    errors.append('bad value {} of {}'.format(i, address))
+                    break
+                seen[address].append(i)
+                n_read += 1
+            # the table is written again in each file with values of the device
+            if len(seen[ADDRESSES[0]]) > n_before and \
+                    reader.profile(ADDRESSES[0]) != (ADDRESSES[0], gatt_table(services)):
+                errors.append('{}: no GATT table'.format(os.path.basename(file_path)))
+    print('read back {} values in {:.2f} s'.format(n_read, time.perf_counter() - t_read))
+    for address in ADDRESSES:
+        expect(errors, seen[address] == list(range(n)),
+               '{}: {} values, out of order or missing'.format(address, len(seen[address])))
+    # seek by time through the index
+    with CaptureReader(paths[-2]) as reader:
+        blocks = reader.index()
+        since = blocks[len(blocks) // 2][0]
+        values = list(reader.records(since=since))
+        expect(errors, values and values[0][0] >= since and
+               len(values) == sum(1 for value in reader if value[0] >= since),
+               'seek by time: {} values'.format(len(values)))
+    # cut short: readable up to the last whole record
+    cut_path = os.path.join(tmp, 'cut.bcap')
+    shutil.copy(paths[0], cut_path)
+    with open(cut_path, 'r+b') as cut_file:
+        cut_file.truncate(os.path.getsize(cut_path) // 2 + 3)
+    with CaptureReader(cut_path) as reader:
+        n_cut = sum(1 for _ in reader)
+        expect(errors, reader.index() is None and reader.truncated and n_cut,
+               'cut file: {} values, truncated {}'.format(n_cut, reader.truncated))
+
+
+if __name__ == '__main__':
+    main(check, 'bleico raw capture check',
+         ('-n', {'help': 'values per device, default: 20000', 'type': int}))
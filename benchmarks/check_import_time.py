@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+# Import time guard for the bleico CLI: runs cheap commands with
+# ``python -X importtime`` and fails (exit 1) if they import Qt, bleak or
+# bleak_sigspec, or take longer than the budget.
+# Usage: $ python benchmarks/check_import_time.py [-budget MS]
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import BLEICO, main, expect, subprocess_env  # noqa: E402
+
+HEAVY = ('PyQt5', 'bleak', 'bleak_sigspec')
+
+# name --> (python args, packages that must not be imported, check budget)
+CASES = {'version': ([BLEICO, '-v'], HEAVY, True),
+         'help': ([BLEICO, '-h'], HEAVY, True),
+         'config': ([BLEICO, 'config', '-t', '00:00:00:00:00:00'], HEAVY, True),
+         'daemon': (['-c', 'import bleico.daemon'], ('PyQt5',), False)}
+
+
+def parse_importtime(stderr):
+    """``-X importtime`` output --> `dict` module --> (self us, cumulative us)"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def check(errors, tmp, budget=150):
+    for name, (argv, forbidden, timed) in CASES.items():
+        proc = subprocess.run([sys.executable, '-X', 'importtime'] + argv,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              universal_newlines=True, env=subprocess_env(tmp))
+        modules = parse_importtime(proc.stderr)
+        total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+        heavy = sorted(mod for mod in modules if mod.split('.')[0] in forbidden)
+        slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        print('{:<8} {:>8.1f} ms'.format(name, total_ms))
+        for mod, (self_us, cumulative_us) in slowest:
+            print('{:>10} {:>10.1f} ms  {}'.format('', cumulative_us / 1000, mod))
+        expect(errors, modules, '{}: no import time output, exit code {}'.format(
+            name, proc.returncode))
+        expect(errors, not heavy, '{}: imports {}'.format(name, ', '.join(heavy[:10])))
+        expect(errors, not timed or total_ms <= budget,
+               '{}: {:.1f} ms > {} ms budget'.format(name, total_ms, budget))
+
+
+if __name__ == '__main__':
+    main(check, 'bleico CLI import time check',
+         ('-budget', {'help': 'import time budget per command in ms, default: 150',
+                      'type': float}))
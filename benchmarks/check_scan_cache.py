@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Scan cache check (bleico/scan_cache.py), no Bluetooth needed: saves a
+# device seen a minute ago, loads it in a new cache and a ScanService
+# table, detects it again and checks that the cache entry is fresh (last
+# seen, RSSI and the bleak device to connect without discovery), also
+# after saving and loading the cache again. Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_scan_cache.py
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect  # noqa: E402
+from bleico.scan_cache import ScanCache, ScanEntry  # noqa: E402
+from bleico.scan_service import ScanService  # noqa: E402
+from bleico.adv_monitor import record_to_adv  # noqa: E402
+
+ADDRESS = '5E:00:00:00:00:21'
+
+
+def check(errors, tmp):
+    path = os.path.join(tmp, 'scan_cache.json')
+    cache = ScanCache(path=path)
+    entry = ScanEntry(ADDRESS, name='thermo', rssi=-80)
+    entry.last_seen -= 60
+    cache.put(entry)
+    cache.save()
+    # new process: the cached device is in the table, then advertises again
+    cache = ScanCache(path=path)
+    cache.load()
+    scan_service = ScanService(scan=False, cache=cache)
+    scan_service.load_cache()
+    expect(errors, scan_service.get(ADDRESS) is not None, 'cached device not in the table')
+    device, advertisement_data = record_to_adv({'address': ADDRESS, 'name': 'thermo',
+                                                'rssi': -50})
+    for _ in range(10):
+        scan_service.on_detection(device, advertisement_data)
+    cached = cache.get(ADDRESS, max_age=5)
+    expect(errors, cached is not None, 'detected device not fresh in the cache')
+    if cached is not None:
+        print('cached: {}, last seen {:.2f} s ago, {} advertisements'.format(
+            cached, time.time() - cached.last_seen, cached.count))
+        expect(errors, cached.device is device, 'cached bleak device {}'.format(cached.device))
+        expect(errors, cached.rssi > -80 and cached.rssi_raw == -50,
+               'cached RSSI {} (last {})'.format(cached.rssi, cached.rssi_raw))
+    cache.save()
+    cache = ScanCache(path=path)
+    cache.load()
+    expect(errors, cache.get(ADDRESS, max_age=5) is not None, 'saved cache entry not fresh')
+
+
+if __name__ == '__main__':
+    main(check, 'bleico scan cache check')
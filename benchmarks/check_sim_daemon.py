@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Daemon and local API check without Bluetooth hardware: runs
+# ``bleico daemon`` against the simulated esp32 peripheral
+# (bleico/sim_backend.py), then reads, writes and streams values through
+# BleicoClient. With -faults the link drops now and then and the daemon
+# must reconnect. Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_sim_daemon.py [-faults] [-n NOTIFICATIONS]
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect, subprocess_env, BLEICO  # noqa: E402
+from bleico.api_client import BleicoClient  # noqa: E402
+from bleico.api_server import ApiError  # noqa: E402
+
+
+def wait_connected(client, timeout=20):
+    # connected and profile built (the profile follows the connection)
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        try:
+            if client.status()['connected'] and client.profile():
+                return time.time() - t0
+        except Exception as e:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('daemon not connected in {} s'.format(timeout))
+
+
+def retry(client, call, *args, attempts=3):
+    # with faults the link may drop between the status and the request
+    for attempt in range(attempts):
+        wait_connected(client)
+        try:
+            return call(*args)
+        except ApiError as e:
+            if attempt == attempts - 1:
+                raise
+
+
+def check(errors, tmp, n=10, faults=False):
+    config = {'peripherals': [{'profile': 'esp32', 'seed': 1,
+                               'notify_interval': 0.2, 'jitter': 0.002}]}
+    if faults:
+        config['peripherals'][0]['faults'] = {'disconnect': 0.02, 'malformed': 0.05}
+    config_path = os.path.join(tmp, 'sim.json')
+    with open(config_path, 'w') as config_file:
+        json.dump(config, config_file)
+    sock = os.path.join(tmp, 'api.sock')
+    output = os.path.join(tmp, 'values.jsonl')
+    log_file = open(os.path.join(tmp, 'daemon.log'), 'w+')
+    proc = subprocess.Popen([sys.executable, BLEICO, 'daemon', '-sim', config_path,
+                             '-t', 'esp32-batt-temp', '-api', sock, '-o', output],
+                            stderr=log_file, env=subprocess_env(tmp))
+    client = BleicoClient(sock, timeout=5)
+    try:
+        print('connected in {:.2f} s'.format(wait_connected(client)))
+        names = [char['name'] for char in client.profile()['chars']]
+        for name in ('Battery Level', 'Temperature', 'Battery Power State'):
+            expect(errors, name in names, 'profile: {} missing'.format(name))
+        # unknown characteristic: 404 before the stream starts
+        try:
+            next(client.notifications(chars=['No Such Characteristic'], timeout=5))
+            errors.append('notify: unknown characteristic streamed')
+        except ApiError as e:
+            expect(errors, e.status == 404, 'notify: unknown characteristic {!r}'.format(e))
+        t0 = time.time()
+        record = retry(client, client.read, 'Temperature', True)
+        print('fresh read: {} in {:.1f} ms'.format(record['value'],
+                                                   (time.time() - t0) * 1000))
+        written = retry(client, client.write, 'Temperature Range', '0x9411581b')
+        expect(errors, written.get('written') == '9411581b',
+               'write: unexpected data {}'.format(written.get('written')))
+        # the values of the fields (two referenced Temperature fields)
+        written = retry(client, client.write, 'Temperature Range', '20,30')
+        expect(errors, written.get('written') == 'd007b80b',
+               'write 20,30: unexpected data {}'.format(written.get('written')))
+        record = retry(client, client.read, 'Temperature Range', True)
+        print('written 20,30, read back 0x{}'.format(record['raw']))
+        expect(errors, record['raw'] == 'd007b80b',
+               'read back after write: {}'.format(record['raw']))
+        t0 = time.time()
+        received = 0
+        for record in client.notifications(notify_only=True, timeout=10):
+            if record.get('notify'):
+                received += 1
+            if received >= n:
+                break
+        print('{} notifications in {:.2f} s'.format(received, time.time() - t0))
+        if faults:
+            # the link must drop and the daemon reconnect
+            t0 = time.time()
+            events = []
+            while events.count('connected') < 2 and time.time() - t0 < 60:
+                time.sleep(0.5)
+                with open(output, 'r') as output_file:
+                    events = [json.loads(line).get('event') for line in output_file]
+            if events.count('connected') < 2:
+                errors.append('faults: no reconnection in {:.0f} s'.format(time.time() - t0))
+            else:
+                print('reconnected in {:.2f} s'.format(time.time() - t0))
+                retry(client, client.read, 'Battery Level', True)
+    except Exception as e:
+        errors.append(repr(e))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            errors.append('daemon did not stop')
+    expect(errors, not os.path.exists(sock), 'api socket left behind')
+    if errors:
+        log_file.seek(0)
+        print(log_file.read()[-2000:], file=sys.stderr)
+    log_file.close()
+
+
+if __name__ == '__main__':
+    main(check, 'bleico daemon/API check on a simulated device',
+         ('-n', {'help': 'notifications to receive, default: 10', 'type': int}),
+         ('-faults', {'help': 'inject disconnections and malformed payloads',
+                      'action': 'store_true'}))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Output sinks check (bleico/value_sinks.py), no Bluetooth and no MQTT
+# broker needed: sends N records through the JSON lines, CSV, UDP and
+# MQTT sinks (to a local broker stand-in that speaks enough MQTT 3.1.1)
+# and checks what each output received; then adds a sink that takes
+# 50 ms per batch and checks that it drops records while put() stays
+# fast and the other sinks get everything, and that the MQTT sink
+# connects again when the broker closes the connection.
+# Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_value_sinks.py [-n RECORDS]
+
+import csv
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect, costs_text  # noqa: E402
+from bleico.value_sinks import (ValueSinks, ValueSink, MqttSink, sink_from_spec,  # noqa: E402
+                                CSV_COLUMNS)
+
+ADDRESS = '5E:00:00:00:00:01'
+
+
+class Broker(socketserver.ThreadingTCPServer):
+    """MQTT broker stand-in: CONNACK, PINGRESP and the PUBLISH messages it got"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, close_after=0):
+        self.messages = []
+        self.connections = 0
+        self.pings = 0
+        self.close_after = close_after  # close the first connection after N messages
+        super().__init__(('127.0.0.1', 0), BrokerHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+
+    def read_packet(self):
+        header = self.rfile.read(1)
+        if not header:
+            return None, None
+        length = 0
+        for shift in range(0, 28, 7):
+            byte = self.rfile.read(1)[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+        return header[0], self.rfile.read(length)
+
+    def handle(self):
+        broker = self.server
+        broker.connections += 1
+        connection = broker.connections
+        while True:
+            kind, body = self.read_packet()
+            if kind is None or kind == 0xE0:
+                return
+            if kind == 0x10:
+                ok = body[:7] == b'\x00\x04MQTT\x04'
+                self.wfile.write(bytes([0x20, 2, 0, 0 if ok else 1]))
+            elif kind == 0xC0:
+                broker.pings += 1
+                self.wfile.write(b'\xd0\x00')
+            elif kind & 0xF0 == 0x30:
+                topic_length = int.from_bytes(body[:2], 'big')
+                broker.messages.append((body[2:2 + topic_length].decode(),
+                                        json.loads(body[2 + topic_length:])))
+                if connection == 1 and len(broker.messages) == broker.close_after:
+                    return
+
+
+class SlowSink(ValueSink):
+    """A sink taking 50 ms per batch"""
+    name = 'slow'
+
+    def write(self, records):
+        time.sleep(0.05)
+
+
+def records(n):
+    for i in range(n):
+        yield {'t': 1600000000 + i, 'address': ADDRESS, 'service': 'Environmental Sensing',
+               'char': 'Temperature', 'handle': 41, 'notify': bool(i % 2),
+               'value': {'Temperature': {'Value': i / 100, 'Unit': 'degree celsius',
+                                         'Symbol': '°C'}},
+               'raw': (i & 0xFFFF).to_bytes(2, 'little').hex()}
+
+
+def udp_receiver(sock, received):
+    while True:
+        try:
+            datagram = sock.recv(65536)
+        except OSError:
+            return
+        received.extend(json.loads(line) for line in datagram.splitlines())
+
+
+def check(errors, tmp, n=20000):
+    sent = list(records(n))
+    broker = Broker().start()
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    udp.bind(('127.0.0.1', 0))
+    udp_records = []
+    threading.Thread(target=udp_receiver, args=(udp, udp_records), daemon=True).start()
+    jsonl_path = os.path.join(tmp, 'values.jsonl')
+    csv_path = os.path.join(tmp, 'values.csv')
+    specs = [jsonl_path, csv_path, 'udp://127.0.0.1:{}'.format(udp.getsockname()[1]),
+             'mqtt://127.0.0.1:{}/lab'.format(broker.server_address[1])]
+    # all the records, paced a little so that nothing is dropped
+    sinks = ValueSinks()
+    for spec in specs:
+        sinks.add(sink_from_spec(spec, max_pending=n, flush_interval=0.05))
+    for i, record in enumerate(sent):
+        sinks.record(record)
+        if i % 1000 == 999:
+            time.sleep(0.01)
+    outputs = list(sinks.sinks)
+    sinks.stop()
+    time.sleep(0.2)
+    for sink in outputs:
+        print('{}: {} sent, {} dropped, {} errors'.format(sink, sink.sent, sink.dropped,
+                                                         sink.errors))
+        expect(errors, sink.sent == n and not sink.errors,
+               '{}: {} sent, {} errors ({})'.format(sink, sink.sent, sink.errors, sink.error))
+    with open(jsonl_path) as jsonl_file:
+        expect(errors, [json.loads(line) for line in jsonl_file] == sent,
+               'JSON lines file differs')
+    with open(csv_path, newline='') as csv_file:
+        rows = list(csv.reader(csv_file))
+    expected = [list(CSV_COLUMNS)] + [[str(record['t']), ADDRESS, 'Temperature', 'Temperature',
+                                       str(record['value']['Temperature']['Value']), '°C']
+                                      for record in sent]
+    expect(errors, rows == expected, 'CSV file differs: {} rows'.format(len(rows)))
+    expect(errors, sorted(udp_records, key=lambda record: record['t']) == sent,
+           'UDP: {} records received'.format(len(udp_records)))
+    topic = 'lab/{}/Temperature'.format(ADDRESS)
+    expect(errors, [message for topic_name, message in broker.messages] == sent and
+           all(topic_name == topic for topic_name, message in broker.messages),
+           'MQTT: {} messages received'.format(len(broker.messages)))
+    broker.shutdown()
+    # a slow sink drops, without slowing down put() nor the other sinks
+    jsonl_path = os.path.join(tmp, 'fast.jsonl')
+    sinks = ValueSinks()
+    slow = SlowSink(max_pending=1024)
+    sinks.add(slow)
+    sinks.add(sink_from_spec(jsonl_path, max_pending=n, flush_interval=0.05))
+    costs = []
+    for record in sent:
+        t0 = time.perf_counter_ns()
+        sinks.record(record)
+        costs.append(time.perf_counter_ns() - t0)
+    sinks.stop()
+    print('slow sink: {} sent, {} dropped; record(): {}, max {:.2f} ms'.format(
+        slow.sent, slow.dropped, costs_text(costs), max(costs) / 1e6))
+    expect(errors, slow.dropped and slow.sent + slow.dropped == n,
+           'slow sink: {} sent, {} dropped'.format(slow.sent, slow.dropped))
+    with open(jsonl_path) as jsonl_file:
+        expect(errors, sum(1 for line in jsonl_file) == n,
+               'JSON lines file behind a slow sink incomplete')
+    # broker closing the connection: the MQTT sink connects again
+    broker = Broker(close_after=10).start()
+    sink = MqttSink('127.0.0.1', broker.server_address[1], flush_interval=0.05,
+                    retry_interval=0.1, keepalive=1)
+    sink.start()
+    for record in sent[:10]:
+        sink.put(record)
+    time.sleep(0.6)
+    for record in sent[10:20]:
+        sink.put(record)
+    time.sleep(0.6)
+    sink.stop()
+    print('mqtt reconnect: {} connections, {} messages, {} pings'.format(
+        broker.connections, len(broker.messages), broker.pings))
+    expect(errors, broker.connections == 2 and len(broker.messages) == 20 and broker.pings,
+           'MQTT reconnect: {} connections, {} messages, {} pings'.format(
+               broker.connections, len(broker.messages), broker.pings))
+    broker.shutdown()
+
+
+if __name__ == '__main__':
+    main(check, 'bleico output sinks check',
+         ('-n', {'help': 'records, default: 20000', 'type': int}))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Value store check (bleico/value_store.py), no Bluetooth needed: stores
+# DAYS days of a synthetic temperature and temperature range (one value
+# every 10 s) through ValueStore, then checks the minute and hour
+# rollups against the values, the retention of the samples and the tier
+# picked for each query span, and prints the record() cost and the
+# writer and query times. Fails (exit 1) on any error.
+# Usage: $ python benchmarks/check_value_store.py [-days DAYS]
+
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from checks import main, expect, costs_text  # noqa: E402
+from bleico.value_store import ValueStore  # noqa: E402
+
+ADDRESS = '5E:00:00:00:00:01'
+STEP = 10
+
+
+def temperature(t):
+    return round(55 + 8 * math.sin(2 * math.pi * t / 3600), 2)
+
+
+def decoded(value):
+    return {'Temperature': {'Unit': 'degree celsius', 'Symbol': '°C', 'Value': value}}
+
+
+def check(errors, tmp, days=3):
+    now = time.time()
+    t_first = (now - days * 86400) // 3600 * 3600
+    times = [t_first + i * STEP for i in range(int((now - t_first) // STEP))]
+    store = ValueStore(retention={'raw': 86400}, max_pending=len(times) * 2 + 1)
+    store.start(os.path.join(tmp, 'values.db'))
+    costs = []
+    t0 = time.perf_counter()
+    for t in times:
+        t_record = time.perf_counter_ns()
+        store.record(ADDRESS, 'Temperature', decoded(temperature(t)), t=t)
+        costs.append(time.perf_counter_ns() - t_record)
+        store.record(ADDRESS, 'Temperature Range',
+                     {'Minimum Temperature': {'Temperature': decoded(50.0)},
+                      'Maximum Temperature': {'Temperature': decoded(65.0)}}, t=t)
+    store.stop()
+    elapsed = time.perf_counter() - t0
+    print('record(): {}; {} values ({} samples) stored in {:.2f} s, {} dropped'.format(
+        costs_text(costs), store.values, store.samples, elapsed, store.dropped))
+    expect(errors, store.values == 2 * len(times) and store.samples == 3 * len(times) and
+           not store.error, 'stored {} values, {} samples, error {}'.format(
+               store.values, store.samples, store.error))
+    # tiers
+    for span, tier in ((600, 'raw'), (86400, 'minute'), (30 * 86400, 'hour')):
+        expect(errors, store.tier(now - span, now) == tier,
+               'tier of {} s: {}'.format(span, store.tier(now - span, now)))
+    # rollups against the values
+    for tier, width in (('minute', 60), ('hour', 3600)):
+        t_query = time.perf_counter()
+        result = store.query('Temperature', since=t_first, until=now, tier=tier)
+        t_query = time.perf_counter() - t_query
+        points = result[0]['points'] if result else []
+        expected = {}
+        for t in times:
+            expected.setdefault(int(t // width * width), []).append(temperature(t))
+        print('{} tier: {} points in {:.1f} ms'.format(tier, len(points), t_query * 1000))
+        expect(errors, len(points) == len(expected),
+               '{}: {} points, {} expected'.format(tier, len(points), len(expected)))
+        for t, n, low, mean, high in points:
+            values = expected.get(t, [])
+            if n != len(values) or low != min(values) or high != max(values) or \
+                    abs(mean - sum(values) / len(values)) > 1e-6:
+                errors.append('{} bucket {}: {} {} {} {}'.format(tier, t, n, low, mean, high))
+                break
+    # last 24 h: from the minute rollups
+    t_query = time.perf_counter()
+    result = store.query('Temperature', since=now - 86400)
+    print('last 24 h: {} tier, {} points in {:.1f} ms'.format(
+        result[0]['tier'], len(result[0]['points']), (time.perf_counter() - t_query) * 1000))
+    expect(errors, result[0]['tier'] == 'minute', 'last 24 h from {}'.format(result[0]['tier']))
+    # samples older than the raw retention are gone
+    raw = store.query('Temperature', since=t_first, until=now, tier='raw')[0]['points']
+    expect(errors, raw and raw[0][0] >= now - 86400 - STEP,
+           'raw retention: first sample {:.0f} s old'.format(now - raw[0][0] if raw else 0))
+    fields = [series['field'] for series in store.query('Temperature Range', tier='hour')]
+    expect(errors, fields == ['Minimum Temperature', 'Maximum Temperature'],
+           'reference fields: {}'.format(fields))
+
+
+if __name__ == '__main__':
+    main(check, 'bleico value store check',
+         ('-days', {'help': 'days of values, default: 3', 'type': int}))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Shared helpers of the check_*.py scripts. A check is a function
+# ``check(errors, tmp, **params)`` that appends a message to ``errors``
+# for each failed expectation, ``tmp`` is a new temporary directory.
+# Each script runs its check with main(), and all of them run with:
+#   $ python benchmarks/run_benchmarks.py -check [-quick] [checks ...]
+
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLEICO = os.path.join(ROOT, 'bleico_cli', 'bin', 'bleico')
+
+# name --> (module, params, quick params)
+CHECKS = {'import_time': ('check_import_time', {}, {}),
+          'capture': ('check_capture', {}, {'n': 2000}),
+          'value_store': ('check_value_store', {}, {'days': 1}),
+          'att_export': ('check_att_export', {}, {'n': 2000}),
+          'value_sinks': ('check_value_sinks', {}, {'n': 2000}),
+          'adv_replay': ('check_adv_replay', {}, {}),
+          'scan_cache': ('check_scan_cache', {}, {}),
+          'sim_daemon': ('check_sim_daemon', {}, {}),
+          'sim_daemon_faults': ('check_sim_daemon', {'faults': True}, {'faults': True})}
+
+
+def expect(errors, ok, message):
+    """Append ``message`` to ``errors`` unless ``ok``, returns ``ok``"""
+    if not ok:
+        errors.append(message)
+    return ok
+
+
+def costs_text(costs):
+    """`list` of call costs in ns --> mean and p99 text, in us"""
+    costs = sorted(costs)
+    return 'mean {:.2f} us, p99 {:.2f} us'.format(sum(costs) / len(costs) / 1000,
+                                                 costs[int(len(costs) * 0.99)] / 1000)
+
+
+def subprocess_env(home):
+    """Environment of a bleico subprocess: ``home`` as HOME, the repo importable"""
+    return dict(os.environ, HOME=home,
+                PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+
+
+def run_check(check, **params):
+    """Run ``check`` in a new temporary directory, prints and returns the errors"""
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            check(errors, tmp, **params)
+        except Exception as e:
+            traceback.print_exc()
+            errors.append(repr(e))
+    print('FAIL: ' + '; '.join(errors[:10]) if errors else 'ok')
+    return errors
+
+
+def run_checks(names, quick=False):
+    """Run the CHECKS ``names``, returns the names of the failed ones"""
+    failed = []
+    for name in names:
+        module_name, params, quick_params = CHECKS[name]
+        print('== {}'.format(name))
+        t0 = time.time()
+        check = importlib.import_module(module_name).check
+        if run_check(check, **(quick_params if quick else params)):
+            failed.append(name)
+        print('{}: {:.1f} s'.format(name, time.time() - t0))
+    return failed
+
+
+def main(check, description, *options):
+    """
+    Command line of a check script, ``options``: (flag, argparse kwargs)
+    where the flag is the parameter name of ``check`` (its default is
+    used if the flag is not given). Exits with 1 on any error.
+    """
+    parser = argparse.ArgumentParser(description=description,
+                                     argument_default=argparse.SUPPRESS)
+    for flag, kwargs in options:
+        parser.add_argument(flag, **kwargs)
+    sys.exit(1 if run_check(check, **vars(parser.parse_args())) else 0)
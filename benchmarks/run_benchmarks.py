@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# End-to-end benchmark suite, offline: the device is the simulated
+# backend (bleico/sim_backend.py) and Qt runs on the offscreen platform.
+# Results are printed as JSON (or saved with -o) so runs can be diffed,
+# -c prints the change of each metric from a previous run instead.
+# -check runs the correctness checks (benchmarks/check_*.py) instead,
+# and fails (exit 1) if any of them fails.
+# Usage: $ python benchmarks/run_benchmarks.py [-o results.json] [-c base.json]
+#                                              [-quick] [cases ...]
+#        $ python benchmarks/run_benchmarks.py -check [-quick] [checks ...]
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLEICO = os.path.join(ROOT, 'bleico_cli', 'bin', 'bleico')
+SRC_PATH = os.path.join(ROOT, 'bleico', 'icons')
+SRC_PATH_SOUND = os.path.join(ROOT, 'bleico', 'sounds')
+sys.path.insert(0, ROOT)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import bleico  # noqa: E402
+import checks  # noqa: E402
+from bleico.ble_device import BLE_DEVICE, set_backend  # noqa: E402
+from bleico.sim_backend import (SimBackend, SimCharacteristic, SimPeripheral,  # noqa: E402
+                                SimService, esp32_batt_cputemp, ESP32_ADDRESS)
+
+# readable SIG characteristics for generated GATT tables: (uuid, payload)
+POLL_CHARS = [(0x2A19, b'\x60'), (0x2A6E, b'\x10\x09'), (0x2A6F, b'\x10\x27'),
+              (0x2A6D, b'\x40\x42\x0f\x00'), (0x2A1A, b'\xbb')]
+
+_app = None
+
+
+def summary(samples, scale=1000):
+    """`list` of seconds --> mean, p50, p95 and max, in ms by default"""
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {'n': len(samples),
+            'mean': round(scale * statistics.mean(samples), 4),
+            'p50': round(scale * samples[len(samples) // 2], 4),
+            'p95': round(scale * samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+            'max': round(scale * samples[-1], 4)}
+
+
+def bench_log():
+    log = logging.getLogger('bleico.bench')
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    if not log.handlers:
+        log.addHandler(logging.NullHandler())
+    return log
+
+
+def qt_app():
+    global _app
+    if _app is None:
+        from PyQt5.QtWidgets import QApplication
+        _app = QApplication([])
+        _app.setQuitOnLastWindowClosed(False)
+    return _app
+
+
+def sim_peripheral(n_chars, latency=0.0, address=ESP32_ADDRESS, name='sim-poll'):
+    chars = [SimCharacteristic(uuid, ['read'], payload) for uuid, payload
+             in (POLL_CHARS[i % len(POLL_CHARS)] for i in range(n_chars))]
+    return SimPeripheral(address, name, [SimService(0x181A, chars)],
+                         latency={'connect': 0, 'read': latency, 'write': latency,
+                                  'rssi': 0},
+                         jitter=0, seed=1)
+
+
+# CASES
+
+def bench_poll(args):
+    """Poll cycle latency (reads, decode, format) for N characteristics"""
+    from bleico.char_state import build_char_states
+    from bleico.char_formatter import CharFormatter
+    from bleico.device_poller import DevicePoller
+    from bleico.value_pipeline import ValuePipeline
+    log = bench_log()
+    results = {}
+    for n_chars in args.chars:
+        set_backend(SimBackend([sim_peripheral(n_chars, latency=args.latency)]))
+        dev = BLE_DEVICE(ESP32_ADDRESS, init=True, log=log)
+        char_states = build_char_states(dev)
+        for char_state in char_states.values():
+            if char_state.xml_char is not None:
+                char_state.formatter = CharFormatter(char_state.char, char_state.xml_char,
+                                                     service=char_state.service)
+        pipeline = ValuePipeline(char_states, dev=dev, log=log)
+        poll_states = [char_state for char_state in char_states.values() if char_state.readable]
+        cycles = []
+        t_last = [time.perf_counter()]
+
+        def on_value(char_state, raw):
+            pipeline.submit(pipeline.process(char_state, raw))
+            pipeline.drain()
+
+        def emit(message):
+            if isinstance(message, dict) and 'DEVICE_RSSI' in message:
+                now = time.perf_counter()
+                cycles.append(now - t_last[0])
+                t_last[0] = now
+                if len(cycles) >= args.cycles:
+                    poller.stop()
+
+        poller = DevicePoller(dev, poll_states, on_value, read_timeout=1,
+                              sleep=lambda seconds: None, log=log)
+        poller.run(emit)
+        dev.disconnect(log=False)
+        stats = summary(cycles[1:])
+        stats['us_per_char'] = round(1000 * stats['mean'] / len(poll_states), 2)
+        results[str(n_chars)] = stats
+    set_backend(None)
+    return {'read_latency_s': args.latency, 'cycle_ms': results}
+
+
+def bench_notify(args):
+    """Notification throughput until the BLE thread falls behind"""
+    from bleico.char_state import build_char_states
+    from bleico.char_formatter import CharFormatter
+    from bleico.value_pipeline import ValuePipeline
+    log = bench_log()
+    peripheral = esp32_batt_cputemp(latency={'connect': 0, 'read': 0, 'write': 0},
+                                    jitter=0, seed=1)
+    set_backend(SimBackend([peripheral]))
+    dev = BLE_DEVICE(ESP32_ADDRESS, init=True, log=log)
+    char_states = build_char_states(dev)
+    temp_state = [char_state for char_state in char_states.values()
+                  if char_state.char == 'Temperature'][0]
+    temp_state.desktop_notify = False
+    temp_state.formatter = CharFormatter(temp_state.char, temp_state.xml_char,
+                                         service=temp_state.service)
+    temp_char = peripheral.services.get_characteristic(temp_state.handle)
+    steps = []
+    max_sustained = 0
+    for rate in args.rates:
+        pipeline = ValuePipeline(char_states, dev=dev, log=log)
+        temp_char.notify_interval = 1.0 / rate
+        received = [0]
+        applied = [0]
+        done = threading.Event()
+
+        def callback(sender_handle, data):
+            received[0] += 1
+            pipeline.submit(pipeline.process(char_states[sender_handle], bytes(data),
+                                             notification=True))
+
+        def gui():
+            # 60 Hz GUI thread draining the pipeline
+            while not done.is_set():
+                applied[0] += len(pipeline.drain())
+                time.sleep(1 / 60)
+            applied[0] += len(pipeline.drain())
+
+        gui_thread = threading.Thread(target=gui)
+        gui_thread.start()
+        sent_before = peripheral.stats['notifications']
+        t0 = time.perf_counter()
+        dev.loop.run_until_complete(dev.ble_client.start_notify(temp_state.handle, callback))
+        dev.loop.run_until_complete(asyncio.sleep(args.duration))
+        dev.loop.run_until_complete(dev.ble_client.stop_notify(temp_state.handle))
+        elapsed = time.perf_counter() - t0
+        done.set()
+        gui_thread.join()
+        achieved = received[0] / elapsed
+        steps.append({'target_rate': rate,
+                      'sent': peripheral.stats['notifications'] - sent_before,
+                      'received_rate': round(achieved, 1),
+                      'applied': applied[0],
+                      'coalesced': pipeline.coalesced})
+        if achieved < 0.9 * rate:
+            break
+        max_sustained = rate
+    dev.disconnect(log=False)
+    set_backend(None)
+    return {'max_sustained_rate': max_sustained, 'steps': steps}
+
+
+def bench_decode(args):
+    """get_char_value throughput across every SIG characteristic"""
+    from bleak.uuids import uuid16_dict
+    from bleak_sigspec.utils import get_char_value, get_xml_char
+    per_char = {}
+    undecodable = []
+    for uuid, name in sorted(uuid16_dict.items()):
+        if not 0x2A00 <= uuid <= 0x2BFF:
+            continue
+        try:
+            xml_char = get_xml_char(name)
+        except Exception as e:
+            continue
+        # shortest all zero payload that decodes
+        raw = None
+        for length in range(1, 25):
+            try:
+                get_char_value(bytes(length), xml_char)
+                raw = bytes(length)
+                break
+            except Exception as e:
+                pass
+        if raw is None:
+            undecodable.append(name)
+            continue
+        t0 = time.perf_counter()
+        for _ in range(args.decodes):
+            get_char_value(raw, xml_char)
+        per_char[name] = (time.perf_counter() - t0) / args.decodes
+    times = list(per_char.values())
+    slowest = sorted(per_char.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {'chars': len(per_char), 'undecodable': len(undecodable),
+            'decodes_per_s': round(len(times) / sum(times), 1) if times else 0,
+            'decode_us': summary(times, scale=1e6),
+            'slowest_us': {name: round(1e6 * t, 2) for name, t in slowest}}
+
+
+def bench_gui(args):
+    """refresh_menu and receive_notification GUI thread cost, real tray menu"""
+    from PyQt5.QtGui import QIcon
+    from bleico.systrayicon import SystemTrayIcon
+    log = bench_log()
+    qt_app()
+    set_backend(SimBackend([esp32_batt_cputemp(latency={'connect': 0, 'read': 0},
+                                               jitter=0, seed=1)]))
+    t0 = time.perf_counter()
+    tray = SystemTrayIcon(QIcon(os.path.join(SRC_PATH, 'UNKNOWN.png')),
+                          device_uuid=ESP32_ADDRESS, logger=log,
+                          SRC_PATH=SRC_PATH, SRC_PATH_SOUND=SRC_PATH_SOUND)
+    t_tray = time.perf_counter() - t0
+    dev = tray.esp32_device
+    raws = [(char_state, dev.read_char(char_state.char, data_fmt='raw',
+                                       handle=char_state.handle))
+            for char_state in tray.poll_char_states]
+    notify_state = [char_state for char_state in tray.char_states.values()
+                    if char_state.char == 'Temperature'][0]
+    notify_raw = dev.read_char(notify_state.char, data_fmt='raw', handle=notify_state.handle)
+    refresh = []
+    notification = []
+    for i in range(args.updates):
+        for char_state, raw in raws:
+            tray.value_pipeline.submit(tray.value_pipeline.process(char_state, raw))
+        t0 = time.perf_counter()
+        tray.refresh_menu({'DEVICE_RSSI': -60 - i % 5})
+        refresh.append(time.perf_counter() - t0)
+        tray.value_pipeline.submit(tray.value_pipeline.process(notify_state, notify_raw,
+                                                               notification=True))
+        t0 = time.perf_counter()
+        tray.receive_notification('values')
+        notification.append(time.perf_counter() - t0)
+    dev.disconnect(log=False)
+    tray.hide()
+    set_backend(None)
+    return {'tray_init_s': round(t_tray, 4), 'poll_chars': len(raws),
+            'refresh_menu_ms': summary(refresh),
+            'receive_notification_ms': summary(notification)}
+
+
+def bench_scanner(args):
+    """Scanner dialog population time for M advertising devices"""
+    from PyQt5.QtCore import QCoreApplication
+    from bleico.ble_scanner_widget import BleScanner
+    from bleico.scan_cache import ScanCache
+    from bleico.scan_service import ScanService
+    log = bench_log()
+    qt_app()
+    addresses = ['5E:00:00:00:01:{:02X}'.format(i) for i in range(args.devices)]
+    set_backend(SimBackend([esp32_batt_cputemp(address=address, name='sim-{}'.format(i),
+                                               seed=i)
+                            for i, address in enumerate(addresses)]))
+    scan_service = ScanService(cache=ScanCache(log=log), log=log)
+    t0 = time.perf_counter()
+    scanner = BleScanner(log=log, SRC_PATH=SRC_PATH, scan_service=scan_service)
+    t_first = None
+    while scanner.model.rowCount() < args.devices and time.perf_counter() - t0 < 30:
+        QCoreApplication.processEvents()
+        if t_first is None and scanner.model.rowCount():
+            t_first = time.perf_counter() - t0
+        time.sleep(0.001)
+    t_all = time.perf_counter() - t0
+    rows = scanner.model.rowCount()
+    scanner.stop_scan()
+    scanner.hide()
+    set_backend(None)
+    return {'devices': args.devices, 'rows': rows,
+            'first_row_s': round(t_first, 4) if t_first is not None else None,
+            'all_rows_s': round(t_all, 4)}
+
+
+def bench_startup(args):
+    """Cold startup: tray import, one-shot read and tray up to its first value"""
+    results = {}
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, QT_QPA_PLATFORM='offscreen',
+                   PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        commands = {'import_tray': [sys.executable, '-c', 'import bleico.systrayicon'],
+                    'read': [sys.executable, BLEICO, 'read', '-sim', 'esp32',
+                             '-t', 'esp32-batt-temp', '-c', 'Battery Level']}
+        for name, argv in commands.items():
+            times = []
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               env=env, check=True)
+                times.append(time.perf_counter() - t0)
+            results[name + '_s'] = round(min(times), 4)
+        times = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, BLEICO, 'run', '-sim', 'esp32',
+                                     '-t', 'esp32-batt-temp'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, universal_newlines=True,
+                                    env=env)
+            try:
+                for line in proc.stdout:
+                    if 'Battery Level:' in line:
+                        times.append(time.perf_counter() - t0)
+                        break
+            finally:
+                proc.kill()
+                proc.communicate()
+        results['tray_first_value_s'] = round(min(times), 4) if times else None
+    return results
+
+
+def bench_replay(args):
+    """Capture replay at maximum speed through decode and the value pipeline"""
+    from bleico.char_state import build_char_states
+    from bleico.char_formatter import CharFormatter
+    from bleico.value_pipeline import ValuePipeline
+    from bleico.gatt_capture import GattCapture, NOTIFY
+    from bleico.replay import CaptureReplay
+    from bleico.sim_backend import sig_uuid
+    log = bench_log()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'replay.bcap')
+        capture = GattCapture(max_pending=args.replay_values + 1)
+        capture.start(path)
+        services = esp32_batt_cputemp().services
+        capture.set_profile(ESP32_ADDRESS, services)
+        temp_handle = services.get_characteristic(sig_uuid(0x2A6E)).handle
+        for i in range(args.replay_values):
+            capture.record(NOTIFY, ESP32_ADDRESS, temp_handle,
+                           (5000 + i % 1000).to_bytes(2, 'little'))
+        capture.stop()
+        replay = CaptureReplay(path, speed=0, log=log)
+        set_backend(SimBackend([replay.peripheral]))
+        dev = BLE_DEVICE(ESP32_ADDRESS, init=True, log=log)
+        char_states = build_char_states(dev)
+        temp_state = char_states[temp_handle]
+        temp_state.formatter = CharFormatter(temp_state.char, temp_state.xml_char,
+                                             service=temp_state.service)
+        pipeline = ValuePipeline(char_states, dev=dev, log=log)
+        received = [0]
+
+        def callback(sender_handle, data):
+            received[0] += 1
+            pipeline.submit(pipeline.process(char_states[sender_handle], bytes(data),
+                                             notification=True))
+            pipeline.drain()
+
+        dev.loop.run_until_complete(dev.ble_client.start_notify(temp_handle, callback))
+        replay.start()
+        while not replay.finished:
+            dev.loop.run_until_complete(asyncio.sleep(0.01))
+        # notifications still queued on the event loop
+        dev.loop.run_until_complete(asyncio.sleep(0.1))
+        elapsed = replay.stats['elapsed']
+        dev.disconnect(log=False)
+    set_backend(None)
+    return {'values': args.replay_values, 'received': received[0],
+            'values_per_s': round(received[0] / elapsed, 1) if elapsed else None}
+
+
+def bench_gui_thread(args):
+    """Main thread cost of the real tray updates, decoded in a BLE thread"""
+    import bench_gui_thread
+    results = bench_gui_thread.bench(rate=200, duration=args.duration * 2)
+    results['within_budget'] = results['us_per_applied_update'] <= bench_gui_thread.BUDGET_US
+    return results
+
+
+CASES = {'poll': bench_poll, 'notify': bench_notify, 'decode': bench_decode,
+         'gui': bench_gui, 'gui_thread': bench_gui_thread, 'scanner': bench_scanner,
+         'startup': bench_startup, 'replay': bench_replay}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'bleico': bleico.version, 'commit': commit, 'time': time.time(),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'argv': sys.argv[1:]}
+
+
+def flatten(results, prefix=''):
+    """Nested results --> `dict` dotted key --> number"""
+    flat = {}
+    for key, val in results.items():
+        if isinstance(val, dict):
+            flat.update(flatten(val, prefix + key + '.'))
+        elif isinstance(val, (int, float)) and not isinstance(val, bool):
+            flat[prefix + key] = val
+    return flat
+
+
+def compare(base, results):
+    old = flatten(base['results'])
+    for key, val in flatten(results['results']).items():
+        if key in old:
+            change = (val - old[key]) / old[key] * 100 if old[key] else 0
+            print('{:<50} {:>12} {:>12} {:>+8.1f} %'.format(key, old[key], val, change))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='bleico end-to-end benchmarks')
+    parser.add_argument('cases', nargs='*',
+                        help='cases to run: {}, default: all; with -check, checks to run: '
+                        '{}'.format(', '.join(CASES), ', '.join(checks.CHECKS)))
+    parser.add_argument('-o', help='save results to this JSON file, default: stdout')
+    parser.add_argument('-c', help='compare with the results of a previous run (JSON file)')
+    parser.add_argument('-quick', help='fewer iterations, for CI', action='store_true')
+    parser.add_argument('-check', help='run the checks instead of the benchmarks',
+                        action='store_true')
+    parser.add_argument('-latency', help='simulated read latency in seconds (poll), default: 0',
+                        type=float, default=0.0)
+    args = parser.parse_args()
+    quick = args.quick
+    if args.check:
+        failed = checks.run_checks(args.cases or list(checks.CHECKS), quick=quick)
+        print('FAIL: ' + ', '.join(failed) if failed else 'all checks ok')
+        sys.exit(1 if failed else 0)
+    args.cases = args.cases or list(CASES)
+    args.chars = [1, 8, 32]
+    args.cycles = 20 if quick else 100
+    args.rates = [100 * 2 ** i for i in range(12)]
+    args.duration = 0.5 if quick else 2.0
+    args.decodes = 20 if quick else 200
+    args.updates = 50 if quick else 500
+    args.devices = 20 if quick else 100
+    args.runs = 1 if quick else 3
+    args.replay_values = 5000 if quick else 50000
+    output = {'meta': metadata(), 'results': {}}
+    # bleak_sigspec and the tray print to stdout, keep it for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in args.cases:
+            t0 = time.time()
+            output['results'][name] = CASES[name](args)
+            print('{}: {:.1f} s'.format(name, time.time() - t0), file=sys.stderr)
+    if args.o:
+        with open(args.o, 'w') as results_file:
+            json.dump(output, results_file, indent=1)
+    if args.c:
+        with open(args.c, 'r') as base_file:
+            compare(json.load(base_file), output)
+    elif not args.o:
+        print(json.dumps(output, indent=1))
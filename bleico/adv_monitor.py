@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import struct
+import threading
+import time
+import traceback
+import uuid as U_uuid
+from bleak.uuids import uuidstr_to_str
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from bleak_sigspec.utils import get_char_value, get_xml_char
+from bleico.char_formatter import CharFormatter
+from bleico.scan_service import LOST
+
+APPLE_COMPANY_ID = 0x004C
+
+
+class AdvDecoder:
+    """
+    Decode advertisement service data and manufacturer data.
+
+    Service data whose uuid is a SIG characteristic is decoded with
+    bleak_sigspec ``get_char_value`` (as ``BLE_DEVICE.get_char_value``)
+    and formatted with a :class:`bleico.char_formatter.CharFormatter`,
+    compiled once per uuid. Anything else is shown as hex.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self._formatters = {}  # service data uuid --> (char, xml_char, CharFormatter) or None
+
+    def _compile(self, uuid):
+        char = uuidstr_to_str(uuid.lower())
+        try:
+            xml_char = get_xml_char(char)
+        except Exception as e:
+            return None
+        return (char, xml_char, CharFormatter(char, xml_char))
+
+    def service_data(self, uuid, raw):
+        """Returns (label, text)"""
+        if uuid not in self._formatters:
+            self._formatters[uuid] = self._compile(uuid)
+        compiled = self._formatters[uuid]
+        if compiled is not None:
+            char, xml_char, formatter = compiled
+            try:
+                return char, formatter.format(get_char_value(raw, xml_char)).summary
+            except Exception as e:
+                if self.log:
+                    self.log.debug("Service data {}: {}".format(char, e))
+            return char, raw.hex()
+        return uuidstr_to_str(uuid.lower()), raw.hex()
+
+    def manufacturer_data(self, company_id, raw):
+        """Returns (label, text)"""
+        if company_id == APPLE_COMPANY_ID and len(raw) == 23 and raw[:2] == b'\x02\x15':
+            major, minor, tx_power = struct.unpack('>HHb', raw[18:23])
+            return 'iBeacon', "{} major: {} minor: {} tx: {} dBm".format(
+                U_uuid.UUID(bytes=raw[2:18]), major, minor, tx_power)
+        return "Manufacturer 0x{:04X}".format(company_id), raw.hex()
+
+    def decode(self, entry):
+        """ScanEntry --> `dict` label --> text"""
+        values = {}
+        for uuid, raw in entry.service_data.items():
+            label, text = self.service_data(uuid, bytes(raw))
+            values[label] = text
+        for company_id, raw in entry.manufacturer_data.items():
+            label, text = self.manufacturer_data(company_id, bytes(raw))
+            values[label] = text
+        return values
+
+
+class AdvReading:
+    """Decoded advertisement values of a device"""
+    __slots__ = ('address', 'name', 'rssi', 'values', 'timestamp')
+
+    def __init__(self, address, name, rssi, values, timestamp):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.values = values
+        self.timestamp = timestamp
+
+    def to_dict(self):
+        return {'t': self.timestamp, 'address': self.address, 'name': self.name,
+                'rssi': self.rssi, 'values': self.values}
+
+
+class AdvMonitor:
+    """
+    Connectionless monitoring: decodes the advertisements of every
+    device in a :class:`bleico.scan_service.ScanService` table.
+
+    Subscribers are called with ``(kind, reading)`` where ``kind`` is a
+    ScanEvent kind (new, update, lost), from the scan thread.
+    """
+
+    def __init__(self, scan_service, log=None):
+        self.scan_service = scan_service
+        self.log = log
+        self.decoder = AdvDecoder(log=log)
+        self.readings = {}
+        self._subscribers = []
+        self.running = False
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.scan_service.subscribe(self.scan_event)
+
+    def stop(self, wait=True):
+        if self.running:
+            self.running = False
+            self.scan_service.unsubscribe(self.scan_event, wait=wait)
+
+    def scan_event(self, event):
+        entry = event.entry
+        if event.kind == LOST:
+            reading = self.readings.pop(event.address, None)
+        else:
+            if not entry.service_data and not entry.manufacturer_data:
+                return
+            reading = AdvReading(entry.address, entry.name, entry.rssi,
+                                 self.decoder.decode(entry), entry.last_seen)
+            self.readings[entry.address] = reading
+        if reading is None:
+            return
+        for callback in list(self._subscribers):
+            try:
+                callback(event.kind, reading)
+            except Exception as e:
+                if self.log:
+                    self.log.error(traceback.format_exc())
+
+
+# RECORD / REPLAY
+
+def adv_to_record(device, advertisement_data, t=None):
+    return {'t': time.time() if t is None else t,
+            'address': device.address,
+            'name': advertisement_data.local_name or device.name,
+            'rssi': device.rssi,
+            'services': list(advertisement_data.service_uuids),
+            'manufacturer_data': {str(cid): bytes(raw).hex() for cid, raw
+                                  in advertisement_data.manufacturer_data.items()},
+            'service_data': {uuid: bytes(raw).hex() for uuid, raw
+                             in advertisement_data.service_data.items()}}
+
+
+def record_to_adv(record):
+    """Returns (BLEDevice, AdvertisementData) as given by bleak detection callbacks"""
+    manufacturer_data = {int(cid): bytes.fromhex(raw)
+                         for cid, raw in record.get('manufacturer_data', {}).items()}
+    service_data = {uuid: bytes.fromhex(raw)
+                    for uuid, raw in record.get('service_data', {}).items()}
+    device = BLEDevice(record['address'], record.get('name'), rssi=record.get('rssi', 0),
+                       uuids=record.get('services', []),
+                       manufacturer_data=manufacturer_data)
+    advertisement_data = AdvertisementData(local_name=record.get('name'),
+                                           manufacturer_data=manufacturer_data,
+                                           service_data=service_data,
+                                           service_uuids=record.get('services', []))
+    return device, advertisement_data
+
+
+class AdvRecorder:
+    """Append raw advertisements as JSON lines, to replay them later"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def on_detection(self, device, advertisement_data):
+        if advertisement_data is None:
+            return
+        line = json.dumps(adv_to_record(device, advertisement_data))
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def replay_adverts(path, detection_callback, speed=1.0, stop=None):
+    """
+    Feed recorded advertisements to ``detection_callback(device,
+    advertisement_data)`` keeping their timing, ``speed`` times faster
+    (``0`` for no delay).
+    """
+    t_start = time.time()
+    t_first = None
+    with open(path, 'r') as adv_file:
+        for line in adv_file:
+            if stop is not None and stop():
+                break
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if t_first is None:
+                t_first = record['t']
+            if speed:
+                delay = (record['t'] - t_first) / speed - (time.time() - t_start)
+                if delay > 0:
+                    time.sleep(delay)
+            device, advertisement_data = record_to_adv(record)
+            detection_callback(device, advertisement_data)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from PyQt5 import QtWidgets
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+from bleico.adv_monitor import AdvMonitor
+from bleico.scan_service import get_scan_service, LOST
+from bleico.worker import WorkerSignals
+from datetime import datetime
+
+
+class AdvReadingModel(QtCore.QAbstractTableModel):
+    """Last decoded advertisement of each device, one row per device"""
+    HEADERS = ['Name', 'UUID', 'RSSI', 'Values', 'Last Seen']
+
+    def __init__(self, parent=None):
+        super(AdvReadingModel, self).__init__(parent)
+        self._rows = []
+        self._index = {}  # address --> row
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        reading = self._rows[index.row()]
+        column = index.column()
+        if column == 0:
+            return reading.name
+        elif column == 1:
+            return reading.address
+        elif column == 2:
+            return "{} dBm".format(reading.rssi)
+        elif column == 3:
+            return ', '.join(["{}: {}".format(label, text)
+                              for label, text in reading.values.items()])
+        elif column == 4:
+            return datetime.fromtimestamp(reading.timestamp).strftime("%H:%M:%S")
+        return None
+
+    def update_reading(self, reading):
+        row = self._index.get(reading.address)
+        if row is None:
+            row = len(self._rows)
+            self.beginInsertRows(QtCore.QModelIndex(), row, row)
+            self._rows.append(reading)
+            self._index[reading.address] = row
+            self.endInsertRows()
+        else:
+            self._rows[row] = reading
+            self.dataChanged.emit(self.index(row, 0),
+                                  self.index(row, len(self.HEADERS) - 1))
+
+    def remove_reading(self, address):
+        if address not in self._index:
+            return
+        row = self._index.pop(address)
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self._rows[row]
+        for i in range(row, len(self._rows)):
+            self._index[self._rows[i].address] = i
+        self.endRemoveRows()
+
+
+class AdvMonitorWidget(QtWidgets.QWidget):
+    """
+    Advertisement monitor, shows decoded service and manufacturer data
+    of every advertising device without connecting. Monitoring runs
+    while the window is visible.
+    """
+
+    def __init__(self, log=None, scan_service=None, monitor=None):
+        super(AdvMonitorWidget, self).__init__()
+        self.setWindowTitle("Bleico Advertisement Monitor")
+        self.setMinimumSize(720, 512)
+        self.log = log
+        if monitor is None:
+            if scan_service is None:
+                scan_service = get_scan_service(log=log)
+            monitor = AdvMonitor(scan_service, log=log)
+        self.monitor = monitor
+        self.layout = QtWidgets.QGridLayout()
+        self.model = AdvReadingModel(self)
+        self.proxy_model = QtCore.QSortFilterProxyModel(self)
+        self.proxy_model.setSourceModel(self.model)
+        self.tableView = QtWidgets.QTableView(self)
+        self.tableView.setModel(self.proxy_model)
+        self.tableView.setSortingEnabled(True)
+        self.tableView.verticalHeader().hide()
+        self.tableView.horizontalHeader().setStretchLastSection(False)
+        self.tableView.horizontalHeader().setSectionResizeMode(
+            3, QtWidgets.QHeaderView.Stretch)
+        self.layout.addWidget(self.tableView)
+        # READINGS (ScanThread --> GUI thread)
+        self.monitor_signals = WorkerSignals()
+        self.monitor_signals.progress.connect(self.reading_event)
+        self._monitor_callback = lambda kind, reading: self.monitor_signals.progress.emit((kind, reading))
+        self.monitor.subscribe(self._monitor_callback)
+        # ADD BUTTON WIDGETS
+        self.okButton = QtWidgets.QPushButton('Ok')
+        self.okButton.clicked.connect(self.hide)
+        hbox = QtWidgets.QHBoxLayout()
+        hbox.addStretch(1)
+        hbox.addWidget(self.okButton)
+        self.layout.addLayout(hbox, 1, 0)
+        self.setLayout(self.layout)
+        self.updateGeometry()
+
+    def reading_event(self, event):
+        kind, reading = event
+        if kind == LOST:
+            self.model.remove_reading(reading.address)
+        else:
+            self.model.update_reading(reading)
+
+    def showEvent(self, event):
+        for reading in list(self.monitor.readings.values()):
+            self.model.update_reading(reading)
+        self.monitor.start()
+        event.accept()
+
+    def hideEvent(self, event):
+        self.monitor.stop(wait=False)
+        event.accept()
+
+    def closeEvent(self, event):
+        self.monitor.stop(wait=False)
+        event.accept()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import http.client
+import json
+import socket
+from urllib.parse import urlencode
+from bleico.api_server import ApiError, parse_api_address
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a unix socket"""
+
+    def __init__(self, path, timeout=10):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class BleicoClient:
+    """
+    Client of the bleico local API (:class:`bleico.api_server.ApiServer`).
+
+    :param address: port number (localhost) or unix socket path, as ``-api``
+    """
+
+    def __init__(self, address, timeout=10):
+        self.kind, self.address = parse_api_address(address)
+        self.timeout = timeout
+
+    def connection(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if self.kind == 'tcp':
+            return http.client.HTTPConnection('127.0.0.1', self.address, timeout=timeout)
+        return UnixHTTPConnection(self.address, timeout=timeout)
+
+    def request(self, method, path, query=None, body=None):
+        if query:
+            path += '?' + urlencode(query, doseq=True)
+        conn = self.connection()
+        try:
+            headers = {}
+            if body is not None:
+                body = json.dumps(body).encode()
+                headers['Content-Type'] = 'application/json'
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            result = json.loads(response.read().decode() or 'null')
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise ApiError(response.status, result.get('error') if result else response.reason)
+        return result
+
+    def status(self):
+        return self.request('GET', '/status')
+
+    def profile(self):
+        return self.request('GET', '/profile')
+
+    def values(self):
+        return self.request('GET', '/values')
+
+    def timings(self, enabled=None, reset=False):
+        """Hot path timings, ``enabled``/``reset`` switch them at runtime"""
+        if enabled is None and not reset:
+            return self.request('GET', '/timings')
+        return self.request('POST', '/timings', body={'enabled': enabled, 'reset': reset})
+
+    def history(self, char, field=None, since=None, until=None, tier=None):
+        """Stored values of ``char``, see :meth:`bleico.value_store.ValueStore.query`"""
+        query = {'char': char}
+        for key, value in (('field', field), ('since', since), ('until', until),
+                           ('tier', tier)):
+            if value is not None:
+                query[key] = value
+        return self.request('GET', '/history', query)
+
+    def read(self, char, fresh=False):
+        query = {'char': char}
+        if fresh:
+            query['fresh'] = 1
+        return self.request('GET', '/read', query)
+
+    def write(self, char, data):
+        return self.request('POST', '/write', body={'char': char, 'data': data})
+
+    def notifications(self, chars=(), notify_only=False, timeout=None):
+        """Yields value records (and events) as the device sends them"""
+        query = {'char': list(chars)}
+        if notify_only:
+            query['notify'] = 1
+        path = '/notify'
+        if chars or notify_only:
+            path += '?' + urlencode(query, doseq=True)
+        conn = self.connection(timeout=timeout)
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            if response.status != 200:
+                result = json.loads(response.read().decode() or 'null')
+                raise ApiError(response.status, result.get('error') if result else response.reason)
+            for line in response:
+                if line.strip():
+                    yield json.loads(line.decode())
+        finally:
+            conn.close()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import asyncio
+import json
+import os
+import time
+import traceback
+from urllib.parse import urlsplit, parse_qs
+from bleico.stage_timer import TIMINGS
+from bleico.metrics import METRICS, NOTIFICATIONS_DROPPED
+from bleico.gatt_trace import TRACE
+from bleico.value_store import STORE
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_api_address(address):
+    """``-api`` argument --> ('tcp', port) or ('unix', path)"""
+    address = str(address)
+    if address.isdigit():
+        return 'tcp', int(address)
+    return 'unix', os.path.expanduser(address)
+
+
+class StreamClient:
+    """Notification stream of one API client, bounded: drops instead of blocking"""
+    __slots__ = ('queue', 'handles', 'notify_only', 'dropped')
+
+    def __init__(self, handles=None, notify_only=False, maxsize=1000):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.handles = handles
+        self.notify_only = notify_only
+        self.dropped = 0
+
+    def wants(self, record):
+        if 'handle' not in record:
+            # events and RSSI
+            return self.handles is None
+        if self.handles is not None and record['handle'] not in self.handles:
+            return False
+        return record['notify'] or not self.notify_only
+
+
+class ApiServer:
+    """
+    Local HTTP/JSON API of a connected device, served from the device
+    event loop, so every local consumer shares one BLE connection.
+
+    ``GET /status``
+        connection status
+    ``GET /profile``
+        GATT profile
+    ``GET /values``
+        last value of every characteristic
+    ``GET /read?char=<name|uuid|handle>[&fresh=1]``
+        last value, or read from the device with ``fresh``
+    ``POST /write`` ``{"char": ..., "data": ...}``
+        write SIG field values or raw hex (``0x...``)
+    ``GET /notify[?char=...&char=...][&notify=1]``
+        stream of values (JSON lines) as they arrive, only notifications
+        with ``notify``
+    ``GET /metrics``
+        counters and histograms, Prometheus text format
+    ``GET /timings``, ``POST /timings`` ``{"enabled": ..., "reset": ...}``
+        stage timings, switched at runtime
+    ``GET /trace``, ``POST /trace`` ``{"enabled": ..., "clear": ...}``
+        GATT operations timeline (Chrome trace-event JSON), switched at
+        runtime
+    ``GET /history?char=...[&field=...][&since=...][&until=...][&tier=...]``
+        stored values of a characteristic (see ``-store``), ``since``
+        and ``until`` in epoch seconds or negative seconds from now
+
+    Reads and writes go through ``BLE_DEVICE.gatt_lock`` so they do not
+    interleave with the poll loop. :meth:`publish` must be called from
+    the device loop thread.
+
+    :param daemon: :class:`bleico.daemon.HeadlessDaemon` of the device
+    :param address: port number (localhost) or unix socket path
+    """
+
+    def __init__(self, daemon, address, log=None):
+        self.daemon = daemon
+        self.kind, self.address = parse_api_address(address)
+        self.log = log
+        self.server = None
+        self.latest = {}  # handle --> last value record
+        self.streams = []
+        self.requests = 0
+        # served as GET /metrics
+        METRICS.enable()
+
+    async def start(self):
+        if self.kind == 'tcp':
+            self.server = await asyncio.start_server(self.handle_client, '127.0.0.1',
+                                                     self.address)
+        else:
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self.server = await asyncio.start_unix_server(self.handle_client, self.address)
+            os.chmod(self.address, 0o600)
+        if self.log:
+            self.log.info('API listening on {}'.format(
+                'http://127.0.0.1:{}'.format(self.address) if self.kind == 'tcp'
+                else self.address))
+
+    async def stop(self):
+        for stream in self.streams:
+            if stream.queue.full():
+                stream.queue.get_nowait()
+            stream.queue.put_nowait(None)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.kind == 'unix' and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def publish(self, record):
+        if 'handle' in record:
+            self.latest[record['handle']] = record
+        for stream in self.streams:
+            if stream.wants(record):
+                try:
+                    stream.queue.put_nowait(record)
+                except asyncio.QueueFull:
+                    stream.dropped += 1
+                    if record.get('notify'):
+                        METRICS.inc(NOTIFICATIONS_DROPPED, record['char'])
+
+    # HTTP
+
+    async def handle_client(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, val = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = val.strip()
+            body = b''
+            if int(headers.get('content-length', 0)):
+                body = await reader.readexactly(int(headers['content-length']))
+            self.requests += 1
+            url = urlsplit(target)
+            query = parse_qs(url.query)
+            if method == 'GET' and url.path == '/notify':
+                try:
+                    handles = self.stream_handles(query)
+                except ApiError as e:
+                    self.respond(writer, e.status, json.dumps({'error': e.message}).encode())
+                    await writer.drain()
+                    return
+                await self.stream(writer, handles, query)
+                return
+            if method == 'GET' and url.path == '/metrics':
+                self.respond(writer, 200, METRICS.render().encode(),
+                             content_type='text/plain; version=0.0.4')
+                await writer.drain()
+                return
+            try:
+                status, result = 200, await self.dispatch(method, url.path, query, body)
+            except ApiError as e:
+                status, result = e.status, {'error': e.message}
+            except Exception as e:
+                if self.log:
+                    self.log.error(traceback.format_exc())
+                status, result = 500, {'error': str(e)}
+            self.respond(writer, status, json.dumps(result, default=str).encode())
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, payload, content_type='application/json'):
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nConnection: close\r\n'.format(
+            status, HTTP_STATUS[status], content_type)
+        if payload is not None:
+            head += 'Content-Length: {}\r\n'.format(len(payload))
+        writer.write((head + '\r\n').encode())
+        if payload is not None:
+            writer.write(payload)
+
+    def stream_handles(self, query):
+        """Handles of the ``char`` query arguments, `None` for all, before the 200 response"""
+        if 'char' not in query:
+            return None
+        return set([self.resolve(char).handle for char in query['char']])
+
+    async def stream(self, writer, handles, query):
+        stream = StreamClient(handles, notify_only=query.get('notify', ['0'])[0] == '1')
+        self.respond(writer, 200, None, content_type='application/x-ndjson')
+        await writer.drain()
+        self.streams.append(stream)
+        try:
+            while True:
+                record = await stream.queue.get()
+                if record is None:
+                    break
+                writer.write(json.dumps(record, default=str).encode() + b'\n')
+                await writer.drain()
+        finally:
+            self.streams.remove(stream)
+            if stream.dropped and self.log:
+                self.log.warning('API stream dropped {} values'.format(stream.dropped))
+
+    # ENDPOINTS
+
+    def resolve(self, char):
+        gatt_char = self.daemon.profile.resolve(char) if self.daemon.profile else None
+        if gatt_char is None:
+            raise ApiError(404, 'Characteristic not found: {}'.format(char))
+        return gatt_char
+
+    def check_connected(self):
+        if not self.daemon.dev.connected:
+            raise ApiError(503, 'Device not connected')
+
+    async def dispatch(self, method, path, query, body):
+        dev = self.daemon.dev
+        if path == '/status':
+            return {'address': dev.UUID, 'name': dev.name, 'connected': dev.connected,
+                    'rssi': dev.rssi, 'streams': len(self.streams), 'requests': self.requests}
+        if path == '/profile':
+            if self.daemon.profile is None:
+                raise ApiError(503, 'Device not connected')
+            return self.daemon.profile.to_dict()
+        if path == '/values':
+            return list(self.latest.values())
+        if path == '/read':
+            if method != 'GET':
+                raise ApiError(405, 'Use GET')
+            if 'char' not in query:
+                raise ApiError(400, 'char required')
+            gatt_char = self.resolve(query['char'][0])
+            if query.get('fresh', ['0'])[0] != '1' and gatt_char.handle in self.latest:
+                return self.latest[gatt_char.handle]
+            if not gatt_char.readable:
+                raise ApiError(400, 'Characteristic not readable')
+            self.check_connected()
+            raw = await dev.as_read_char(gatt_char.handle)
+            record = self.daemon.make_record(gatt_char.handle, raw)
+            self.publish(record)
+            return record
+        if path == '/write':
+            if method != 'POST':
+                raise ApiError(405, 'Use POST')
+            try:
+                request = json.loads(body.decode() or '{}')
+                char, data = request['char'], str(request['data'])
+            except (ValueError, KeyError, TypeError):
+                raise ApiError(400, 'Body must be {"char": ..., "data": ...}')
+            gatt_char = self.resolve(char)
+            if not gatt_char.writeable:
+                raise ApiError(400, 'Characteristic not writeable')
+            try:
+                raw = self.daemon.codec.encode(gatt_char.name, data)
+            except ValueError as e:
+                raise ApiError(400, str(e))
+            self.check_connected()
+            await dev.as_write_char(gatt_char.handle, raw)
+            return {'t': time.time(), 'address': dev.UUID, 'char': gatt_char.name,
+                    'handle': gatt_char.handle, 'written': raw.hex()}
+        if path == '/timings':
+            if method == 'POST':
+                try:
+                    request = json.loads(body.decode() or '{}')
+                except ValueError:
+                    raise ApiError(400, 'Body must be {"enabled": ..., "reset": ...}')
+                if request.get('reset'):
+                    TIMINGS.reset()
+                if request.get('enabled') is True:
+                    TIMINGS.enable()
+                elif request.get('enabled') is False:
+                    TIMINGS.disable()
+            return {'enabled': TIMINGS.enabled, 'since': TIMINGS.t_enabled,
+                    'stages': TIMINGS.snapshot()}
+        if path == '/trace':
+            if method == 'POST':
+                try:
+                    request = json.loads(body.decode() or '{}')
+                except ValueError:
+                    raise ApiError(400, 'Body must be {"enabled": ..., "clear": ...}')
+                if request.get('clear'):
+                    TRACE.clear()
+                if request.get('enabled') is True:
+                    TRACE.enable()
+                elif request.get('enabled') is False:
+                    TRACE.disable()
+                return {'enabled': TRACE.enabled, 'events': len(TRACE.events)}
+            return TRACE.to_chrome()
+        if path == '/history':
+            if not STORE.enabled:
+                raise ApiError(503, 'Value store not enabled, see -store')
+            if 'char' not in query:
+                raise ApiError(400, 'char required')
+            try:
+                now = time.time()
+                since, until = [float(query[key][0]) if key in query else None
+                                for key in ('since', 'until')]
+                since, until = [now + value if value is not None and value <= 0 else value
+                                for value in (since, until)]
+            except ValueError:
+                raise ApiError(400, 'since and until must be numbers')
+            field = query.get('field', [None])[0]
+            tier = query.get('tier', [None])[0]
+            try:
+                return await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: STORE.query(query['char'][0], field=field,
+                                              address=dev.UUID, since=since, until=until,
+                                              tier=tier))
+            except ValueError as e:
+                raise ApiError(400, str(e))
+        raise ApiError(404, 'Unknown endpoint: {}'.format(path))
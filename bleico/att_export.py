@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Raw capture (bleico/gatt_capture.py) --> HCI trace for Wireshark, as a
+# sniffer on the host would have seen it: H4 packets, ACL data carrying
+# synthesized ATT PDUs on L2CAP channel 4, in a btsnoop file (datalink
+# 1002) or a pcap file (LINKTYPE_BLUETOOTH_HCI_H4_WITH_PHDR).
+#
+# Each device gets an LE Connection Complete event, an MTU exchange and,
+# from its GATT table, the service, characteristic and descriptor
+# discovery, then every value:
+#   read           Read Request, Read Response
+#   notify         Handle Value Notification
+#   write          Write Request, Write Response
+#   write-command  Write Command
+# Values are not split to the MTU, long reads are one Read Response.
+
+import os
+import struct
+import uuid as uuidlib
+from bleico.gatt_capture import CaptureReader, rotated_paths
+
+BTSNOOP_EPOCH_DELTA = 0x00dcddb30f2f8000  # microseconds from year 0 to 1970
+BTSNOOP_H4 = 1002
+LINKTYPE_H4_WITH_PHDR = 201
+H4_ACL, H4_EVENT = 0x02, 0x04
+ATT_CID = 0x0004
+FIRST_CONNECTION = 0x0040
+ATT_MTU = 517
+SIG_BASE = uuidlib.UUID('00000000-0000-1000-8000-00805f9b34fb').bytes[4:]
+
+# ATT opcodes
+ERROR_RSP = 0x01
+EXCHANGE_MTU_REQ, EXCHANGE_MTU_RSP = 0x02, 0x03
+FIND_INFO_REQ, FIND_INFO_RSP = 0x04, 0x05
+READ_BY_TYPE_REQ, READ_BY_TYPE_RSP = 0x08, 0x09
+READ_REQ, READ_RSP = 0x0A, 0x0B
+READ_BY_GROUP_REQ, READ_BY_GROUP_RSP = 0x10, 0x11
+WRITE_REQ, WRITE_RSP = 0x12, 0x13
+NOTIFICATION = 0x1B
+WRITE_CMD = 0x52
+ATTRIBUTE_NOT_FOUND = 0x0A
+PRIMARY_SERVICE, CHARACTERISTIC = 0x2800, 0x2803
+
+PROPERTY_BITS = {'broadcast': 0x01, 'read': 0x02, 'write-without-response': 0x04,
+                 'write': 0x08, 'notify': 0x10, 'indicate': 0x20,
+                 'authenticated-signed-writes': 0x40, 'extended-properties': 0x80}
+
+
+def uuid_bytes(uuid):
+    """uuid string --> 2 bytes (SIG) or 16 bytes, little endian as in ATT"""
+    raw = uuidlib.UUID(uuid).bytes
+    if raw[4:] == SIG_BASE and raw[:2] == b'\x00\x00':
+        return raw[2:4][::-1]
+    return raw[::-1]
+
+
+def att_layout(table):
+    """
+    GATT table of a capture --> (services, value handles): services as
+    [(start, end, uuid, [(declaration, properties, value, uuid,
+    [(handle, uuid), ...]), ...]), ...] and recorded handle --> value
+    handle.
+
+    BlueZ handles are the characteristic declarations, the value is the
+    next handle, so they are kept; a table without room for the value
+    handles (e.g. simulated) is numbered again in order.
+    """
+    used = set()
+    for service in table:
+        used.add(service['handle'])
+        for char in service['chars']:
+            used.add(char['handle'])
+            used.update(descriptor['handle'] for descriptor in char['descriptors'])
+    keep = all(char['handle'] + 1 not in used and char['handle'] < 0xFFFF
+               for service in table for char in service['chars']) and 0 not in used
+    services = []
+    value_handles = {}
+    handle = 0
+    for service in table:
+        start = service['handle'] if keep else handle + 1
+        handle = start
+        chars = []
+        for char in service['chars']:
+            declaration = char['handle'] if keep else handle + 1
+            value_handles[char['handle']] = declaration + 1
+            handle = declaration + 1
+            descriptors = []
+            for descriptor in char['descriptors']:
+                descriptor_handle = descriptor['handle'] if keep else handle + 1
+                value_handles.setdefault(descriptor['handle'], descriptor_handle)
+                descriptors.append((descriptor_handle, descriptor['uuid']))
+                handle = max(handle, descriptor_handle)
+            properties = 0
+            for prop in char['properties']:
+                properties |= PROPERTY_BITS.get(prop, 0)
+            chars.append((declaration, properties, declaration + 1, char['uuid'], descriptors))
+        services.append([start, handle, service['uuid'], chars])
+    # the end of a service is the last handle before the next one
+    for service, next_service in zip(services, services[1:]):
+        service[1] = max(service[1], next_service[0] - 1)
+    if services:
+        services[-1][1] = 0xFFFF
+    return [tuple(service) for service in services], value_handles
+
+
+class BtsnoopWriter:
+    """btsnoop file of H4 packets, written as they come"""
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(b'btsnoop\0' + struct.pack('>II', 1, BTSNOOP_H4))
+
+    def write(self, t, packet, received, event=False):
+        flags = (1 if received else 0) | (2 if event else 0)
+        self._file.write(struct.pack('>IIIIq', len(packet), len(packet), flags, 0,
+                                     int(t * 1e6) + BTSNOOP_EPOCH_DELTA) + packet)
+
+    def close(self):
+        self._file.close()
+
+
+class PcapWriter:
+    """pcap file of H4 packets with the direction header, written as they come"""
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535,
+                                     LINKTYPE_H4_WITH_PHDR))
+
+    def write(self, t, packet, received, event=False):
+        seconds = int(t)
+        record = struct.pack('>I', 1 if received else 0) + packet
+        self._file.write(struct.pack('<IIII', seconds, int((t - seconds) * 1e6),
+                                     len(record), len(record)) + record)
+
+    def close(self):
+        self._file.close()
+
+
+class AttExporter:
+    """
+    Synthesize the HCI traffic of captured values, see the module
+    comments. ``writer``: :class:`BtsnoopWriter` or :class:`PcapWriter`.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.connections = {}  # address --> connection handle
+        self.tables = {}  # address --> GATT table
+        self.value_handles = {}  # address --> recorded handle --> value handle
+        self.packets = 0
+        self.values = 0
+
+    def _acl(self, t, address, pdu, received):
+        connection = self.connections[address]
+        l2cap = struct.pack('<HH', len(pdu), ATT_CID) + pdu
+        # packet boundary: first automatically flushable packet
+        self.writer.write(t, bytes((H4_ACL,)) + struct.pack('<HH', connection | 0x2000,
+                                                            len(l2cap)) + l2cap, received)
+        self.packets += 1
+
+    def _event(self, t, code, params):
+        self.writer.write(t, bytes((H4_EVENT, code, len(params))) + params, True, event=True)
+        self.packets += 1
+
+    def connect(self, t, address):
+        connection = self.connections[address] = FIRST_CONNECTION + len(self.connections)
+        try:
+            peer = bytes.fromhex(address.replace(':', ''))[::-1]
+        except ValueError:
+            peer = bytes(6)  # not a MAC address (macOS uuid)
+        # LE Meta event, LE Connection Complete: central, public peer address
+        self._event(t, 0x3E, struct.pack('<BBHBB6sHHHB', 0x01, 0, connection, 0, 0,
+                                         peer[:6].ljust(6, b'\0'), 24, 0, 400, 0))
+        self._acl(t, address, struct.pack('<BH', EXCHANGE_MTU_REQ, ATT_MTU), False)
+        self._acl(t, address, struct.pack('<BH', EXCHANGE_MTU_RSP, ATT_MTU), True)
+
+    def discover(self, t, address, table):
+        """Primary services, characteristics and descriptors discovery of ``table``"""
+        services, self.value_handles[address] = att_layout(table)
+        self.tables[address] = table
+
+        def exchange(request, response):
+            self._acl(t, address, request, False)
+            self._acl(t, address, response, True)
+
+        def not_found(opcode, handle):
+            return struct.pack('<BBHB', ERROR_RSP, opcode, handle, ATTRIBUTE_NOT_FOUND)
+
+        start = 0x0001
+        for service_start, end, uuid, chars in services:
+            entry = struct.pack('<HH', service_start, end) + uuid_bytes(uuid)
+            exchange(struct.pack('<BHHH', READ_BY_GROUP_REQ, start, 0xFFFF, PRIMARY_SERVICE),
+                     bytes((READ_BY_GROUP_RSP, len(entry))) + entry)
+            start = end + 1
+        if start <= 0xFFFF:
+            exchange(struct.pack('<BHHH', READ_BY_GROUP_REQ, start, 0xFFFF, PRIMARY_SERVICE),
+                     not_found(READ_BY_GROUP_REQ, start))
+        for service_start, end, uuid, chars in services:
+            start = service_start
+            for declaration, properties, value, char_uuid, descriptors in chars:
+                entry = struct.pack('<HBH', declaration, properties, value) + \
+                    uuid_bytes(char_uuid)
+                exchange(struct.pack('<BHHH', READ_BY_TYPE_REQ, start, end, CHARACTERISTIC),
+                         bytes((READ_BY_TYPE_RSP, len(entry))) + entry)
+                start = value + 1
+            if start <= end:
+                exchange(struct.pack('<BHHH', READ_BY_TYPE_REQ, start, end, CHARACTERISTIC),
+                         not_found(READ_BY_TYPE_REQ, start))
+            for declaration, properties, value, char_uuid, descriptors in chars:
+                for handle, descriptor_uuid in descriptors:
+                    uuid_raw = uuid_bytes(descriptor_uuid)
+                    exchange(struct.pack('<BHH', FIND_INFO_REQ, handle, handle),
+                             struct.pack('<BBH', FIND_INFO_RSP, 1 if len(uuid_raw) == 2 else 2,
+                                         handle) + uuid_raw)
+
+    def value(self, t, kind, address, handle, data):
+        handle = self.value_handles.get(address, {}).get(handle, handle)
+        if kind == 'read':
+            self._acl(t, address, struct.pack('<BH', READ_REQ, handle), False)
+            self._acl(t, address, bytes((READ_RSP,)) + data, True)
+        elif kind == 'notify':
+            self._acl(t, address, struct.pack('<BH', NOTIFICATION, handle) + data, True)
+        elif kind == 'write':
+            self._acl(t, address, struct.pack('<BH', WRITE_REQ, handle) + data, False)
+            self._acl(t, address, bytes((WRITE_RSP,)), True)
+        elif kind == 'write-command':
+            self._acl(t, address, struct.pack('<BH', WRITE_CMD, handle) + data, False)
+        self.values += 1
+
+    def disconnect(self, t, address):
+        # Disconnection Complete, remote user terminated connection
+        self._event(t, 0x05, struct.pack('<BHB', 0, self.connections[address], 0x13))
+
+    def export(self, records, address=None):
+        """
+        Write capture ``records`` (``CaptureReader.records(profiles=True)``
+        tuples), of ``address`` only if given
+        """
+        tables = {}  # address --> table not discovered yet
+        t_last = None
+        for t, kind, record_address, handle, data in records:
+            if address is not None and record_address != address:
+                continue
+            if kind == 'profile':
+                if self.tables.get(record_address) != data:
+                    tables[record_address] = data
+                continue
+            if record_address not in self.connections:
+                self.connect(t, record_address)
+            if record_address in tables:
+                self.discover(t, record_address, tables.pop(record_address))
+            self.value(t, kind, record_address, handle, data)
+            t_last = t
+        for connected_address in self.connections:
+            self.disconnect(t_last, connected_address)
+
+
+def export_capture(path, out_path, address=None):
+    """
+    Capture ``path`` (and its rotated files) --> btsnoop file
+    ``out_path``, or pcap if it ends with ``.pcap``. Returns the
+    :class:`AttExporter` (``packets``, ``values``).
+    """
+    paths = rotated_paths(path)
+    if not paths:
+        raise ValueError('{}: no capture files'.format(path))
+    if os.path.splitext(out_path)[1].lower() == '.pcap':
+        writer = PcapWriter(out_path)
+    else:
+        writer = BtsnoopWriter(out_path)
+    exporter = AttExporter(writer)
+
+    def records():
+        for capture_path in paths:
+            with CaptureReader(capture_path) as reader:
+                yield from reader.records(profiles=True)
+
+    try:
+        exporter.export(records(), address=address)
+    finally:
+        writer.close()
+    return exporter
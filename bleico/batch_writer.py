@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import traceback
+from collections import deque
+
+
+class BatchWriter:
+    """
+    Base of the queues written in batches by their own thread (value
+    store, raw capture, output sinks).
+
+    :meth:`_queue` appends an item and never blocks the caller: if
+    ``max_pending`` items are already waiting the item is dropped
+    (counted in :attr:`dropped`). The check and the append are done
+    under a lock, so the limit holds with several producer threads.
+
+    The writer thread wakes every ``flush_interval`` seconds, or as soon
+    as ``batch_size`` items are pending, and calls :meth:`_flush`; an
+    exception is logged and kept in :attr:`error`. On stop the thread
+    flushes once more and exits.
+
+    Subclasses implement :meth:`_write_pending` (and optionally
+    :meth:`_flush` and :meth:`_finish`).
+    """
+    thread_name = 'WriterThread'
+
+    def __init__(self, flush_interval=1.0, batch_size=1024, max_pending=1 << 16, log=None):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.log = log
+        self.pending = deque()
+        self.dropped = 0
+        self.error = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = False
+        self._lock = threading.Lock()
+
+    def _queue(self, item):
+        with self._lock:
+            queued = len(self.pending) < self.max_pending
+            if queued:
+                self.pending.append(item)
+        if not queued:
+            self._drop(1)
+        elif len(self.pending) >= self.batch_size:
+            self._wake.set()
+
+    def _drop(self, n_items):
+        self.dropped += n_items
+
+    def _start_thread(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._write_loop, name=self.thread_name,
+                                        daemon=True)
+        self._thread.start()
+
+    def _stop_thread(self):
+        """Write what is pending and wait for the thread"""
+        if self._thread is None:
+            return
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    # WRITER THREAD
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stop
+            try:
+                self._flush(stopping)
+            except Exception as e:
+                self.error = e
+                if self.log:
+                    self.log.error(traceback.format_exc())
+            if stopping:
+                break
+        self._finish()
+
+    def _flush(self, stopping):
+        self._write_pending()
+
+    def _write_pending(self):
+        raise NotImplementedError
+
+    def _finish(self):
+        """Called by the writer thread before it exits"""
+        pass
@@ -21,8 +21,6 @@ logging.getLogger('asyncio').setLevel(logging.WARNING)
 import asyncio
 import struct
 from datetime import datetime
-from bleak import BleakClient
-from bleak import discover
 from bleak_sigspec.utils import get_char_value, get_xml_char
 import uuid as U_uuid
 import time
@@ -30,13 +28,58 @@ import ast
 from array import array
 import sys
 import traceback
+from bleico.scan_cache import get_scan_cache
+from bleico.stage_timer import TIMINGS, GATT_READ, DECODE
+from bleico.instrumented_client import InstrumentedClient
+from bleico.metrics import (METRICS, READS, READ_ERRORS, READ_LATENCY, CONNECT_ATTEMPTS,
+                            CONNECT_FAILURES, CONNECT_DURATION, CONNECTED, RSSI)
+
+
+class BleakBackend:
+    """
+    Default BLE backend: bleak clients and scanners, on a real adapter.
+
+    A backend provides ``client(address_or_ble_device)``,
+    ``scanner()`` and ``discover(timeout)``, see :func:`set_backend`.
+    The bleak client and scanner are imported on first use, so other
+    backends never load them.
+    """
+    name = 'bleak'
+
+    def client(self, address_or_ble_device):
+        from bleak import BleakClient
+        return BleakClient(address_or_ble_device)
+
+    def scanner(self):
+        from bleak import BleakScanner
+        return BleakScanner()
+
+    async def discover(self, timeout=5):
+        from bleak import discover
+        return await discover(timeout=timeout)
+
+
+_backend = BleakBackend()
+
+
+def set_backend(backend):
+    """
+    Use ``backend`` for every client and scan of the process, e.g. a
+    :class:`bleico.sim_backend.SimBackend`. ``None`` restores bleak.
+    """
+    global _backend
+    _backend = backend if backend is not None else BleakBackend()
+
+
+def get_backend():
+    return _backend
 
 
 def ble_scan(log=False):
     devs = []
 
     async def run():
-        devices = await discover()
+        devices = await get_backend().discover()
         for d in devices:
             if log:
                 print(d)
@@ -47,22 +90,51 @@ def ble_scan(log=False):
     return loop.run_until_complete(run())
 
 
+def ble_stream_scan(detection_callback, stop=None, timeout=10, loop=None):
+    """
+    Scan calling ``detection_callback(device, advertisement_data)`` as
+    advertisements arrive, until ``stop()`` returns `True` or ``timeout``
+    seconds (``None`` to scan until stopped).
+    """
+    async def run():
+        scanner = get_backend().scanner()
+        scanner.register_detection_callback(detection_callback)
+        await scanner.start()
+        t0 = time.time()
+        try:
+            while stop is None or not stop():
+                if timeout is not None and time.time() - t0 > timeout:
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await scanner.stop()
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    loop.run_until_complete(run())
+
+
 class BASE_BLE_DEVICE:
     def __init__(self, scan_dev, init=False, name=None, lenbuff=100,
                  rssi=None, log=None):
         # BLE
         self.ble_client = None
+        self.ble_device = None
         if hasattr(scan_dev, 'address'):
             self.UUID = scan_dev.address
             self.name = scan_dev.name
             self.rssi = scan_dev.rssi
             self.address = self.UUID
+            if hasattr(scan_dev, 'details'):
+                self.ble_device = scan_dev
         else:
             self.UUID = scan_dev
             self.name = name
             self.rssi = rssi
             self.address = self.UUID
         self.connected = False
+        self.connect_time = None
+        self._gatt_lock = None
         self.services = {}
         self.services_rsum = {}
         self.services_rsum_handles = {}
@@ -103,30 +175,50 @@ class BASE_BLE_DEVICE:
 
     def set_event_loop(self, loop):
         self.loop = loop
+        self._gatt_lock = None
         # self.ble_client.loop = loop
 
     async def connect_client(self, n_tries=3, log=True):
         n = 0
-        self.ble_client = BleakClient(self.UUID)
+        # RECENTLY SEEN: connect to the BLEDevice, skipping discovery
+        ble_device = self.ble_device
+        if ble_device is None:
+            cached = get_scan_cache().get(self.UUID)
+            if cached is not None:
+                ble_device = cached.device
+        if ble_device is not None:
+            self.ble_client = InstrumentedClient(get_backend().client(ble_device))
+        else:
+            self.ble_client = InstrumentedClient(get_backend().client(self.UUID))
         while n < n_tries:
+            METRICS.inc(CONNECT_ATTEMPTS)
+            t0 = time.monotonic()
             try:
                 await asyncio.wait_for(self.ble_client.connect(timeout=3),
                                        timeout=60)
                 self.connected = await self.ble_client.is_connected()
                 if self.connected:
+                    METRICS.observe(CONNECT_DURATION, time.monotonic() - t0)
+                    METRICS.set(CONNECTED, 1)
+                    self.connect_time = time.time()
                     self.name = self.ble_client._device_info.name()
                     if log:
                         self.log.info("Connected to: {}".format(self.UUID))
                     break
             except Exception as e:
+                METRICS.inc(CONNECT_FAILURES)
                 if log:
                     if not self.break_flag:
                         self.log.error(e)
                         self.log.info('Trying again...')
                     else:
                         break
-                time.sleep(1)
+                await asyncio.sleep(1)
                 n += 1
+                if ble_device is not None:
+                    # stale device, fall back to discovery
+                    ble_device = self.ble_device = None
+                    self.ble_client = InstrumentedClient(get_backend().client(self.UUID))
 
     async def disconnect_client(self, log=True, timeout=None):
         if timeout:
@@ -163,6 +255,7 @@ class BASE_BLE_DEVICE:
     def get_RSSI(self):
         if hasattr(self.ble_client, 'get_rssi'):
             self.rssi = self.loop.run_until_complete(self.ble_client.get_rssi())
+            METRICS.set(RSSI, self.rssi)
         else:
             self.rssi = 0
         return self.rssi
@@ -266,10 +359,39 @@ class BASE_BLE_DEVICE:
         except Exception as e:
             print(e)
 
+    def gatt_lock(self):
+        """asyncio.Lock that serializes GATT reads/writes on the device loop"""
+        if self._gatt_lock is None:
+            if sys.version_info < (3, 10):
+                # bound at creation: to the device loop, whatever the caller's loop
+                self._gatt_lock = asyncio.Lock(loop=self.loop)
+            else:
+                # bound to the running loop on first use
+                self._gatt_lock = asyncio.Lock()
+        return self._gatt_lock
+
     async def as_read_char(self, uuid):
-        return bytes(await self.ble_client.read_gatt_char(uuid))
+        async with self.gatt_lock():
+            return bytes(await self.ble_client.read_gatt_char(uuid))
 
     def read_char_raw(self, key=None, uuid=None, handle=None):
+        if not (METRICS.enabled or TIMINGS.enabled):
+            return self._read_char_raw(key=key, uuid=uuid, handle=handle)
+        t0 = time.perf_counter_ns()
+        try:
+            data = self._read_char_raw(key=key, uuid=uuid, handle=handle)
+        except Exception:
+            METRICS.inc(READ_ERRORS, key or uuid, handle)
+            raise
+        elapsed = time.perf_counter_ns() - t0
+        if METRICS.enabled:
+            METRICS.inc(READS, key or uuid, handle)
+            METRICS.observe(READ_LATENCY, elapsed / 1e9, key or uuid, handle)
+        if TIMINGS.enabled:
+            TIMINGS.record(GATT_READ, key or uuid, elapsed)
+        return data
+
+    def _read_char_raw(self, key=None, uuid=None, handle=None):
         if key is not None:
             if key in list(self.readables.keys()):
                 if handle:
@@ -313,7 +435,8 @@ class BASE_BLE_DEVICE:
             print(e)
 
     async def as_write_char(self, uuid, data):
-        await self.ble_client.write_gatt_char(uuid, data)
+        async with self.gatt_lock():
+            await self.ble_client.write_gatt_char(uuid, data)
 
     def write_char(self, key=None, uuid=None, data=None, handle=None):
         if key is not None:
@@ -682,9 +805,12 @@ class BLE_DEVICE(BASE_BLE_DEVICE):
 
     def get_char_value(self, char, rtn_flags=False, debug=False, handle=None):
         raw_val = self.read_char(char, data_fmt="raw", handle=handle)
+        t0 = TIMINGS.start()
         f_value = get_char_value(raw_val, self.chars_xml[char],
                                  rtn_flags=rtn_flags,
                                  debug=debug)
+        if t0:
+            TIMINGS.stop(DECODE, char, t0)
         return f_value
 
     def pformat_field_value(self, field_data, field='', sep=',', prnt=True,
@@ -964,7 +1090,10 @@ class BLE_DEVICE(BASE_BLE_DEVICE):
         BPS = "Battery Power State"
         if 'Battery Service' in self.services.keys():
             if BPS in self.readables.keys():
-                self.unpack_batt_power_state()
+                try:
+                    self.unpack_batt_power_state()
+                except Exception as e:
+                    print(e)
 
         else:
             pass
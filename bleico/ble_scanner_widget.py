@@ -18,68 +18,221 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
+from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
-from bleico.ble_device import ble_scan
+from bleico.scan_service import get_scan_service, LOST
 from bleico.devtools import store_dev
-import time
+from bleico.worker import WorkerSignals
+import bisect
 import os
 from bleak.uuids import uuidstr_to_str
 
 
-class ScanDeviceItem(QtWidgets.QWidget):
-    def __init__(self, device=None, parent=None):
-        super(ScanDeviceItem, self).__init__(parent)
-        self.device = device
-        self.textQVBoxLayout = QtWidgets.QVBoxLayout()
-        self.deviceQLabel = QtWidgets.QLabel()
-        self.uuidQLabel = QtWidgets.QLabel()
-        self.textQVBoxLayout.addWidget(self.deviceQLabel)
-        self.textQVBoxLayout.addWidget(self.uuidQLabel)
-        self.allQHBoxLayout = QtWidgets.QHBoxLayout()
-        self.iconQLabel = QtWidgets.QLabel()
-        self.allQHBoxLayout.addWidget(self.iconQLabel, 0)
-        self.allQHBoxLayout.addLayout(self.textQVBoxLayout, 1)
-        self.setLayout(self.allQHBoxLayout)
-        # setStyleSheet
-        self.deviceQLabel.setStyleSheet('''
-            color: rgb(0, 0, 0);
-        ''')
-        self.uuidQLabel.setStyleSheet('''
-            color: rgb(0, 0, 0);
-        ''')
-
-    def setTextUp(self, text):
-        self.deviceQLabel.setText(text)
-
-    def setTextDown(self, text):
-        self.uuidQLabel.setText(text)
-
-    def setIcon(self, imagePath):
-        pixmap = QtGui.QPixmap(imagePath)
-        pixmap_scaled = pixmap.scaled(128, 128, Qt.KeepAspectRatio,
+# PRE-SCALED RSSI ICONS, shared by all scanners in the process
+_RSSI_PIXMAPS = {}
+RSSI_ICON_SIZE = 64
+
+
+def rssi_pixmap(src_path, rssi_level, rssi_icon='signal_{}.png'):
+    """Load and scale ``signal_<level>.png`` once, then reuse it"""
+    key = (src_path, rssi_level)
+    if key not in _RSSI_PIXMAPS:
+        pixmap = QtGui.QPixmap(os.path.join(src_path, rssi_icon.format(rssi_level)))
+        pixmap_scaled = pixmap.scaled(2 * RSSI_ICON_SIZE, 2 * RSSI_ICON_SIZE,
+                                      Qt.KeepAspectRatio,
                                       transformMode=Qt.SmoothTransformation)
         pixmap_scaled.setDevicePixelRatio(2.0)
-        self.iconQLabel.setPixmap(pixmap_scaled)
+        _RSSI_PIXMAPS[key] = pixmap_scaled
+    return _RSSI_PIXMAPS[key]
+
+
+def map_rssi_level_icon(rssi):
+    if rssi <= (-90):  # LEVEL 0 --> VERY_LOW
+        return "VERY_LOW"
+    elif rssi > (-90) and rssi <= (-80):  # LEVEL 1 --> LOW
+        return "LOW"
+    elif rssi > (-80) and rssi <= (-70):  # LEVEL 2 --> GOOD
+        return "GOOD"
+    elif rssi > (-70) and rssi <= (-60):  # LEVEL 3 --> VERY_GOOD
+        return "VERY_GOOD"
+    elif rssi > (-60):  # LEVEL 4 --> EXCELLENT
+        return "EXCELLENT"
+
+
+class ScanDeviceRow:
+    """Texts of one scanner row, computed when the device is updated"""
+    __slots__ = ('address', 'device', 'rssi', 'rssi_level', 'text_up', 'text_down')
+
+    def __init__(self, device):
+        self.address = device.address
+        self.update(device)
+
+    def update(self, device):
+        self.device = device
+        self.rssi = device.rssi
+        self.rssi_level = map_rssi_level_icon(device.rssi)
+        try:
+            services = [uuidstr_to_str(serv.lower()) for serv in device.metadata['uuids']]
+        except Exception as e:
+            services = []
+        self.text_up = "{}\nUUID: {}".format(device.name, device.address)
+        self.text_down = "RSSI: {} dBm  Services: {}".format(device.rssi, ','.join(services))
+
+
+class ScanDeviceModel(QtCore.QAbstractListModel):
+    """
+    Scanned devices sorted by RSSI (strongest first).
+
+    :meth:`update_device` inserts new devices at their sorted position
+    and moves updated ones only if their RSSI order changed.
+    """
+    RowRole = Qt.UserRole + 1
+    AddressRole = Qt.UserRole + 2
+
+    def __init__(self, parent=None):
+        super(ScanDeviceModel, self).__init__(parent)
+        self._rows = []
+        self._keys = []  # -rssi, ascending
+        self._index = {}  # address --> row
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return "{}\n{}".format(row.text_up, row.text_down)
+        elif role == self.RowRole:
+            return row
+        elif role == self.AddressRole:
+            return row.address
+        return None
+
+    def devices(self):
+        return [row.device for row in self._rows]
+
+    def _reindex(self, first, last):
+        for i in range(first, last + 1):
+            self._index[self._rows[i].address] = i
+
+    def update_device(self, device):
+        """Insert or update a device, returns `True` if it is new"""
+        key = -device.rssi
+        if device.address not in self._index:
+            pos = bisect.bisect_right(self._keys, key)
+            self.beginInsertRows(QtCore.QModelIndex(), pos, pos)
+            self._rows.insert(pos, ScanDeviceRow(device))
+            self._keys.insert(pos, key)
+            self._reindex(pos, len(self._rows) - 1)
+            self.endInsertRows()
+            return True
+        old = self._index[device.address]
+        row = self._rows[old]
+        row.update(device)
+        del self._keys[old]
+        new = bisect.bisect_right(self._keys, key)
+        self._keys.insert(new, key)
+        if new == old:
+            model_index = self.index(old)
+            self.dataChanged.emit(model_index, model_index)
+        else:
+            self.beginMoveRows(QtCore.QModelIndex(), old, old, QtCore.QModelIndex(),
+                               new if new < old else new + 1)
+            del self._rows[old]
+            self._rows.insert(new, row)
+            self._reindex(min(old, new), max(old, new))
+            self.endMoveRows()
+        return False
+
+    def remove_device(self, address):
+        if address not in self._index:
+            return
+        row = self._index.pop(address)
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self._rows[row]
+        del self._keys[row]
+        self._reindex(row, len(self._rows) - 1)
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self._keys = []
+        self._index = {}
+        self.endResetModel()
+
+
+class ScanDeviceDelegate(QtWidgets.QStyledItemDelegate):
+    """Paint a scanner row: RSSI icon, name/UUID and RSSI/services"""
+    MARGIN = 6
+
+    def __init__(self, SRC_PATH=None, parent=None):
+        super(ScanDeviceDelegate, self).__init__(parent)
+        self.SRC_PATH = SRC_PATH
+
+    def paint(self, painter, option, index):
+        row = index.data(ScanDeviceModel.RowRole)
+        painter.save()
+        if option.state & QtWidgets.QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+            painter.setPen(option.palette.highlightedText().color())
+        else:
+            painter.setPen(QtGui.QColor(0, 0, 0))
+        rect = option.rect
+        icon_top = rect.top() + (rect.height() - RSSI_ICON_SIZE) // 2
+        painter.drawPixmap(rect.left() + self.MARGIN, icon_top,
+                           rssi_pixmap(self.SRC_PATH, row.rssi_level))
+        text_rect = rect.adjusted(RSSI_ICON_SIZE + 3 * self.MARGIN, self.MARGIN,
+                                  -self.MARGIN, -self.MARGIN)
+        painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                         "{}\n\n{}".format(row.text_up, row.text_down))
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QtCore.QSize(option.rect.width(),
+                            max(RSSI_ICON_SIZE, 4 * option.fontMetrics.height()) + 2 * self.MARGIN)
 
 
 class BleScanner(QtWidgets.QWidget):
-    def __init__(self, log=None, SRC_PATH=None):
+    """
+    Streaming scanner, rows are inserted, updated or removed as the
+    shared :class:`bleico.scan_service.ScanService` table changes, and
+    scanning stops as soon as a device is selected.
+    """
+
+    def __init__(self, log=None, SRC_PATH=None, scan_service=None):
         super(BleScanner, self).__init__()
         self.setWindowTitle("Bleico Scanner")
         self.setMinimumSize(512, 512)
-        # Create QListWidget
+        # Create list view
         self._ble_scanner = None
         self.log = log
         self.layout = QtWidgets.QGridLayout()
-        self.myQListWidget = QtWidgets.QListWidget(self)
-        self.myQListWidget.clicked.connect(self.listview_clicked)
+        self.SRC_PATH = SRC_PATH
+        self.model = ScanDeviceModel(self)
+        self.deviceListView = QtWidgets.QListView(self)
+        self.deviceListView.setModel(self.model)
+        self.deviceListView.setItemDelegate(ScanDeviceDelegate(SRC_PATH=SRC_PATH,
+                                                               parent=self.deviceListView))
+        self.deviceListView.setUniformItemSizes(True)
+        self.deviceListView.clicked.connect(self.listview_clicked)
+        self.deviceListView.doubleClicked.connect(self.do_connect)
         self.selected_device = None
         self.device_to_connect = None
         self.devices = []
-        self._RSSI_icon = 'signal_{}.png'
-        self.SRC_PATH = SRC_PATH
-        # self.setCentralWidget(self.myQListWidget)
-        self.layout.addWidget(self.myQListWidget)
+        self.scanning = False
+        # SCAN EVENTS (ScanThread --> GUI thread)
+        if scan_service is None:
+            scan_service = get_scan_service(log=log)
+        self.scan_service = scan_service
+        self.scan_signals = WorkerSignals()
+        self.scan_signals.progress.connect(self.scan_event)
+        self._scan_callback = self.scan_signals.progress.emit
+        self.layout.addWidget(self.deviceListView)
         # ADD BUTTON WIDGETS
         self.scanButton = QtWidgets.QPushButton('Scan')
         self.connectButton = QtWidgets.QPushButton('Connect')
@@ -99,105 +252,69 @@ class BleScanner(QtWidgets.QWidget):
         hbox.addWidget(self.cancelButton)
         self.layout.addLayout(hbox, 1, 0)
         self.setLayout(self.layout)
-        # SPLASH SCREEN
-        self.splash_pix = QtGui.QPixmap(os.path.join(self.SRC_PATH, "bleico.png"), 'PNG')
-        self.scaled_splash = self.splash_pix.scaled(
-            512, 512, Qt.KeepAspectRatio, transformMode=Qt.SmoothTransformation)
-        self.splash = QtWidgets.QSplashScreen(
-            self.scaled_splash, Qt.WindowStaysOnTopHint)
-        self.splash.setWindowFlags(
-            Qt.WindowStaysOnTopHint | Qt.FramelessWindowHint)
-        self.splash.setEnabled(False)
-        self.splash.show()
-        self.splash.showMessage("Scanning for device...",
-                                Qt.AlignHCenter | Qt.AlignBottom, Qt.white)
-        self.do_scan()
-        self.splash.clearMessage()
-        self.splash.close()
-        if self.devices:
-            self.populate_items(self.devices)
+        self.start_scan()
         self.updateGeometry()
 
-    def do_scan(self):
-        self.devices = []
-        n = 0
+    def start_scan(self):
+        if self.scanning:
+            return
+        self.scanning = True
+        self.scanButton.setText('Stop')
         self.log.info('Scanning...')
-        while n < 3:
-            try:
-                self.devices = ble_scan()
-                n += 1
-                if len(self.devices) > 0:
-                    break
-                else:
-                    self.log.info('Scanning...')
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                print(e)
-                time.sleep(1)
-        if len(self.devices) == 0:
+        # last known devices (shared table and scan cache) are shown
+        # right away, the scan refreshes or expires them
+        self.clear_items()
+        self.devices = self.scan_service.recent_devices()
+        self.populate_items(self.devices)
+        self.scan_service.subscribe(self._scan_callback)
+
+    def stop_scan(self, wait=True):
+        """Stop scanning, waiting for the scanner to be stopped"""
+        if self.scanning:
+            self.scan_service.unsubscribe(self._scan_callback, wait=wait)
+            self.scan_finished()
+        elif wait:
+            self.scan_service.wait_stopped()
+
+    def scan_finished(self):
+        self.scanning = False
+        self.scanButton.setText('Scan')
+        if self.model.rowCount() == 0:
             self.log.info('No BLE device found')
         else:
-            self.devices = sorted(self.devices, key=lambda dev: dev.rssi)
-            self.devices.reverse()
-            self.log.info('BLE device/s found: {}'.format(len(self.devices)))
-            for dev in self.devices:
-                services = []
-                if hasattr(dev, 'metadata'):
-                    if isinstance(dev.metadata, dict):
-                        if 'uuids' in dev.metadata.keys():
-                            try:
-                                services = [uuidstr_to_str(serv.lower()) for serv in dev.metadata['uuids']]
-                            except Exception as e:
-                                services = []
-
-                self.log.info("NAME: {}, UUID: {}, RSSI: {} dBm".format(dev.name, dev.address,
-                                                          dev.rssi))
+            self.log.info('BLE device/s found: {}'.format(self.model.rowCount()))
+
+    def scan_event(self, event):
+        if event.kind == LOST:
+            self.model.remove_device(event.address)
+            self.devices = self.model.devices()
+        elif self.model.update_device(event.entry):
+            dev = event.entry
+            self.devices.append(dev)
+            self.log.info("NAME: {}, UUID: {}, RSSI: {} dBm".format(dev.name, dev.address,
+                                                                    dev.rssi))
 
     def listview_clicked(self):
-        item = self.myQListWidget.currentItem()
-        lw = self.myQListWidget.itemWidget(item)
-        self.selected_device = lw.deviceQLabel.text().split('\n')[-1].replace('UUID: ', '')
+        index = self.deviceListView.currentIndex()
+        if not index.isValid():
+            return
+        self.selected_device = index.data(ScanDeviceModel.AddressRole)
         self.log.info("Device selected: {}".format(self.selected_device))
+        # TARGET SELECTED: STOP SCANNING
+        self.stop_scan(wait=False)
         self.connectButton.setEnabled(True)
         self.saveButton.setEnabled(True)
 
     def populate_items(self, scan_list):
-        # scan list --> items
-        # for item in scan list:
+        # scan list --> rows
         for dev in scan_list:
-            try:
-                services = [uuidstr_to_str(serv.lower()) for serv in dev.metadata['uuids']]
-            except Exception as e:
-                services = []
-            icon = os.path.join(self.SRC_PATH, self._RSSI_icon.format(self.map_rssi_level_icon(dev.rssi)))
-            myQCustomQWidget = ScanDeviceItem()
-            myQCustomQWidget.setTextUp("{}\nUUID: {}".format(dev.name, dev.address))
-            myQCustomQWidget.setTextDown("RSSI: {} dBm  Services: {}".format(dev.rssi, ','.join(services)))
-            myQCustomQWidget.setIcon(icon)
-            # Create QListWidgetItem
-            myQListWidgetItem = QtWidgets.QListWidgetItem(self.myQListWidget)
-            # Set size hint
-            myQListWidgetItem.setSizeHint(myQCustomQWidget.sizeHint())
-            # Add QListWidgetItem into QListWidget
-            self.myQListWidget.addItem(myQListWidgetItem)
-            self.myQListWidget.setItemWidget(
-                myQListWidgetItem, myQCustomQWidget)
+            self.model.update_device(dev)
 
     def map_rssi_level_icon(self, rssi):
-        if rssi <= (-90):  # LEVEL 0 --> VERY_LOW
-            return "VERY_LOW"
-        elif rssi > (-90) and rssi <= (-80):  # LEVEL 1 --> LOW
-            return "LOW"
-        elif rssi > (-80) and rssi <= (-70):  # LEVEL 2 --> GOOD
-            return "GOOD"
-        elif rssi > (-70) and rssi <= (-60):  # LEVEL 3 --> VERY_GOOD
-            return "VERY_GOOD"
-        elif rssi > (-60):  # LEVEL 4 --> EXCELLENT
-            return "EXCELLENT"
+        return map_rssi_level_icon(rssi)
 
     def clear_items(self):
-        self.myQListWidget.clear()
+        self.model.clear()
 
     def do_save(self):
         if self.selected_device:
@@ -208,24 +325,28 @@ class BleScanner(QtWidgets.QWidget):
 
     def do_connect(self):
         if self.selected_device:
+            # scanner must be stopped before connecting
+            self.stop_scan()
             self.hide()
             self.device_to_connect = self.selected_device
             self.log.info("Connecting to: {}".format(self.selected_device))
 
     def scan_again(self):
+        if self.scanning:
+            self.stop_scan(wait=False)
+            return
         self.connectButton.setEnabled(False)
         self.saveButton.setEnabled(False)
-        self.devices = []
-        self.clear_items()
-        self.do_scan()
-        if self.devices:
-            self.populate_items(self.devices)
+        self.selected_device = None
+        self.start_scan()
 
     def cancel_and_exit(self):
+        self.stop_scan()
         self.hide()
         self.device_to_connect = 'CANCEL'
 
     def closeEvent(self, event):
+        self.stop_scan()
         self.device_to_connect = 'CANCEL'
         print(self.device_to_connect)
         event.accept()
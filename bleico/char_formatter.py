@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from datetime import datetime
+
+
+# FIELD VALUE PRIMITIVES (same output as BLE_DEVICE.pformat_*)
+
+def value_text(field_data):
+    try:
+        return "{} {}".format(field_data['Value'], field_data['Symbol'])
+    except Exception as e:
+        if 'RR-Interval' in field_data:
+            field_interval_data = field_data['RR-Interval']
+            return ','.join(['{} {}'.format(field_interval_data[interval]['Value'],
+                                            field_interval_data[interval]['Symbol'])
+                             for interval in field_interval_data])
+        else:
+            return "{}".format(field_data['Value'])
+
+
+def timestamp_text(field_data):
+    field_values = []
+    for dt in field_data:
+        if field_data[dt]['Unit'] == 'month':
+            val = datetime.strptime(field_data[dt]['Value'], '%B').month
+        else:
+            val = field_data[dt]['Value']
+        field_values.append(val)
+    try:
+        return datetime.strftime(datetime(*field_values), "%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        return None
+
+
+def plain_text(field):
+    val = ""
+    for k in field:
+        if 'Value' in field[k]:
+            try:
+                val += "{}: {} {} ; ".format(k, field[k]['Value'], field[k]['Symbol'])
+            except Exception as e:
+                val += "{}: {} ; ".format(k, field[k]['Value'])
+        else:
+            val += plain_text(field[k]) or ""
+    if val != "":
+        return val
+
+
+def ref_char_text(char_value):
+    for field in char_value:
+        if 'Value' in char_value[field]:
+            return '{} {}'.format(field, char_value[field]['Value'])
+        else:
+            return "{}: {}".format(field, plain_text(char_value[field]))
+
+
+def char_values_text(data, sep=','):
+    try:
+        return sep.join(["{} {}".format(data[key]['Value'], data[key]['Symbol'])
+                         for key in data])
+    except Exception as e:
+        return sep.join(["{}".format(data[key]['Value']) for key in data])
+
+
+class FormattedValue:
+    """
+    Result of formatting a decoded characteristic value.
+
+    updates
+        `list` of (action, text) to apply to the menu
+    tooltip
+        `list` of (field, text) tooltip fragments
+    summary
+        `str` one line value, used in desktop notifications
+    log_lines
+        `list` of `str` to log
+    """
+    __slots__ = ('updates', 'tooltip', 'summary', 'log_lines')
+
+    def __init__(self):
+        self.updates = []
+        self.tooltip = []
+        self.summary = ''
+        self.log_lines = []
+
+
+class CharFormatter:
+    """
+    Formatter compiled once per characteristic from its xml definition.
+
+    All the field branches (single value, bitfields, references,
+    Date Time) are decided here, so :meth:`format` only walks the
+    compiled field list. ``format(value, notification=False)`` returns a
+    :class:`FormattedValue`.
+
+    :param char: characteristic name
+    :param xml_char: characteristic xml definition (``BLE_DEVICE.chars_xml[char]``)
+    :param service: service name the characteristic belongs to
+    :param actions: `dict` of field or bitfield name --> menu action
+    """
+
+    SINGLE = 'single'
+    SINGLE_BITFIELD = 'single_bitfield'
+    MULTIPLE = 'multiple'
+
+    # FIELD TYPES
+    _VALUE = 0
+    _REFERENCE = 1
+    _BITFIELD = 2
+
+    def __init__(self, char, xml_char, service=None, actions=None):
+        self.char = char
+        self.service = service
+        self.actions = actions if actions is not None else {}
+        self.fields = list(xml_char.fields)
+        self._plan = []
+        if len(xml_char.fields) == 1:
+            field = self.fields[0]
+            if 'BitField' in xml_char.fields[field]:
+                self.kind = self.SINGLE_BITFIELD
+                self._plan = [(field, [(bf, self.actions.get(bf), "{}: ".format(bf))
+                                       for bf in xml_char.fields[field]['BitField']])]
+                self.format = self._format_single_bitfield
+            else:
+                self.kind = self.SINGLE
+                self._plan = [(field, self.actions.get(field))]
+                self.format = self._format_single
+        else:
+            self.kind = self.MULTIPLE
+            for field, field_def in xml_char.fields.items():
+                if 'BitField' in field_def:
+                    bitfields = {bf: (self.actions.get(bf), "{}: ".format(bf))
+                                 for bf in field_def['BitField']}
+                    self._plan.append((field, self._BITFIELD, bitfields,
+                                       "[{}] {} ({}) ".format(service, char, field)))
+                elif "Reference" in field_def:
+                    self._plan.append((field, self._REFERENCE,
+                                       self._compile_reference(field, field_def["Reference"]),
+                                       self.actions.get(field)))
+                else:
+                    self._plan.append((field, self._VALUE, value_text,
+                                       self.actions.get(field)))
+            self.format = self._format_multiple
+        # LOG PREFIXES
+        self._log_prefix = "[{}] ".format(service)
+        self._log_char_prefix = "[{}] {} ".format(service, char)
+
+    def _compile_reference(self, field, reference):
+        if reference == 'Date Time':
+            def ref_fn(field_data):
+                ref_data = field_data[reference]
+                if reference in ref_data:
+                    return value_text(ref_data[reference])
+                elif field in ref_data:
+                    return value_text(ref_data[field])
+                return timestamp_text(ref_data)
+        else:
+            def ref_fn(field_data):
+                ref_data = field_data[reference]
+                if reference in ref_data:
+                    return value_text(ref_data[reference])
+                elif field in ref_data:
+                    return value_text(ref_data[field])
+                return ref_char_text(field_data)
+        return ref_fn
+
+    def _format_single(self, data, notification=False):
+        fvalue = FormattedValue()
+        field, action = self._plan[0]
+        fvalue.summary = char_values_text(data)
+        char_text = "{}: {}".format(self.char, fvalue.summary)
+        if action is not None:
+            fvalue.updates.append((action, char_text))
+        # notifications label the tooltip with the field, reads with the characteristic
+        fvalue.tooltip.append((field, "{}: {}".format(field, fvalue.summary)
+                               if notification else char_text))
+        fvalue.log_lines.append(self._log_prefix + char_text)
+        return fvalue
+
+    def _format_single_bitfield(self, data, notification=False):
+        fvalue = FormattedValue()
+        field, bitfields = self._plan[0]
+        if field in data:
+            bitflagdict = data[field]['Value']
+        else:
+            bitflagdict = data[self.char]['Value']
+        for bf, action, prefix in bitfields:
+            if bf in bitflagdict:
+                bitfield_text = prefix + str(bitflagdict[bf])
+                if action is not None:
+                    fvalue.updates.append((action, bitfield_text))
+                fvalue.tooltip.append((bf, bitfield_text))
+                fvalue.log_lines.append(self._log_char_prefix + bitfield_text)
+        fvalue.summary = '\n'.join([str(v) for v in bitflagdict.values()])
+        return fvalue
+
+    def _format_multiple(self, data, notification=False):
+        fvalue = FormattedValue()
+        field_strings = []
+        for field, field_type, fn, target in self._plan:
+            if field not in data:
+                continue
+            if field_type != self._BITFIELD:
+                field_val = fn(data[field])
+                field_text = "{}: {}".format(field, field_val)
+                if target is not None:
+                    fvalue.updates.append((target, field_text))
+                fvalue.tooltip.append((field, field_text))
+                fvalue.log_lines.append(self._log_char_prefix + field_text)
+                field_strings.append(str(field_val))
+            else:
+                bitflagdict = data[field]['Value']
+                for bf in bitflagdict:
+                    action, prefix = fn.get(bf, (None, "{}: ".format(bf)))
+                    bitfield_text = prefix + str(bitflagdict[bf])
+                    if action is not None:
+                        fvalue.updates.append((action, bitfield_text))
+                    fvalue.tooltip.append((bf, bitfield_text))
+                    fvalue.log_lines.append(target + bitfield_text)
+                    field_strings.append(str(bitflagdict[bf]))
+        fvalue.summary = ', '.join(field_strings)
+        return fvalue
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+# read once on connection (device information) or notified, never polled
+AVOID_CHARS = ['Appearance', 'Manufacturer Name String',
+               'Battery Power State', 'Model Number String',
+               'Firmware Revision String', 'Serial Number String',
+               'Hardware Revision String',
+               'Software Revision String']
+INFO_SERVICE = 'Device Information'
+
+
+class CharacteristicState:
+    """
+    Menu actions and last known value of a characteristic, one per handle.
+
+    action
+        characteristic menu action, or submenu if it has multiple fields
+    field_actions
+        `dict` field or bitfield name --> action
+    bitfield_actions
+        `dict` field --> {bitfield name: action}
+    write_actions
+        `dict` enumeration value or ``'set_value'`` --> action
+    texts
+        `dict` field or bitfield name --> last formatted text
+    """
+    __slots__ = ('handle', 'char', 'service', 'xml_char',
+                 'readable', 'notifiable', 'writeable',
+                 'action', 'field_actions', 'bitfield_actions',
+                 'notify_menu', 'notify_action', 'desktop_notify_action',
+                 'desktop_notify', 'notifying',
+                 'write_menu', 'write_actions', 'set_value_box',
+                 'formatter', 'raw', 'value', 'texts',
+                 'last_read', 'last_notify')
+
+    def __init__(self, handle, char, service=None, xml_char=None,
+                 readable=False, notifiable=False, writeable=False):
+        self.handle = handle
+        self.char = char
+        self.service = service
+        self.xml_char = xml_char
+        self.readable = readable
+        self.notifiable = notifiable
+        self.writeable = writeable
+        # MENU
+        self.action = None
+        self.field_actions = {}
+        self.bitfield_actions = {}
+        # NOTIFY
+        self.notify_menu = None
+        self.notify_action = None
+        self.desktop_notify_action = None
+        self.desktop_notify = True
+        self.notifying = False
+        # WRITE
+        self.write_menu = None
+        self.write_actions = {}
+        self.set_value_box = None
+        # VALUE
+        self.formatter = None
+        self.raw = None
+        self.value = None
+        self.texts = {}
+        self.last_read = None
+        self.last_notify = None
+
+    def slot_actions(self):
+        """field or bitfield name --> action, as used by CharFormatter"""
+        if self.field_actions:
+            slot_actions = dict(self.field_actions)
+            for field in self.bitfield_actions:
+                slot_actions.update(self.bitfield_actions[field])
+            return slot_actions
+        return {field: self.action for field in self.texts}
+
+
+def build_char_states(dev):
+    """
+    Create the handle --> CharacteristicState table for a BLE_DEVICE
+    """
+    char_states = {}
+    for serv, handles in dev.services_rsum_handles.items():
+        for char_handle in handles:
+            if char_handle in dev.readables_handles:
+                char = dev.readables_handles[char_handle]
+            elif char_handle in dev.notifiables_handles:
+                char = dev.notifiables_handles[char_handle]
+            elif char_handle in dev.writeables_handles:
+                char = dev.writeables_handles[char_handle]
+            else:
+                continue
+            char_states[char_handle] = CharacteristicState(
+                char_handle, char, service=serv,
+                xml_char=dev.chars_xml.get(char),
+                readable=char_handle in dev.readables_handles,
+                notifiable=char_handle in dev.notifiables_handles,
+                writeable=char_handle in dev.writeables_handles)
+    return char_states
+
+
+def is_polled(char_state):
+    """`True` if the characteristic is read every poll cycle (tray and daemon)"""
+    return (char_state.readable and char_state.xml_char is not None and
+            char_state.service != INFO_SERVICE and char_state.char not in AVOID_CHARS)
+
+
+def poll_char_states(char_states):
+    """CharacteristicStates read every poll cycle, in handle order"""
+    return [char_state for char_state in char_states.values() if is_polled(char_state)]
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import asyncio
+import json
+import signal
+import sys
+import threading
+import time
+import traceback
+from bleico.char_state import build_char_states, poll_char_states, is_polled
+from bleico.value_pipeline import ValuePipeline
+from bleico.device_poller import DevicePoller
+from bleico.gatt_ops import ValueCodec
+from bleico.gatt_profile import GattProfile
+from bleico.scan_service import get_scan_service, connect_first
+from bleico.stage_timer import TIMINGS, NOTIFY_CALLBACK
+from bleico.metrics import METRICS, NOTIFICATIONS
+
+
+class NdjsonWriter:
+    """
+    Write records as newline-delimited JSON to a file or stdout (``'-'``).
+
+    Lines go through a large write buffer that is flushed every
+    ``flush_interval`` seconds (and on :meth:`close`) instead of after
+    every line; :meth:`tick` flushes lines left in the buffer when no new
+    line comes. If the output fails (e.g. a closed pipe) the error is
+    kept in :attr:`error` and further records are dropped.
+    """
+
+    def __init__(self, path='-', buffer_size=1 << 16, flush_interval=1.0):
+        self.path = path
+        if path == '-':
+            self._file = open(sys.stdout.fileno(), 'w', buffering=buffer_size,
+                              closefd=False)
+        else:
+            self._file = open(path, 'a', buffering=buffer_size)
+        self._encode = json.JSONEncoder(separators=(',', ':'), default=str).encode
+        self._lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._unflushed = False
+        self.lines = 0
+        self.error = None
+
+    def write(self, record):
+        line = self._encode(record)
+        with self._lock:
+            if self.error is not None:
+                return
+            try:
+                self._file.write(line)
+                self._file.write('\n')
+                self.lines += 1
+                now = time.monotonic()
+                if now - self._last_flush >= self.flush_interval:
+                    self._file.flush()
+                    self._last_flush = now
+                    self._unflushed = False
+                else:
+                    self._unflushed = True
+            except OSError as e:
+                self.error = e
+
+    def tick(self):
+        # called periodically: flush what the last write() left buffered
+        if self._unflushed and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self.error is not None:
+                return
+            try:
+                self._file.flush()
+            except OSError as e:
+                self.error = e
+            self._last_flush = time.monotonic()
+            self._unflushed = False
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self.path != '-':
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+
+
+class HeadlessDaemon:
+    """
+    Connect to a device and write its decoded values as NDJSON, no Qt.
+
+    Polls the same characteristics as the system tray every
+    ``read_timeout`` seconds (:func:`bleico.char_state.poll_char_states`,
+    device information is read once) and subscribes to
+    every notifiable one, with the same reconnect behaviour
+    (:class:`bleico.device_poller.DevicePoller`).
+    Each value is written as::
+
+        {"t": ..., "address": ..., "service": ..., "char": ..., "handle": ...,
+         "notify": false, "value": {...}, "raw": "hex"}
+
+    and connection changes as ``{"t": ..., "address": ..., "event": ...}``.
+
+    With ``api`` (port number or unix socket path) the values are also
+    served to local clients by a :class:`bleico.api_server.ApiServer`
+    on the device event loop.
+    """
+
+    def __init__(self, target, read_timeout=1, output='-', notify=True,
+                 max_tries=0, api=None, scan_service=None, log=None):
+        self.target = target
+        self.read_timeout = read_timeout
+        self.notify = notify
+        self.max_tries = max_tries
+        self.log = log
+        self.scan_service = scan_service or get_scan_service(log=log)
+        self.writer = NdjsonWriter(output)
+        self.dev = None
+        self.char_states = {}
+        self.value_pipeline = None
+        self.profile = None
+        self.codec = ValueCodec()
+        self.poller = None
+        self.api = None
+        if api is not None:
+            from bleico.api_server import ApiServer
+            self.api = ApiServer(self, api, log=log)
+        self._quit = False
+
+    def connect(self):
+        self.dev = connect_first(self.target, scan_service=self.scan_service, log=self.log)
+        n_tries = 0
+        while self.dev is None or not self.dev.connected:
+            if n_tries >= self.max_tries or self._quit:
+                self.log.error("Device {} not found".format(self.target))
+                return False
+            self.dev = connect_first(self.target, scan_service=self.scan_service,
+                                     log=self.log)
+            n_tries += 1
+        self.dev.set_disconnected_callback(self.dev.disconnection_callback)
+        self.update_profile()
+        self.event('connected')
+        return True
+
+    def update_profile(self):
+        try:
+            self.profile = GattProfile.from_services(self.dev.UUID, self.dev.ble_client.services)
+        except Exception as e:
+            self.log.error(traceback.format_exc())
+
+    def sleep(self, seconds):
+        # keep the device event loop running to receive notifications
+        self.dev.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def make_record(self, handle, raw, notification=False):
+        char_state = self.char_states.get(handle)
+        if char_state is not None and char_state.xml_char is not None:
+            return {'t': time.time(), 'address': self.dev.UUID,
+                    'service': char_state.service, 'char': char_state.char,
+                    'handle': handle, 'notify': notification,
+                    'value': self.value_pipeline.decode(char_state, raw,
+                                                        notification=notification),
+                    'raw': raw.hex()}
+        gatt_char = self.profile.resolve(str(handle)) if self.profile else None
+        char = gatt_char.name if gatt_char else str(handle)
+        return {'t': time.time(), 'address': self.dev.UUID,
+                'service': gatt_char.service if gatt_char else None, 'char': char,
+                'handle': handle, 'notify': notification,
+                'value': self.codec.decode(char, raw)[0], 'raw': raw.hex()}
+
+    def output(self, record):
+        self.writer.write(record)
+        if self.api is not None:
+            self.api.publish(record)
+
+    def write_value(self, char_state, raw, notification=False):
+        self.output(self.make_record(char_state.handle, raw, notification=notification))
+
+    def write_static_values(self):
+        # device information etc.: read once, not polled (same set as the tray)
+        for char_state in self.char_states.values():
+            if char_state.readable and char_state.xml_char is not None and \
+                    not char_state.notifying and not is_polled(char_state):
+                if not self.dev.connected:
+                    return
+                try:
+                    raw = self.dev.read_char(char_state.char, data_fmt='raw',
+                                             handle=char_state.handle)
+                    if raw is not None:
+                        self.write_value(char_state, raw)
+                except Exception as e:
+                    self.log.error(traceback.format_exc())
+
+    def notify_callback(self, sender_handle, data):
+        t0 = TIMINGS.start()
+        try:
+            char_state = self.char_states[sender_handle]
+            if METRICS.enabled:
+                METRICS.inc(NOTIFICATIONS, char_state.char)
+            self.write_value(char_state, bytes(data), notification=True)
+            if t0:
+                TIMINGS.stop(NOTIFY_CALLBACK, char_state.char, t0)
+        except Exception as e:
+            self.log.error(traceback.format_exc())
+
+    def start_notify(self):
+        for char_state in self.char_states.values():
+            if char_state.notifiable:
+                try:
+                    self.dev.loop.run_until_complete(
+                        self.dev.ble_client.start_notify(char_state.handle,
+                                                         self.notify_callback))
+                    char_state.notifying = True
+                    self.log.info('Started Notification on: {}'.format(char_state.char))
+                except Exception as e:
+                    char_state.notifying = False
+                    self.log.error("Char: {}, Error: {}".format(char_state.char, e))
+
+    def stop_notify(self):
+        for char_state in self.char_states.values():
+            if char_state.notifying:
+                char_state.notifying = False
+                try:
+                    self.dev.loop.run_until_complete(
+                        self.dev.ble_client.stop_notify(char_state.handle))
+                except Exception as e:
+                    self.log.error("Char: {}, Error: {}".format(char_state.char, e))
+
+    def event(self, name):
+        self.output({'t': time.time(), 'address': self.dev.UUID, 'event': name})
+
+    def progress(self, message):
+        if self.writer.error is not None and not self._quit:
+            self.log.error("Output error: {}".format(self.writer.error))
+            self.stop()
+        self.writer.tick()
+        if isinstance(message, dict):
+            if 'DEVICE_RSSI' in message:
+                self.output({'t': time.time(), 'address': self.dev.UUID,
+                             'rssi': message['DEVICE_RSSI']})
+        elif message == 'connected':
+            # new client, subscribe again
+            self.dev.set_disconnected_callback(self.dev.disconnection_callback)
+            self.update_profile()
+            self.event(message)
+            if self.notify:
+                self.start_notify()
+        elif message in ('disconnected', 'reconnecting'):
+            for char_state in self.char_states.values():
+                char_state.notifying = False
+            self.event(message)
+            self.writer.flush()
+
+    def stop(self, *args):
+        self._quit = True
+        if self.poller is not None:
+            self.poller.stop()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            if not self.connect():
+                return 1
+            self.char_states = build_char_states(self.dev)
+            self.value_pipeline = ValuePipeline(self.char_states, dev=self.dev, log=self.log)
+            if self.notify:
+                self.start_notify()
+            if self.api is not None:
+                self.dev.loop.run_until_complete(self.api.start())
+            self.write_static_values()
+            self.poller = DevicePoller(self.dev, poll_char_states(self.char_states),
+                                       self.write_value,
+                                       read_timeout=self.read_timeout,
+                                       scan_service=self.scan_service,
+                                       sleep=self.sleep, scan_wait=0.1, log=self.log)
+            if self._quit:
+                self.poller.stop()
+            self.poller.run(self.progress)
+            self.event('finished')
+            return 0 if self.writer.error is None else 1
+        finally:
+            if self.api is not None and self.api.server is not None:
+                self.dev.loop.run_until_complete(self.api.stop())
+            if self.dev is not None and self.dev.connected:
+                self.stop_notify()
+                self.log.info("Disconnecting Device...")
+                try:
+                    self.dev.disconnect()
+                except Exception as e:
+                    self.log.error(e)
+            self.writer.close()
+            for line in TIMINGS.report():
+                self.log.info("Timings: {}".format(line))
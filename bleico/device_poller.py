@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import time
+import traceback
+from bleico.stage_timer import TIMINGS, POLL_CYCLE
+from bleico.metrics import METRICS, DISCONNECTS, RECONNECT_DURATION, CONNECTED
+from bleico.gatt_trace import TRACE
+
+
+class DisconnectionError(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+        else:
+            self.message = None
+
+    def __str__(self):
+        if self.message:
+            return 'DisconnectionError, {0} '.format(self.message)
+        else:
+            return 'DisconnectionError has been raised'
+
+
+class DevicePoller:
+    """
+    Poll and reconnect loop of a BLE_DEVICE, without Qt.
+
+    Every ``read_timeout`` seconds reads the characteristics in
+    ``char_states`` that are not notifying, calling
+    ``on_value(char_state, raw)``, and the RSSI. If the device
+    disconnects it reconnects, waiting up to 30 seconds between tries or
+    until the device advertises again (shared scan).
+
+    :meth:`run` reports progress calling ``emit(message)``:
+    ``{'DEVICE_RSSI': rssi}``, ``'timeupdate'``, ``'disconnecting'``,
+    ``'disconnected'``, ``'reconnecting'``, ``['reconnect', i]``,
+    ``'connected'``, ``False`` (read error) and ``'finished'``.
+
+    :param sleep: ``sleep(seconds)`` between ticks, e.g. one that keeps
+        the device event loop running to receive notifications
+    :param scan_wait: seconds of each reconnect wait step blocked on the
+        scan, the rest of the second is spent in ``sleep``
+    """
+
+    def __init__(self, dev, char_states, on_value, read_timeout=1,
+                 scan_service=None, sleep=time.sleep, scan_wait=1, log=None):
+        self.dev = dev
+        self.char_states = char_states
+        self.on_value = on_value
+        self.read_timeout = read_timeout
+        self.scan_service = scan_service
+        self.sleep = sleep
+        self.scan_wait = scan_wait
+        self.log = log
+        self.quit = False
+        self.done = False
+        self._timeout_count = read_timeout - 1
+        self._t_disconnected = None
+
+    def stop(self):
+        self.quit = True
+        self.dev.break_flag = True
+
+    def run(self, emit):
+        connect_loop = False
+        char = None
+        self.done = False
+        self.dev.break_flag = self.quit
+        while not self.quit:
+            if not connect_loop:
+                self._timeout_count += 1
+                try:
+                    if self.read_timeout == self._timeout_count:
+                        t0 = TIMINGS.start()
+                        t_trace = TRACE.start()
+                        for char_state in self.char_states:
+                            char = char_state.char
+                            if not char_state.notifying:
+                                if self.quit:
+                                    break
+                                raw = self.dev.read_char(char, data_fmt="raw",
+                                                         handle=char_state.handle)
+                                self.on_value(char_state, raw)
+                        emit({'DEVICE_RSSI': self.dev.get_RSSI()})
+                        if t0:
+                            TIMINGS.stop(POLL_CYCLE, "{} chars".format(len(self.char_states)), t0)
+                        if t_trace:
+                            TRACE.complete('poll_cycle', t_trace, chars=len(self.char_states))
+                        self._timeout_count = 0
+                    else:
+                        if self.dev.is_connected():
+                            emit('timeupdate')
+                        else:
+                            raise DisconnectionError('Device {} disconnected'.format(self.dev.name))
+                except (TypeError, DisconnectionError) as e:
+                    self.log.error("Char: {}, Error: {}".format(char, e))
+                    if self.dev.is_connected():
+                        self.log.info('Disconnecting...')
+                        emit('disconnecting')
+                        self.log.info('Connected: {}'.format(self.dev.is_connected()))
+                        while not self.quit:
+                            self.log.info('Assert Disconnection...')
+                            try:
+                                self.dev.disconnect(timeout=1)
+                                self.sleep(1)
+                                break
+                            except Exception as e:
+                                self.log.error('Disconnection timeout')
+                                self.sleep(5)
+                    else:
+                        self.log.info("Device disconnected")
+                        emit('disconnected')
+                        self.dev.connected = False
+                        self.disconnected()
+                        connect_loop = True
+                        self.sleep(4)
+                except Exception as e:
+                    self.log.error("Char: {}, Error: {}".format(char, traceback.format_exc()))
+                    emit(False)
+                    if self.dev.is_connected():
+                        self._timeout_count = 0
+                    else:
+                        self.log.info("Device disconnected")
+                        emit('disconnected')
+                        self.dev.connected = False
+                        self.disconnected()
+                        connect_loop = True
+                        self.sleep(4)
+            else:
+                self._timeout_count = 0
+                self.log.info("Trying to reconnect...")
+                emit('reconnecting')
+                self.dev.connect()
+                if self.dev.connected:
+                    self.log.info("Device reconnected...")
+                    if self._t_disconnected is not None:
+                        METRICS.observe(RECONNECT_DURATION,
+                                        time.monotonic() - self._t_disconnected)
+                        self._t_disconnected = None
+                    emit('connected')
+                    connect_loop = False
+                else:
+                    self.log.info("Device unreachable...")
+                    self.log.info("Trying again in 30 seconds or when the device advertises")
+                    t_trace = TRACE.start()
+                    self.wait_advertising(emit)
+                    if t_trace:
+                        TRACE.complete('wait_advertising', t_trace)
+            if self.quit:
+                break
+            t_trace = TRACE.start()
+            self.sleep(1)
+            if t_trace:
+                TRACE.complete('sleep', t_trace)
+        emit("finished")
+        self.done = True
+        self.log.info("FINISHED")
+
+    def disconnected(self):
+        METRICS.inc(DISCONNECTS)
+        METRICS.set(CONNECTED, 0)
+        self._t_disconnected = time.monotonic()
+
+    def wait_advertising(self, emit):
+        # WAIT FOR ADVERTISEMENTS OF THE DEVICE (shared scan)
+        t_unreachable = time.time()
+        self.scan_service.acquire()
+        try:
+            for i in range(29):
+                emit(['reconnect', i])
+                entry = self.scan_service.wait_for(self.dev.UUID, timeout=self.scan_wait,
+                                                   since=t_unreachable)
+                if entry is not None:
+                    self.log.info("Device advertising, RSSI: {} dBm".format(entry.rssi))
+                    break
+                if self.scan_wait < 1:
+                    self.sleep(1 - self.scan_wait)
+                if self.quit:
+                    break
+        finally:
+            self.scan_service.release()
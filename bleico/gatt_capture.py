@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Capture file format (little endian):
+#
+#   header   8s magic b'BLEICAP\0', H version, H flags, I reserved
+#   records  I body length, I crc32(body), body: B type + payload
+#
+#   DEVICE  H device id, address (utf8)
+#   READ    d time, H device id, H handle, raw value
+#   NOTIFY  d time, H device id, H handle, raw value
+#   WRITE   d time, H device id, H handle, raw value (write request)
+#   WRITE_COMMAND  same, write without response
+#   INDEX   Q previous INDEX offset, Q block offset, I records, d first time,
+#           d last time, addresses of the device ids so far ('\n' separated)
+#   END     Q last INDEX offset, written on close
+#   PROFILE H device id, GATT table of the device (JSON, see gatt_table),
+#           after its DEVICE record in every file and on each connection
+#
+# An INDEX record follows every block of ``index_interval`` values, so a
+# closed file can be searched by time walking the INDEX chain back from
+# END. A file cut short (crash) is still readable up to its last whole
+# record.
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from bleico.batch_writer import BatchWriter
+
+MAGIC = b'BLEICAP\x00'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sHHI')
+RECORD_HEADER = struct.Struct('<II')
+VALUE = struct.Struct('<dHH')
+INDEX = struct.Struct('<QQIdd')
+END = struct.Struct('<Q')
+
+DEVICE, READ, NOTIFY, INDEX_BLOCK, END_BLOCK, PROFILE, WRITE, WRITE_COMMAND = range(1, 9)
+KINDS = {READ: 'read', NOTIFY: 'notify', WRITE: 'write', WRITE_COMMAND: 'write-command'}
+NO_HANDLE = 0xFFFF
+
+
+def gatt_table(services):
+    """
+    bleak services --> `list` of {uuid, handle, chars: [{uuid, handle,
+    properties, descriptors: [{uuid, handle}]}]}, the GATT table stored
+    in PROFILE records
+    """
+    return [{'uuid': service.uuid, 'handle': service.handle,
+             'chars': [{'uuid': char.uuid, 'handle': char.handle,
+                        'properties': list(char.properties),
+                        'descriptors': [{'uuid': descriptor.uuid, 'handle': descriptor.handle}
+                                        for descriptor in char.descriptors]}
+                       for char in service.characteristics]}
+            for service in services]
+
+
+def rotated_paths(path):
+    """Capture files of ``path``, oldest first: rotated ones, then ``path``"""
+    stem, ext = os.path.splitext(os.path.expanduser(path))
+    paths = sorted(glob.glob(glob.escape(stem) + '.*' + ext))
+    if os.path.exists(stem + ext):
+        paths.append(stem + ext)
+    return paths
+
+
+class GattCapture(BatchWriter):
+    """
+    Append-only binary log of raw GATT values (reads and notifications).
+
+    :meth:`record` only queues the value (see
+    :class:`bleico.batch_writer.BatchWriter`), each batch is encoded and
+    written in one write.
+
+    When the file reaches ``max_bytes`` it is closed and renamed
+    ``<name>.<YYYYmmdd-HHMMSS-mmm><ext>`` and a new one is started; an
+    existing file is moved aside the same way on :meth:`start`.
+    """
+    thread_name = 'CaptureThread'
+
+    def __init__(self, max_bytes=64 << 20, index_interval=4096, flush_interval=0.5,
+                 batch_size=1024, max_pending=1 << 16, log=None):
+        super().__init__(flush_interval=flush_interval, batch_size=batch_size,
+                         max_pending=max_pending, log=log)
+        self.max_bytes = max_bytes
+        self.index_interval = index_interval
+        self.path = None
+        self.enabled = False
+        self._profiles = {}  # address --> last PROFILE payload
+        self.records = 0
+        self.files = 0
+        self._file = None
+
+    def start(self, path):
+        self.path = os.path.expanduser(path)
+        if os.path.exists(self.path):
+            self._move_aside()
+        self._open()
+        self._start_thread()
+        self.enabled = True
+        if self.log:
+            self.log.info('Capturing raw values to {}'.format(self.path))
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.enabled = False
+        self._stop_thread()
+        self._close()
+        if self.log:
+            self.log.info('Captured {} values in {} files, {} dropped'.format(
+                self.records, self.files, self.dropped))
+
+    def set_profile(self, address, services):
+        """
+        Queue the GATT table of a device (bleak services), on each
+        connection. It is never dropped, even over ``max_pending``: the
+        reader needs it to name the handles of the records that follow.
+        """
+        profile = json.dumps(gatt_table(services)).encode()
+        with self._lock:
+            self.pending.append((time.time(), PROFILE, address, None, profile))
+
+    def record(self, kind, address, handle, data):
+        """Queue a raw value, ``kind``: READ, NOTIFY, WRITE or WRITE_COMMAND"""
+        self._queue((time.time(), kind, address, handle, data))
+
+    # WRITER THREAD
+
+    def _write_pending(self):
+        # self._size counts the buffered bytes too
+        buffer = bytearray()
+        while self.pending:
+            t, kind, address, handle, data = self.pending.popleft()
+            if self._size >= self.max_bytes and self._size > FILE_HEADER.size:
+                self._file.write(buffer)
+                buffer = bytearray()
+                self._rotate()
+            device_id = self._devices.get(address)
+            if device_id is None:
+                device_id = self._devices[address] = len(self._devices)
+                buffer += self._encode(DEVICE, struct.pack('<H', device_id) +
+                                       str(address).encode())
+                if kind != PROFILE and address in self._profiles:
+                    buffer += self._encode(PROFILE, struct.pack('<H', device_id) +
+                                           self._profiles[address])
+            if kind == PROFILE:
+                self._profiles[address] = data
+                buffer += self._encode(PROFILE, struct.pack('<H', device_id) + data)
+                continue
+            if not self._block_count:
+                self._block_offset = self._size
+                self._block_t_first = t
+            buffer += self._encode(kind, VALUE.pack(t, device_id,
+                                                    NO_HANDLE if handle is None else handle)
+                                   + bytes(data))
+            self._block_count += 1
+            self._block_t_last = t
+            self.records += 1
+            if self._block_count >= self.index_interval:
+                buffer += self._index()
+        if buffer:
+            self._file.write(buffer)
+            self._file.flush()
+
+    def _encode(self, kind, payload):
+        body = bytes((kind,)) + payload
+        self._size += RECORD_HEADER.size + len(body)
+        return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+    def _index(self):
+        offset = self._size
+        addresses = [address for address, _ in sorted(self._devices.items(),
+                                                      key=lambda item: item[1])]
+        record = self._encode(INDEX_BLOCK, INDEX.pack(
+            self._last_index, self._block_offset, self._block_count, self._block_t_first,
+            self._block_t_last) + '\n'.join(str(address) for address in addresses).encode())
+        self._last_index = offset
+        self._block_count = 0
+        return record
+
+    def _open(self):
+        self._file = open(self.path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, 0))
+        self._size = FILE_HEADER.size
+        self._devices = {}  # address --> device id, per file
+        self._last_index = 0
+        self._block_count = 0
+        self._block_offset = 0
+        self._block_t_first = self._block_t_last = 0
+        self.files += 1
+
+    def _close(self):
+        if self._file is None:
+            return
+        tail = bytearray()
+        if self._block_count:
+            tail += self._index()
+        tail += self._encode(END_BLOCK, END.pack(self._last_index))
+        self._file.write(tail)
+        self._file.close()
+        self._file = None
+
+    def _rotate(self):
+        self._close()
+        rotated = self._move_aside()
+        self._open()
+        if self.log:
+            self.log.info('Capture rotated to {}'.format(rotated))
+
+    def _move_aside(self):
+        stem, ext = os.path.splitext(self.path)
+        t = time.time()
+        while True:
+            rotated = '{}.{}-{:03d}{}'.format(stem, time.strftime('%Y%m%d-%H%M%S',
+                                                                   time.localtime(t)),
+                                              int(t * 1000) % 1000, ext)
+            if not os.path.exists(rotated):
+                break
+            t += 0.001
+        os.replace(self.path, rotated)
+        return rotated
+
+
+class CaptureReader:
+    """
+    Memory mapped reader of a capture file, nothing is loaded in memory.
+
+    Iterating yields ``(t, kind, address, handle, data)`` tuples, kind
+    ``'read'``, ``'notify'``, ``'write'`` or ``'write-command'``. A file
+    cut short stops at its last whole record and sets :attr:`truncated`.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError('{}: not a capture file'.format(self.path))
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, _, _ = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('{}: not a capture file'.format(self.path))
+        self.truncated = False
+        self._index = None
+
+    def close(self):
+        self.mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def _record(self, offset):
+        """(type, body, next offset) or None"""
+        mm = self.mm
+        if offset + RECORD_HEADER.size > len(mm):
+            return None
+        length, crc = RECORD_HEADER.unpack_from(mm, offset)
+        end = offset + RECORD_HEADER.size + length
+        if not length or end > len(mm):
+            return None
+        body = mm[offset + RECORD_HEADER.size:end]
+        if zlib.crc32(body) != crc:
+            return None
+        return body[0], body, end
+
+    def index(self):
+        """
+        [(t_first, t_last, block offset, records, addresses)] of a
+        closed file, oldest first, `None` if it was not closed
+        """
+        if self._index is not None:
+            return self._index
+        end_size = RECORD_HEADER.size + 1 + END.size
+        record = self._record(len(self.mm) - end_size) if len(self.mm) > end_size else None
+        if record is None or record[0] != END_BLOCK:
+            return None
+        blocks = []
+        offset, = END.unpack_from(record[1], 1)
+        while offset:
+            record = self._record(offset)
+            if record is None or record[0] != INDEX_BLOCK:
+                return None
+            previous, block_offset, count, t_first, t_last = INDEX.unpack_from(record[1], 1)
+            addresses = record[1][1 + INDEX.size:].decode().split('\n')
+            blocks.append((t_first, t_last, block_offset, count, addresses))
+            offset = previous
+        self._index = blocks[::-1]
+        return self._index
+
+    def profile(self, address=None):
+        """
+        (address, GATT table) of the first PROFILE record, of ``address``
+        if given, or (address, `None`)
+        """
+        offset = FILE_HEADER.size
+        addresses = {}
+        while True:
+            record = self._record(offset)
+            if record is None:
+                return address, None
+            kind, body, offset = record
+            if kind == DEVICE:
+                device_id, = struct.unpack_from('<H', body, 1)
+                addresses[device_id] = body[3:].decode()
+            elif kind == PROFILE:
+                device_id, = struct.unpack_from('<H', body, 1)
+                if address is None or addresses.get(device_id) == address:
+                    return addresses.get(device_id), json.loads(body[3:].decode())
+
+    def records(self, since=None, profiles=False):
+        """
+        Values from the start, or from time ``since`` (uses the index if
+        any). With ``profiles`` the GATT tables are yielded too, as
+        ``(None, 'profile', address, None, table)``.
+        """
+        offset = FILE_HEADER.size
+        addresses = {}
+        blocks = self.index() if since is not None else None
+        if blocks:
+            i = bisect.bisect_left([block[1] for block in blocks], since)
+            if i == len(blocks):
+                return
+            offset = blocks[i][2]
+            addresses = dict(enumerate(blocks[i][4]))
+        while True:
+            record = self._record(offset)
+            if record is None:
+                self.truncated = offset < len(self.mm)
+                return
+            kind, body, offset = record
+            if kind in KINDS:
+                t, device_id, handle = VALUE.unpack_from(body, 1)
+                if since is not None and t < since:
+                    continue
+                yield (t, KINDS[kind], addresses.get(device_id), handle,
+                       body[1 + VALUE.size:])
+            elif kind == DEVICE:
+                device_id, = struct.unpack_from('<H', body, 1)
+                addresses[device_id] = body[3:].decode()
+            elif kind == PROFILE and profiles:
+                device_id, = struct.unpack_from('<H', body, 1)
+                yield (None, 'profile', addresses.get(device_id), None,
+                       json.loads(body[3:].decode()))
+            elif kind == END_BLOCK:
+                return
+
+
+# process wide capture, see the -capture option
+CAPTURE = GattCapture()
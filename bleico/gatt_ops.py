@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import asyncio
+import struct
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from bleak_sigspec.utils import get_char_value, get_xml_char
+from bleico.ble_device import BASE_BLE_DEVICE
+from bleico.char_formatter import CharFormatter
+from bleico.gatt_profile import GattProfile
+from bleico.scan_service import ADDRESS_RE, UUID_RE, parse_target, get_scan_service
+
+READ = 'read'
+WRITE = 'write'
+NOTIFY = 'notify'
+
+# struct formats of SIG field Ctypes that can be packed directly
+STRUCT_CTYPES = set('bBhHiIqQfd?')
+
+
+class ValueCodec:
+    """
+    SIG decoding (bleak_sigspec) and encoding of characteristic values by
+    characteristic name, xml and formatter compiled once per name.
+    """
+
+    def __init__(self):
+        self._compiled = {}  # char name --> (xml_char, CharFormatter) or None
+
+    def compiled(self, char):
+        if char not in self._compiled:
+            try:
+                xml_char = get_xml_char(char)
+                self._compiled[char] = (xml_char, CharFormatter(char, xml_char))
+            except Exception as e:
+                self._compiled[char] = None
+        return self._compiled[char]
+
+    def decode(self, char, raw):
+        """Returns (value, summary), value is `None` if it can not be decoded"""
+        compiled = self.compiled(char)
+        if compiled is not None:
+            xml_char, formatter = compiled
+            try:
+                value = get_char_value(raw, xml_char)
+                return value, formatter.format(value).summary
+            except Exception as e:
+                pass
+        return None, raw.hex()
+
+    def encode(self, char, text):
+        """
+        Value text --> bytes. ``0x`` prefixed text is raw hex, otherwise
+        comma separated values of the mandatory fields of a SIG
+        characteristic (enumeration names are accepted). Reference
+        fields (e.g. Temperature Range) take the values of the fields
+        of the referenced characteristic.
+        """
+        if text.lower().startswith('0x'):
+            return bytes.fromhex(text[2:])
+        compiled = self.compiled(char)
+        if compiled is None:
+            raise ValueError("{} is not a SIG characteristic, use raw hex data (0x...)".format(char))
+        fields = self._fields(char, compiled[0])
+        if not fields:
+            raise ValueError("{} has no supported fields, use raw hex data (0x...)".format(char))
+        texts = [val.strip() for val in text.split(',')] if len(fields) > 1 else [text]
+        if len(texts) != len(fields):
+            raise ValueError("{} expects {} values: {}".format(char, len(fields),
+                                                              ', '.join([name for name, _ in fields])))
+        data = b''
+        for (name, field), val in zip(fields, texts):
+            data += self._encode_field(char, name, field, val)
+        return data
+
+    def _fields(self, char, xml_char):
+        """Mandatory fields of ``xml_char``, reference fields expanded: `list` of (name, field)"""
+        fields = []
+        for name, field in xml_char.fields.items():
+            if 'Reference' in field:
+                compiled = self.compiled(field['Reference'])
+                if compiled is None:
+                    raise ValueError("{} field {}: unsupported field type (reference to {}), "
+                                     "use raw hex data (0x...)".format(char, name,
+                                                                       field['Reference']))
+                ref_fields = self._fields(field['Reference'], compiled[0])
+                if len(ref_fields) == 1:
+                    fields.append((name, ref_fields[0][1]))
+                else:
+                    fields.extend(('{}/{}'.format(name, ref_name), ref_field)
+                                  for ref_name, ref_field in ref_fields)
+            elif field.get('Requirement') == 'Mandatory':
+                fields.append((name, field))
+        return fields
+
+    def _encode_field(self, char, name, field, text):
+        ctype = field.get('Ctype')
+        if ctype == 'utf8':
+            return text.encode('utf8')
+        if 'Enumerations' in field:
+            for key, enum in field['Enumerations'].items():
+                if str(enum).lower() == text.lower():
+                    text = key
+                    break
+        try:
+            value = float(text)
+        except ValueError:
+            raise ValueError("{}: {} is not a number".format(name, text))
+        if 'Multiplier' in field:
+            value /= field['Multiplier']
+        if 'DecimalExponent' in field:
+            value /= 10 ** field['DecimalExponent']
+        if 'BinaryExponent' in field:
+            value /= 2 ** field['BinaryExponent']
+        if ctype in STRUCT_CTYPES:
+            if ctype not in ('f', 'd'):
+                value = int(round(value))
+            return struct.pack('<' + ctype, value)
+        if ctype == 'k':  # uint24
+            return int(round(value)).to_bytes(3, 'little')
+        raise ValueError("{} field {} ({}) can not be encoded, use raw hex data (0x...)".format(
+            char, name, field.get('Format')))
+
+
+class DeviceJob:
+    """Operations to do on one device: ``ops`` `list` of (kind, char target, data)"""
+    __slots__ = ('target', 'ops')
+
+    def __init__(self, target, ops=None):
+        self.target = target
+        self.ops = ops or []
+
+
+def parse_batch(lines, kind, chars=(), data=None):
+    """
+    Batch lines ``device[,characteristic[,data]]`` (``#`` comments) -->
+    `list` of DeviceJob, one per device. Lines without characteristic
+    use ``chars``, and without data, ``data``.
+    """
+    jobs = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [part.strip() for part in line.split(',', 2)]
+        job = jobs.setdefault(parts[0], DeviceJob(parts[0]))
+        line_chars = [parts[1]] if len(parts) > 1 and parts[1] else chars
+        line_data = parts[2] if len(parts) > 2 else data
+        for char in line_chars:
+            job.ops.append((kind, char, line_data))
+    return list(jobs.values())
+
+
+class GattRunner:
+    """
+    One-shot GATT operations on one or many devices, without Qt.
+
+    Devices run concurrently on one event loop (up to ``parallel``
+    connecting at the same time); each connects with
+    ``BASE_BLE_DEVICE.connect_client`` (scan cache BLEDevice if recently
+    seen), resolves its characteristics with the cached GATT profile
+    (:class:`bleico.gatt_profile.ProfileCache`) and does its operations
+    in order. Results are passed to ``emit(record)`` as they arrive::
+
+        {"t", "address", "name", "char", "handle", "op", "value", "summary", "raw"}
+
+    or with ``"error"`` instead of the value.
+
+    :param notify_count: notifications to wait for, per characteristic
+    :param notify_time: seconds to wait for notifications (`None`, until :meth:`stop`)
+    """
+
+    def __init__(self, profiles, emit, parallel=4, n_tries=3, scan_timeout=10,
+                 notify_count=None, notify_time=None, scan_service=None, log=None):
+        self.profiles = profiles
+        self.emit = emit
+        self.parallel = parallel
+        self.n_tries = n_tries
+        self.scan_timeout = scan_timeout
+        self.notify_count = notify_count
+        self.notify_time = notify_time
+        self.scan_service = scan_service
+        self.log = log
+        self.codec = ValueCodec()
+        self.errors = 0
+        self._quit = False
+        self._connect_sem = None
+
+    def stop(self, *args):
+        self._quit = True
+
+    def error(self, job_address, char, message, name=None):
+        self.errors += 1
+        self.emit({'t': time.time(), 'address': job_address, 'name': name,
+                   'char': char, 'error': message})
+
+    def find_devices(self, jobs):
+        """Device targets --> BLEDevice/address, names are found by scanning concurrently"""
+        devices = {}
+        named = [job.target for job in jobs
+                 if not (ADDRESS_RE.match(job.target) or UUID_RE.match(job.target))]
+        for job in jobs:
+            if job.target not in named:
+                devices[job.target] = job.target
+        if named:
+            if self.scan_service is None:
+                self.scan_service = get_scan_service(log=self.log)
+            with ThreadPoolExecutor(max_workers=min(len(named), 16)) as executor:
+                entries = executor.map(lambda target: self.scan_service.find_first(
+                    parse_target(target), timeout=self.scan_timeout), named)
+                for target, entry in zip(named, entries):
+                    if entry is None:
+                        devices[target] = None
+                    else:
+                        devices[target] = entry.device if entry.device is not None else entry.address
+        return devices
+
+    def run(self, jobs):
+        """Run the jobs, returns the number of failed operations"""
+        devices = self.find_devices(jobs)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._connect_sem = asyncio.Semaphore(self.parallel)
+        try:
+            loop.run_until_complete(asyncio.gather(*[self.run_job(job, devices[job.target])
+                                                     for job in jobs]))
+        finally:
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+        return self.errors
+
+    async def run_job(self, job, scan_dev):
+        if scan_dev is None:
+            for kind, char, data in job.ops:
+                self.error(job.target, char, "Device not found")
+            return
+        dev = BASE_BLE_DEVICE(scan_dev, log=self.log)
+        try:
+            async with self._connect_sem:
+                if not self._quit:
+                    await dev.connect_client(n_tries=self.n_tries, log=self.log is not None)
+            if not dev.connected:
+                for kind, char, data in job.ops:
+                    self.error(dev.UUID, char, "Connection failed", name=dev.name)
+                return
+            dev.set_disconnected_callback(dev.disconnection_callback)
+            profile = self.profiles.get(dev.UUID)
+            if profile is None or any([profile.resolve(char) is None for _, char, _ in job.ops]):
+                # new device or stale profile
+                profile = GattProfile.from_services(dev.UUID, dev.ble_client.services)
+                self.profiles.put(profile)
+            notify_chars = []
+            for kind, char, data in job.ops:
+                gatt_char = profile.resolve(char)
+                if gatt_char is None:
+                    self.error(dev.UUID, char, "Characteristic not found", name=dev.name)
+                elif kind == NOTIFY:
+                    notify_chars.append(gatt_char)
+                else:
+                    await self.do_op(dev, kind, gatt_char, data)
+            if notify_chars:
+                await self.do_notify(dev, notify_chars)
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+            self.error(dev.UUID, None, str(e), name=dev.name)
+        finally:
+            if dev.connected:
+                try:
+                    await dev.disconnect_client(log=False, timeout=5)
+                except Exception as e:
+                    if self.log:
+                        self.log.error(e)
+
+    def record(self, dev, op, gatt_char, raw):
+        value, summary = self.codec.decode(gatt_char.name, raw)
+        return {'t': time.time(), 'address': dev.UUID, 'name': dev.name,
+                'char': gatt_char.name, 'handle': gatt_char.handle, 'op': op,
+                'value': value, 'summary': summary, 'raw': raw.hex()}
+
+    async def do_op(self, dev, kind, gatt_char, data):
+        try:
+            if kind == READ:
+                if not gatt_char.readable:
+                    raise ValueError("Characteristic not readable")
+                raw = bytes(await dev.ble_client.read_gatt_char(gatt_char.handle))
+            else:
+                if not gatt_char.writeable:
+                    raise ValueError("Characteristic not writeable")
+                if data is None:
+                    raise ValueError("No data to write, see -d")
+                raw = self.codec.encode(gatt_char.name, data)
+                await dev.ble_client.write_gatt_char(gatt_char.handle, raw,
+                                                     response='write' in gatt_char.properties)
+            self.emit(self.record(dev, kind, gatt_char, raw))
+        except Exception as e:
+            self.error(dev.UUID, gatt_char.name, str(e), name=dev.name)
+
+    async def do_notify(self, dev, gatt_chars):
+        counts = {}
+
+        def notify_callback(sender_handle, data):
+            gatt_char = by_handle.get(sender_handle)
+            if gatt_char is not None and (self.notify_count is None
+                                          or counts[sender_handle] < self.notify_count):
+                counts[sender_handle] += 1
+                self.emit(self.record(dev, NOTIFY, gatt_char, bytes(data)))
+
+        by_handle = {}
+        for gatt_char in gatt_chars:
+            if not gatt_char.notifiable:
+                self.error(dev.UUID, gatt_char.name, "Characteristic not notifiable", name=dev.name)
+                continue
+            try:
+                await dev.ble_client.start_notify(gatt_char.handle, notify_callback)
+                by_handle[gatt_char.handle] = gatt_char
+                counts[gatt_char.handle] = 0
+            except Exception as e:
+                self.error(dev.UUID, gatt_char.name, str(e), name=dev.name)
+        t0 = time.time()
+        while by_handle and not self._quit and dev.connected:
+            if self.notify_time is not None and time.time() - t0 >= self.notify_time:
+                break
+            if self.notify_count is not None and min(counts.values()) >= self.notify_count:
+                break
+            await asyncio.sleep(0.05)
+        for handle in by_handle:
+            try:
+                await dev.ble_client.stop_notify(handle)
+            except Exception as e:
+                if self.log:
+                    self.log.error(e)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import re
+import time
+import traceback
+
+SIG_UUID_FMT = '0000{:04x}-0000-1000-8000-00805f9b34fb'
+UUID16_RE = re.compile(r'^(0x)?[0-9A-Fa-f]{4}$')
+UUID128_RE = re.compile(r'^[0-9A-Fa-f]{8}-([0-9A-Fa-f]{4}-){3}[0-9A-Fa-f]{12}$')
+
+
+class GattChar:
+    """Characteristic of a GATT profile"""
+    __slots__ = ('handle', 'uuid', 'name', 'service', 'properties')
+
+    def __init__(self, handle, uuid, name, service=None, properties=()):
+        self.handle = handle
+        self.uuid = uuid
+        self.name = name
+        self.service = service
+        self.properties = list(properties)
+
+    @property
+    def readable(self):
+        return 'read' in self.properties
+
+    @property
+    def writeable(self):
+        return 'write' in self.properties or 'write-without-response' in self.properties
+
+    @property
+    def notifiable(self):
+        return 'notify' in self.properties or 'indicate' in self.properties
+
+    def to_dict(self):
+        return {'handle': self.handle, 'uuid': self.uuid, 'name': self.name,
+                'service': self.service, 'properties': self.properties}
+
+    @classmethod
+    def from_dict(cls, char_dict):
+        return cls(char_dict['handle'], char_dict['uuid'], char_dict['name'],
+                   service=char_dict.get('service'),
+                   properties=char_dict.get('properties', []))
+
+    def __repr__(self):
+        return "{} ({}) handle: {}, {}".format(self.name, self.uuid, self.handle,
+                                                ",".join(self.properties))
+
+
+def parse_char_target(target):
+    """
+    Characteristic target string --> (kind, key), kind is ``'handle'``
+    (decimal number), ``'uuid'`` (128 bit uuid or ``0x`` 16 bit uuid)
+    or ``'name'`` (anything else, a 4 hex digit name is also tried as a
+    16 bit uuid).
+    """
+    target = target.strip()
+    if target.isdigit():
+        return 'handle', int(target)
+    if UUID128_RE.match(target):
+        return 'uuid', target.lower()
+    if target.lower().startswith('0x') and UUID16_RE.match(target):
+        return 'uuid', SIG_UUID_FMT.format(int(target, 16))
+    return 'name', target
+
+
+class GattProfile:
+    """
+    Services and characteristics of a device, as discovered by bleak.
+
+    Can be cached (:class:`ProfileCache`) so targets are resolved, and
+    errors found, without walking the services of the connection again.
+    """
+
+    def __init__(self, address, chars=None, timestamp=None):
+        self.address = address
+        self.chars = chars or []
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._index()
+
+    def _index(self):
+        self._by_handle = {char.handle: char for char in self.chars}
+        self._by_name = {}
+        self._by_uuid = {}
+        for char in self.chars:
+            self._by_name.setdefault(char.name.lower(), char)
+            self._by_uuid.setdefault(char.uuid.lower(), char)
+
+    @classmethod
+    def from_services(cls, address, services):
+        """bleak ``BleakGATTServiceCollection`` --> GattProfile"""
+        chars = []
+        for service in services:
+            for char in service.characteristics:
+                chars.append(GattChar(char.handle, char.uuid.lower(), char.description,
+                                      service=service.description,
+                                      properties=char.properties))
+        return cls(address, chars)
+
+    def resolve(self, target):
+        """Characteristic target (name, uuid or handle) --> GattChar or `None`"""
+        kind, key = parse_char_target(target)
+        if kind == 'handle':
+            return self._by_handle.get(key)
+        if kind == 'uuid':
+            return self._by_uuid.get(key)
+        char = self._by_name.get(key.lower())
+        if char is None and UUID16_RE.match(key):
+            char = self._by_uuid.get(SIG_UUID_FMT.format(int(key, 16)))
+        return char
+
+    def services(self):
+        """`dict` service --> [GattChar]"""
+        services = {}
+        for char in self.chars:
+            services.setdefault(char.service, []).append(char)
+        return services
+
+    def to_dict(self):
+        return {'address': self.address, 'timestamp': self.timestamp,
+                'chars': [char.to_dict() for char in self.chars]}
+
+    @classmethod
+    def from_dict(cls, profile_dict):
+        return cls(profile_dict['address'],
+                   [GattChar.from_dict(char) for char in profile_dict.get('chars', [])],
+                   timestamp=profile_dict.get('timestamp'))
+
+
+class ProfileCache:
+    """GATT profiles saved as one JSON file per device under ``path``"""
+
+    def __init__(self, path, log=None):
+        self.path = path
+        self.log = log
+        self.profiles = {}
+
+    def _file(self, address):
+        return os.path.join(self.path, '{}.json'.format(re.sub(r'[^0-9A-Za-z-]', '_', address)))
+
+    def get(self, address):
+        if address in self.profiles:
+            return self.profiles[address]
+        try:
+            with open(self._file(address), 'r') as profile_file:
+                profile = GattProfile.from_dict(json.load(profile_file))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+            return None
+        self.profiles[address] = profile
+        return profile
+
+    def put(self, profile):
+        self.profiles[profile.address] = profile
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            tmp_path = self._file(profile.address) + '.tmp'
+            with open(tmp_path, 'w') as profile_file:
+                json.dump(profile.to_dict(), profile_file)
+            os.replace(tmp_path, self._file(profile.address))
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+
+    def remove(self, address):
+        self.profiles.pop(address, None)
+        if os.path.exists(self._file(address)):
+            os.remove(self._file(address))
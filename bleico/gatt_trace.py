@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+TRACE_EVENTS = 1 << 16
+
+
+class GattTracer:
+    """
+    Timeline of GATT operations (connect, read, write, start/stop
+    notify, notification, disconnect) and of the poll and notify loops,
+    kept in a bounded ring buffer of the last ``maxlen`` events and
+    exported as Chrome trace-event JSON (chrome://tracing, Perfetto).
+
+    Same calling convention as :class:`bleico.stage_timer.StageTimer`:
+    ``t0 = tracer.start()`` returns ``0`` while disabled, then
+    ``tracer.complete(name, t0, ...)`` only if ``t0``.
+    """
+
+    def __init__(self, enabled=False, maxlen=TRACE_EVENTS):
+        self.enabled = enabled
+        self.events = deque(maxlen=maxlen)  # (phase, name, ts_ns, dur_ns, thread, args)
+        self.threads = {}  # thread ident --> name
+        self.path = None  # default save path, see -trace
+        self.t_origin = time.perf_counter_ns()
+        self.wall_origin = time.time()
+
+    def enable(self, maxlen=None):
+        if maxlen is not None and maxlen != self.events.maxlen:
+            self.events = deque(self.events, maxlen=maxlen)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.events.clear()
+
+    def start(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def _thread(self):
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads[ident] = threading.current_thread().name
+        return ident
+
+    def complete(self, name, t0, **args):
+        """Event from ``t0`` (:meth:`start`) to now"""
+        self.events.append(('X', name, t0, time.perf_counter_ns() - t0,
+                            self._thread(), args))
+
+    def instant(self, name, **args):
+        if self.enabled:
+            self.events.append(('i', name, time.perf_counter_ns(), 0, self._thread(), args))
+
+    def to_chrome(self):
+        """Chrome trace-event `dict` of the buffered events"""
+        events = list(self.events)
+        pid = os.getpid()
+        tids = {}
+        trace_events = []
+        for ident, name in list(self.threads.items()):
+            tids[ident] = len(tids) + 1
+            trace_events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid,
+                                 'tid': tids[ident], 'args': {'name': name}})
+        for phase, name, ts_ns, dur_ns, ident, args in events:
+            event = {'ph': phase, 'name': name, 'cat': 'gatt', 'pid': pid,
+                     'tid': tids.get(ident, 0), 'ts': (ts_ns - self.t_origin) / 1000}
+            if phase == 'X':
+                event['dur'] = dur_ns / 1000
+            else:
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms',
+                'otherData': {'origin': self.wall_origin,
+                              'full': len(events) == self.events.maxlen}}
+
+    def save(self, path=None):
+        """Write :meth:`to_chrome` to ``path`` (default :attr:`path`), returns the path"""
+        path = os.path.expanduser(path or self.path)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as trace_file:
+            json.dump(self.to_chrome(), trace_file, default=str)
+        os.replace(tmp_path, path)
+        return path
+
+
+# process wide tracer, see the -trace option
+TRACE = GattTracer()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from bleico.gatt_trace import TRACE
+from bleico.gatt_capture import CAPTURE, READ, NOTIFY, WRITE, WRITE_COMMAND
+
+
+class InstrumentedClient:
+    """
+    BleakClient (or backend client) proxy that records its GATT
+    operations and notifications in the GATT trace
+    (:data:`bleico.gatt_trace.TRACE`) and the raw values read, written or
+    notified in the capture (:data:`bleico.gatt_capture.CAPTURE`),
+    with the GATT table of the device on each connection, everything
+    else is forwarded to the client. Both cost one attribute check per
+    operation while disabled.
+    """
+
+    def __init__(self, client, tracer=None, capture=None):
+        self.client = client
+        self.tracer = tracer if tracer is not None else TRACE
+        self.capture = capture if capture is not None else CAPTURE
+        self.address = getattr(client, 'address', None)
+        self._handles = {}  # uuid --> handle
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def handle(self, char_specifier):
+        """Handle of a characteristic handle, uuid or BleakGATTCharacteristic"""
+        if isinstance(char_specifier, int):
+            return char_specifier
+        if char_specifier not in self._handles:
+            try:
+                char = (char_specifier if hasattr(char_specifier, 'handle') else
+                        self.client.services.get_characteristic(char_specifier))
+                self._handles[char_specifier] = char.handle if char is not None else None
+            except Exception as e:
+                return None
+        return self._handles[char_specifier]
+
+    async def _traced(self, name, coro, **args):
+        t0 = self.tracer.start()
+        try:
+            result = await coro
+        except Exception as e:
+            if t0:
+                self.tracer.complete(name, t0, error=repr(e), **args)
+            raise
+        if t0:
+            self.tracer.complete(name, t0, **args)
+        return result
+
+    async def connect(self, **kwargs):
+        connected = await self._traced('connect', self.client.connect(**kwargs))
+        if self.capture.enabled:
+            try:
+                self.capture.set_profile(self.address, self.client.services)
+            except Exception as e:
+                pass
+        return connected
+
+    async def disconnect(self):
+        return await self._traced('disconnect', self.client.disconnect())
+
+    async def read_gatt_char(self, char_specifier, **kwargs):
+        data = await self._traced('read', self.client.read_gatt_char(char_specifier, **kwargs),
+                                  char=str(char_specifier))
+        if self.capture.enabled:
+            self.capture.record(READ, self.address, self.handle(char_specifier), bytes(data))
+        return data
+
+    async def write_gatt_char(self, char_specifier, data, response=False, **kwargs):
+        result = await self._traced('write', self.client.write_gatt_char(
+            char_specifier, data, response=response, **kwargs), char=str(char_specifier),
+            size=len(data))
+        if self.capture.enabled:
+            self.capture.record(WRITE if response else WRITE_COMMAND, self.address,
+                                self.handle(char_specifier), bytes(data))
+        return result
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        tracer = self.tracer
+        capture = self.capture
+
+        def instrumented_callback(sender, data):
+            if capture.enabled:
+                capture.record(NOTIFY, self.address, self.handle(sender), bytes(data))
+            t0 = tracer.start()
+            callback(sender, data)
+            if t0:
+                tracer.complete('notification', t0, handle=str(sender), size=len(data))
+
+        return await self._traced('start_notify', self.client.start_notify(
+            char_specifier, instrumented_callback, **kwargs), char=str(char_specifier))
+
+    async def stop_notify(self, char_specifier):
+        return await self._traced('stop_notify', self.client.stop_notify(char_specifier),
+                                  char=str(char_specifier))
+
+    def set_disconnected_callback(self, callback, **kwargs):
+        tracer = self.tracer
+
+        def traced_callback(client):
+            tracer.instant('disconnected')
+            callback(client)
+
+        self.client.set_disconnected_callback(traced_callback, **kwargs)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+from collections import deque
+from bleico.metrics import (METRICS, METRIC_FAMILIES, READS, READ_ERRORS, READ_LATENCY,
+                            NOTIFICATIONS, NOTIFICATIONS_DROPPED, DISCONNECTS)
+
+
+def bucket_quantile(bounds, counts, q):
+    """
+    ``q`` (0-1) quantile of histogram bucket counts (not cumulative),
+    interpolated linearly inside the bucket, as Prometheus
+    ``histogram_quantile``
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for i, n in enumerate(counts):
+        if n and seen + n >= target:
+            if i == len(bounds):
+                return bounds[-1]
+            lower = bounds[i - 1] if i else 0
+            return lower + (bounds[i] - lower) * (target - seen) / n
+        seen += n
+    return bounds[-1]
+
+
+class LinkSample:
+    """Cumulative counters at time ``t``"""
+    __slots__ = ('t', 'reads', 'read_errors', 'latency_sum', 'latency_counts',
+                 'notifications', 'dropped', 'coalesced', 'disconnects')
+
+    def __init__(self, registry, value_pipeline=None):
+        self.t = time.monotonic()
+        self.reads = registry.total(READS)
+        self.read_errors = registry.total(READ_ERRORS)
+        self.notifications = registry.total(NOTIFICATIONS)
+        self.dropped = registry.total(NOTIFICATIONS_DROPPED)
+        self.disconnects = registry.total(DISCONNECTS)
+        self.coalesced = value_pipeline.coalesced if value_pipeline is not None else 0
+        self.latency_sum = 0
+        self.latency_counts = [0] * (len(METRIC_FAMILIES[READ_LATENCY][3]) + 1)
+        for (name, _), histogram in list(registry.series.items()):
+            if name == READ_LATENCY:
+                self.latency_sum += histogram.sum
+                for i, n in enumerate(histogram.counts):
+                    self.latency_counts[i] += n
+
+
+class LinkHealth:
+    """
+    Link health of the connected device over the last ``window``
+    seconds, from :data:`bleico.metrics.METRICS` and the value pipeline.
+
+    Call :meth:`sample` at a fixed rate, it returns a `dict` with
+    ``reads_per_s``, ``read_errors``, ``latency_mean_ms``,
+    ``latency_p95_ms``, ``notifications_per_s``, ``dropped`` and
+    ``coalesced`` (in the window), ``disconnects`` (total),
+    ``pending`` (updates waiting for the GUI thread) and
+    ``since_last_read`` (seconds, `None` if nothing was read yet).
+    """
+
+    def __init__(self, value_pipeline=None, char_states=None, window=10, registry=None):
+        self.value_pipeline = value_pipeline
+        self.char_states = char_states if char_states is not None else {}
+        self.window = window
+        self.registry = registry if registry is not None else METRICS
+        self.samples = deque()
+
+    def sample(self):
+        current = LinkSample(self.registry, self.value_pipeline)
+        self.samples.append(current)
+        # keep the newest sample at least ``window`` old as the baseline
+        while len(self.samples) > 1 and current.t - self.samples[1].t >= self.window:
+            self.samples.popleft()
+        first = self.samples[0]
+        elapsed = current.t - first.t
+        n_reads = sum(current.latency_counts) - sum(first.latency_counts)
+        latency_counts = [n - m for n, m in zip(current.latency_counts, first.latency_counts)]
+        p95 = bucket_quantile(METRIC_FAMILIES[READ_LATENCY][3], latency_counts, 0.95)
+        last_reads = [char_state.last_read for char_state in list(self.char_states.values())
+                      if char_state.last_read is not None]
+        return {'reads_per_s': (current.reads - first.reads) / elapsed if elapsed else None,
+                'read_errors': current.read_errors - first.read_errors,
+                'latency_mean_ms': ((current.latency_sum - first.latency_sum) / n_reads * 1000
+                                    if n_reads else None),
+                'latency_p95_ms': p95 * 1000 if p95 is not None else None,
+                'notifications_per_s': ((current.notifications - first.notifications) / elapsed
+                                        if elapsed else None),
+                'dropped': current.dropped - first.dropped,
+                'coalesced': current.coalesced - first.coalesced,
+                'disconnects': current.disconnects,
+                'pending': self.value_pipeline.pending() if self.value_pipeline else 0,
+                'since_last_read': time.time() - max(last_reads) if last_reads else None}
+
+    @staticmethod
+    def format_lines(health):
+        """Menu texts of a :meth:`sample` result"""
+        def num(value, fmt):
+            return '?' if value is None else fmt.format(value)
+        return ["Reads: {}/s, errors: {}".format(num(health['reads_per_s'], '{:.1f}'),
+                                                 health['read_errors']),
+                "GATT Latency: mean {} ms, p95 {} ms".format(
+                    num(health['latency_mean_ms'], '{:.1f}'),
+                    num(health['latency_p95_ms'], '{:.1f}')),
+                "Notifications: {}/s".format(num(health['notifications_per_s'], '{:.1f}')),
+                "Dropped: {}, Coalesced: {}".format(health['dropped'], health['coalesced']),
+                "Queue: {} pending".format(health['pending']),
+                "Last Read: {} s ago".format(num(health['since_last_read'], '{:.1f}')),
+                "Disconnections: {}".format(health['disconnects'])]
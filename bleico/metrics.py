@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+import traceback
+
+READS = 'bleico_reads_total'
+READ_ERRORS = 'bleico_read_errors_total'
+READ_LATENCY = 'bleico_read_latency_seconds'
+NOTIFICATIONS = 'bleico_notifications_received_total'
+NOTIFICATIONS_DROPPED = 'bleico_notifications_dropped_total'
+DECODE_ERRORS = 'bleico_decode_errors_total'
+CONNECT_ATTEMPTS = 'bleico_connect_attempts_total'
+CONNECT_FAILURES = 'bleico_connect_failures_total'
+CONNECT_DURATION = 'bleico_connect_duration_seconds'
+DISCONNECTS = 'bleico_disconnects_total'
+RECONNECT_DURATION = 'bleico_reconnect_duration_seconds'
+CONNECTED = 'bleico_connected'
+RSSI = 'bleico_rssi_dbm'
+SINK_DROPPED = 'bleico_sink_dropped_total'
+
+# BLE connection intervals are 7.5 ms to 4 s, reads usually take one or two
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075,
+                   0.1, 0.15, 0.25, 0.5, 1, 2.5, 5, 10)
+CONNECT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# name --> (type, label names, help, histogram buckets)
+METRIC_FAMILIES = {
+    READS: ('counter', ('char', 'handle'), 'GATT reads', None),
+    READ_ERRORS: ('counter', ('char', 'handle'), 'Failed GATT reads', None),
+    READ_LATENCY: ('histogram', ('char', 'handle'), 'GATT read latency', LATENCY_BUCKETS),
+    NOTIFICATIONS: ('counter', ('char',), 'Notifications received', None),
+    NOTIFICATIONS_DROPPED: ('counter', ('char',),
+                            'Notifications replaced before being shown or dropped '
+                            'by a full API stream', None),
+    DECODE_ERRORS: ('counter', ('char',), 'Values that failed to decode', None),
+    CONNECT_ATTEMPTS: ('counter', (), 'Connection attempts', None),
+    CONNECT_FAILURES: ('counter', (), 'Failed connection attempts', None),
+    CONNECT_DURATION: ('histogram', (), 'Duration of successful connections (connect call)',
+                       CONNECT_BUCKETS),
+    DISCONNECTS: ('counter', (), 'Disconnections detected', None),
+    RECONNECT_DURATION: ('histogram', (), 'Time from disconnection to reconnection',
+                         CONNECT_BUCKETS),
+    CONNECTED: ('gauge', (), '1 if the device is connected', None),
+    RSSI: ('gauge', (), 'Last device RSSI', None),
+    SINK_DROPPED: ('counter', ('sink',), 'Decoded values dropped by a full or failing '
+                   'output sink', None),
+}
+
+
+class MetricHistogram:
+    """Prometheus style histogram: counts per upper bound, sum and count"""
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(le, cumulative count)], ending with '+Inf'"""
+        total = 0
+        buckets = []
+        for bound, n in zip(self.bounds + ('+Inf',), self.counts):
+            total += n
+            buckets.append((bound, total))
+        return buckets
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms of the families in
+    :data:`METRIC_FAMILIES`, one series per label values.
+
+    Updated from the BLE and notification threads without locks (a
+    concurrent update may rarely be lost, never block), read by
+    :meth:`render` (Prometheus text format) or :meth:`snapshot`.
+    Disabled by default (``-metrics``, ``-api`` and the tray Performance
+    submenu enable it): updates are ignored and hot paths check
+    :attr:`enabled` before timing anything.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.series = {}  # (name, label values) --> value or MetricHistogram
+        self.t_start = time.time()
+
+    def enable(self):
+        if not self.enabled:
+            self.t_start = time.time()
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def inc(self, name, *labels, amount=1):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def set(self, name, value, *labels):
+        if not self.enabled:
+            return
+        self.series[(name, labels)] = value
+
+    def observe(self, name, value, *labels):
+        if not self.enabled:
+            return
+        histogram = self.series.get((name, labels))
+        if histogram is None:
+            histogram = self.series.setdefault(
+                (name, labels), MetricHistogram(METRIC_FAMILIES[name][3]))
+        histogram.observe(value)
+
+    def get(self, name, *labels):
+        return self.series.get((name, labels))
+
+    def total(self, name):
+        """Sum of a counter over all its label values"""
+        return sum(value for (series_name, _), value in list(self.series.items())
+                   if series_name == name)
+
+    def reset(self):
+        self.series = {}
+        self.t_start = time.time()
+
+    @staticmethod
+    def _labels(name, labels, extra=()):
+        pairs = list(zip(METRIC_FAMILIES[name][1], labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(
+            label, str('' if value is None else value).replace('\\', '\\\\').replace(
+                '"', '\\"').replace('\n', '\\n')) for label, value in pairs) + '}'
+
+    def render(self):
+        """Prometheus text exposition format"""
+        series = sorted(list(self.series.items()), key=lambda item: (item[0][0], str(item[0][1])))
+        lines = []
+        last_name = None
+        for (name, labels), value in series:
+            kind, _, help_text, _ = METRIC_FAMILIES[name]
+            if name != last_name:
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                last_name = name
+            if kind == 'histogram':
+                for bound, count in value.cumulative():
+                    lines.append('{}_bucket{} {}'.format(
+                        name, self._labels(name, labels, [('le', bound)]), count))
+                lines.append('{}_sum{} {}'.format(name, self._labels(name, labels), value.sum))
+                lines.append('{}_count{} {}'.format(name, self._labels(name, labels),
+                                                    value.count))
+            else:
+                lines.append('{}{} {}'.format(name, self._labels(name, labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """`dict` name --> [{labels..., value or count/sum/buckets}]"""
+        metrics = {}
+        for (name, labels), value in sorted(list(self.series.items()),
+                                            key=lambda item: (item[0][0], str(item[0][1]))):
+            entry = dict(zip(METRIC_FAMILIES[name][1], labels))
+            if isinstance(value, MetricHistogram):
+                entry.update({'count': value.count, 'sum': value.sum,
+                              'buckets': [[str(bound), count]
+                                          for bound, count in value.cumulative()]})
+            else:
+                entry['value'] = value
+            metrics.setdefault(name, []).append(entry)
+        return {'t': time.time(), 'since': self.t_start, 'metrics': metrics}
+
+
+class MetricsExporter:
+    """
+    Export a :class:`MetricsRegistry` from a background thread.
+
+    :param target: port number, to serve ``GET /metrics`` on localhost,
+        or a file path, rewritten every ``interval`` seconds: JSON
+        (with per second rates of the counters) if it ends with
+        ``.json``, else Prometheus text (node exporter textfile collector)
+    """
+
+    def __init__(self, target, registry=None, interval=10, log=None):
+        self.target = str(target)
+        self.registry = registry if registry is not None else METRICS
+        self.interval = interval
+        self.log = log
+        self.server = None
+        self.thread = None
+        self._stop = threading.Event()
+        self._last = None  # (t, counters) of the last JSON write
+
+    def start(self):
+        self.registry.enable()
+        if self.target.isdigit():
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer(('127.0.0.1', int(self.target)),
+                                              self._handler())
+            self.thread = threading.Thread(target=self.server.serve_forever,
+                                           name='MetricsThread', daemon=True)
+            if self.log:
+                self.log.info('Metrics on http://127.0.0.1:{}/metrics'.format(self.target))
+        else:
+            self.target = os.path.expanduser(self.target)
+            self.thread = threading.Thread(target=self._write_loop,
+                                           name='MetricsThread', daemon=True)
+            if self.log:
+                self.log.info('Metrics written to {} every {} s'.format(self.target,
+                                                                      self.interval))
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        elif self.thread is not None:
+            self._stop.set()
+            self.thread.join()
+        self.thread = None
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return MetricsHandler
+
+    def _write_loop(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            try:
+                self.write()
+            except Exception as e:
+                if self.log:
+                    self.log.error(traceback.format_exc())
+            if stopping:
+                break
+
+    def write(self):
+        if self.target.endswith('.json'):
+            snapshot = self.registry.snapshot()
+            counters = {key: value for key, value in list(self.registry.series.items())
+                        if key[0].endswith('_total')}
+            if self._last is not None and snapshot['t'] > self._last[0]:
+                t_last, last = self._last
+                rates = {}
+                for key, value in counters.items():
+                    rates[key[0]] = rates.get(key[0], 0) + value - last.get(key, 0)
+                snapshot['rates'] = {name: round(delta / (snapshot['t'] - t_last), 3)
+                                     for name, delta in rates.items()}
+            self._last = (snapshot['t'], counters)
+            payload = json.dumps(snapshot, default=str)
+        else:
+            payload = self.registry.render()
+        tmp_path = self.target + '.tmp'
+        with open(tmp_path, 'w') as metrics_file:
+            metrics_file.write(payload)
+        os.replace(tmp_path, self.target)
+
+
+# process wide registry, see the -metrics option
+METRICS = MetricsRegistry()
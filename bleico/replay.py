@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import time
+import traceback
+from bleico.gatt_capture import CaptureReader, rotated_paths, NO_HANDLE
+from bleico.gatt_profile import SIG_UUID_FMT
+from bleico.sim_backend import peripheral_from_table
+
+# records scanned for the first value of each characteristic
+PRIME_RECORDS = 10000
+DEVICE_NAME_UUID = SIG_UUID_FMT.format(0x2A00)
+REPLAY_LATENCY = {'connect': 0, 'read': 0, 'write': 0, 'notify': 0, 'rssi': 0}
+
+
+class CaptureReplay:
+    """
+    Replay a raw capture (:mod:`bleico.gatt_capture`, with its rotated
+    files) as a simulated peripheral: the recorded GATT table of the
+    device is served by :attr:`peripheral` (install it with a
+    :class:`bleico.sim_backend.SimBackend`), recorded notifications are
+    pushed to the subscribed clients and recorded reads set the value
+    the next read returns.
+
+    Values are paced at ``speed`` times the recorded rate, ``0`` for as
+    fast as the clients take them. The files are memory mapped and read
+    one record at a time. The replay starts once a client is connected
+    and subscribed to the recorded notifications (or after
+    ``subscribe_timeout`` seconds), ``on_finished`` is called at the end.
+    """
+
+    def __init__(self, path, address=None, speed=1, subscribe_timeout=10,
+                 on_finished=None, log=None):
+        self.paths = rotated_paths(path)
+        if not self.paths:
+            raise ValueError('{}: no capture files'.format(path))
+        self.speed = speed
+        self.subscribe_timeout = subscribe_timeout
+        self.on_finished = on_finished
+        self.log = log
+        self.address, table = self._profile(address)
+        if table is None:
+            raise ValueError('{}: no GATT table of {} in the capture'.format(
+                path, address or 'any device'))
+        self.peripheral = peripheral_from_table(self.address, 'bleico-replay', table,
+                                                latency=REPLAY_LATENCY, jitter=0, mtu=517)
+        self.notified_handles = self._prime()
+        self.stats = {'reads': 0, 'notifications': 0, 'elapsed': 0, 'max_lag': 0}
+        self.finished = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _profile(self, address):
+        for path in self.paths:
+            with CaptureReader(path) as reader:
+                found_address, table = reader.profile(address)
+            if table is not None:
+                return found_address, table
+        return address, None
+
+    def _prime(self):
+        # initial values: the first one recorded of each characteristic
+        characteristics = self.peripheral.services.characteristics
+        notified = set()
+        records = self.records()
+        for i, (t, kind, address, handle, data) in enumerate(records):
+            char = characteristics.get(handle)
+            if char is not None and not char.value:
+                char.value = data
+            if kind == 'notify':
+                notified.add(handle)
+            if i >= PRIME_RECORDS:
+                break
+        records.close()
+        for char in characteristics.values():
+            if char.uuid == DEVICE_NAME_UUID and char.value:
+                self.peripheral.name = char.value.decode('utf8', 'replace')
+        return sorted(notified)
+
+    def records(self):
+        """Recorded values of the device, oldest first"""
+        for path in self.paths:
+            with CaptureReader(path) as reader:
+                for t, kind, address, handle, data in reader:
+                    if address == self.address and handle != NO_HANDLE:
+                        yield t, kind, address, handle, data
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='ReplayThread', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wait_subscribed(self):
+        peripheral = self.peripheral
+        while not peripheral.clients:
+            if self._stop.wait(0.05):
+                return
+        deadline = time.monotonic() + self.subscribe_timeout
+        while time.monotonic() < deadline and not all(
+                peripheral.subscribed(handle) for handle in self.notified_handles):
+            if self._stop.wait(0.05):
+                return
+
+    def run(self):
+        try:
+            self.wait_subscribed()
+            if self.log:
+                self.log.info('Replay of {} started, speed: {}'.format(
+                    self.address, '{}x'.format(self.speed) if self.speed else 'max'))
+            self._replay()
+            if self.log:
+                self.log.info('Replayed {reads} reads and {notifications} notifications in '
+                              '{elapsed:.2f} s, {rate:.0f} values/s, max lag {max_lag:.3f} s'.format(
+                                  rate=(self.stats['reads'] + self.stats['notifications']) /
+                                  max(self.stats['elapsed'], 1e-9), **self.stats))
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+        self.finished = True
+        if self.on_finished is not None:
+            self.on_finished()
+
+    def _replay(self):
+        peripheral = self.peripheral
+        characteristics = peripheral.services.characteristics
+        stats = self.stats
+        speed = self.speed
+        t_start = time.monotonic()
+        t_first = None
+        for t, kind, address, handle, data in self.records():
+            if self._stop.is_set():
+                break
+            if speed:
+                if t_first is None:
+                    t_first = t
+                lag = time.monotonic() - (t_start + (t - t_first) / speed)
+                if lag < 0:
+                    if self._stop.wait(-lag):
+                        break
+                elif lag > stats['max_lag']:
+                    stats['max_lag'] = lag
+            if kind == 'notify':
+                peripheral.notify(handle, data)
+                stats['notifications'] += 1
+            else:
+                # reads and writes: the value the next read returns
+                char = characteristics.get(handle)
+                if char is not None:
+                    char.value = data
+                if kind == 'read':
+                    stats['reads'] += 1
+        stats['elapsed'] = time.monotonic() - t_start
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+
+
+class ScanEntry:
+    """
+    Last known state of an advertising device.
+
+    rssi
+        EWMA smoothed RSSI, rounded to dBm
+    rssi_raw
+        RSSI of the last advertisement
+    services
+        `list` of advertised service uuids
+    manufacturer_data
+        `dict` company id --> bytes
+    service_data
+        `dict` service uuid --> bytes
+    device
+        last bleak ``BLEDevice``, lets BleakClient connect without discovery
+    """
+    __slots__ = ('address', 'name', 'rssi', 'rssi_ewma', 'rssi_raw',
+                 'first_seen', 'last_seen', 'count',
+                 'services', 'manufacturer_data', 'service_data', 'device')
+
+    def __init__(self, address, name=None, rssi=None):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.rssi_ewma = rssi
+        self.rssi_raw = rssi
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+        self.count = 0
+        self.services = []
+        self.manufacturer_data = {}
+        self.service_data = {}
+        self.device = None
+
+    @property
+    def metadata(self):
+        """Same keys as bleak ``BLEDevice.metadata``"""
+        return {'uuids': self.services,
+                'manufacturer_data': self.manufacturer_data}
+
+    def copy(self):
+        entry = ScanEntry.__new__(ScanEntry)
+        for attr in self.__slots__:
+            setattr(entry, attr, getattr(self, attr))
+        return entry
+
+    def to_dict(self):
+        return {'address': self.address, 'name': self.name, 'rssi': self.rssi,
+                'first_seen': self.first_seen, 'last_seen': self.last_seen,
+                'services': self.services,
+                'manufacturer_data': {str(cid): bytes(raw).hex() for cid, raw
+                                      in self.manufacturer_data.items()},
+                'service_data': {uuid: bytes(raw).hex() for uuid, raw
+                                 in self.service_data.items()}}
+
+    @classmethod
+    def from_dict(cls, entry_dict):
+        entry = cls(entry_dict['address'], name=entry_dict.get('name'),
+                    rssi=entry_dict.get('rssi'))
+        entry.first_seen = entry_dict.get('first_seen', entry.first_seen)
+        entry.last_seen = entry_dict.get('last_seen', entry.last_seen)
+        entry.services = entry_dict.get('services', [])
+        entry.manufacturer_data = {int(cid): bytes.fromhex(raw) for cid, raw
+                                   in entry_dict.get('manufacturer_data', {}).items()}
+        entry.service_data = {uuid: bytes.fromhex(raw) for uuid, raw
+                              in entry_dict.get('service_data', {}).items()}
+        return entry
+
+    def __repr__(self):
+        return "{}: {}, RSSI: {} dBm".format(self.address, self.name, self.rssi)
+
+
+
+class ScanCache:
+    """
+    Recently seen devices, kept after they are lost by the scan.
+
+    Entries are :class:`ScanEntry` objects (the live ones while scanning),
+    valid for ``ttl`` seconds after they were last seen. If ``path`` is
+    given the cache can be persisted there with :meth:`save` and
+    :meth:`load`, so a new bleico process starts with the last known devices.
+    """
+
+    def __init__(self, ttl=120, path=None, log=None):
+        self.ttl = ttl
+        self.path = path
+        self.log = log
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def put(self, entry):
+        with self._lock:
+            self.entries[entry.address] = entry
+
+    def get(self, address, max_age=None):
+        """Entry of ``address`` if seen in the last ``max_age`` (default ttl) seconds"""
+        if max_age is None:
+            max_age = self.ttl
+        with self._lock:
+            entry = self.entries.get(address)
+            if entry is not None and time.time() - entry.last_seen <= max_age:
+                return entry.copy()
+        return None
+
+    def devices(self, max_age=None):
+        """Copies of the entries seen in the last ``max_age`` (default ttl) seconds"""
+        if max_age is None:
+            max_age = self.ttl
+        now = time.time()
+        with self._lock:
+            return [entry.copy() for entry in self.entries.values()
+                    if now - entry.last_seen <= max_age]
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            for address in [address for address, entry in self.entries.items()
+                            if now - entry.last_seen > self.ttl]:
+                self.entries.pop(address)
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as cache_file:
+                cached = json.load(cache_file)
+            with self._lock:
+                for entry_dict in cached:
+                    if entry_dict['address'] not in self.entries:
+                        entry = ScanEntry.from_dict(entry_dict)
+                        self.entries[entry.address] = entry
+            self.prune()
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+
+    def save(self):
+        if self.path is None:
+            return
+        self.prune()
+        try:
+            with self._lock:
+                cached = [entry.to_dict() for entry in self.entries.values()]
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(cached, cache_file)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+
+
+_scan_cache = None
+
+
+def get_scan_cache(path=None, log=None):
+    """
+    Process wide ScanCache, pass ``path`` once (e.g. ``~/.bleico/scan_cache.json``)
+    to persist it.
+    """
+    global _scan_cache
+    if _scan_cache is None:
+        _scan_cache = ScanCache(log=log)
+    if path is not None and _scan_cache.path is None:
+        _scan_cache.path = path
+        _scan_cache.load()
+    if _scan_cache.log is None:
+        _scan_cache.log = log
+    return _scan_cache
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import re
+import threading
+import time
+import traceback
+from bleico.ble_device import ble_stream_scan, BLE_DEVICE
+from bleico.scan_cache import ScanEntry, get_scan_cache
+
+NEW = 'new'
+UPDATE = 'update'
+LOST = 'lost'
+
+
+class ScanEvent:
+    """Change in the scan table, ``kind`` is one of new, update, lost"""
+    __slots__ = ('kind', 'address', 'entry')
+
+    def __init__(self, kind, address, entry):
+        self.kind = kind
+        self.address = address
+        self.entry = entry
+
+    def __repr__(self):
+        return "{} {}".format(self.kind, self.entry)
+
+
+class ScanService:
+    """
+    Continuous scan shared by every consumer in the process.
+
+    Scanning runs in its own thread while there is at least one
+    subscriber (:meth:`subscribe` or :meth:`acquire`), and keeps a table of
+    seen devices with EWMA smoothed RSSI, last seen time, services and
+    manufacturer/service data. Subscribers are called from the scan
+    thread with a :class:`ScanEvent` when a device is first seen, when
+    its name, data or smoothed RSSI (by ``rssi_delta`` dBm or more)
+    changes, and when it has not been seen for ``expiry`` seconds.
+
+    :param alpha: EWMA weight of a new RSSI sample
+    :param expiry: seconds without advertisements before a device is lost
+    :param rssi_delta: minimum smoothed RSSI change to emit an update
+    :param scan: `False` to not scan, the table is fed through
+                 :meth:`on_detection` (e.g. replaying recorded advertisements)
+    :param cache: :class:`bleico.scan_cache.ScanCache`, default the process wide one.
+                  Recently seen devices are shown as soon as scanning starts and
+                  the cache is saved each time scanning stops.
+    """
+
+    def __init__(self, alpha=0.3, expiry=30, rssi_delta=2, scan=True, cache=None,
+                 log=None):
+        self.alpha = alpha
+        self.expiry = expiry
+        self.rssi_delta = rssi_delta
+        self.scan = scan
+        self.log = log
+        self.table = {}
+        self._emitted_rssi = {}
+        self._subscribers = []
+        self._detection_callbacks = []
+        self._users = 0
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._thread = None
+        self._stop = False
+        self._last_sweep = 0
+        self._scan_started = 0
+        self.cache = cache if cache is not None else get_scan_cache(log=log)
+
+    # SUBSCRIPTIONS
+
+    def subscribe(self, callback):
+        """Call ``callback(event)`` on table changes, starts scanning"""
+        with self._lock:
+            self._subscribers.append(callback)
+        self.acquire()
+
+    def unsubscribe(self, callback, wait=True):
+        with self._lock:
+            if callback not in self._subscribers:
+                return
+            self._subscribers.remove(callback)
+        self.release(wait=wait)
+
+    def add_detection_callback(self, callback):
+        """Call ``callback(device, advertisement_data)`` on every advertisement"""
+        self._detection_callbacks.append(callback)
+
+    def remove_detection_callback(self, callback):
+        if callback in self._detection_callbacks:
+            self._detection_callbacks.remove(callback)
+
+    def acquire(self):
+        """Keep scanning without subscribing, e.g. while waiting for a device"""
+        with self._lock:
+            self._users += 1
+            start = self._users == 1
+        if start:
+            self.start()
+
+    def release(self, wait=True):
+        with self._lock:
+            self._users -= 1
+            stop = self._users == 0
+        if stop:
+            self.stop(wait=wait)
+
+    def wait_stopped(self, timeout=2):
+        """Wait for the scanner to be stopped if there are no users left"""
+        thread = self._thread
+        if self._users == 0 and thread is not None:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    @property
+    def scanning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # SCAN THREAD
+
+    def start(self):
+        if not self.scan:
+            return
+        if self._thread is not None:
+            # previous scan still stopping
+            self._thread.join(2)
+        self.load_cache()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='ScanThread',
+                                        daemon=True)
+        self._thread.start()
+
+    def load_cache(self):
+        """
+        Add the recently seen devices of the cache to the table, they are
+        refreshed or expired by this scan. The table entry is put back in
+        the cache, so that every detection keeps the cache up to date.
+        """
+        self._scan_started = time.time()
+        with self._lock:
+            for entry in self.cache.devices():
+                if entry.address not in self.table:
+                    self.table[entry.address] = entry
+                    self._emitted_rssi[entry.address] = entry.rssi
+                    self.cache.put(entry)
+
+    def stop(self, wait=True):
+        self._stop = True
+        if wait and self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join(2)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            ble_stream_scan(self.on_detection, stop=self._check_stop,
+                            timeout=None, loop=loop)
+        except Exception as e:
+            if self.log:
+                self.log.error(traceback.format_exc())
+        finally:
+            loop.close()
+            self.cache.save()
+
+    def _check_stop(self):
+        now = time.time()
+        if now - self._last_sweep > 1:
+            self._last_sweep = now
+            self.expire(now)
+        return self._stop
+
+    # TABLE
+
+    def on_detection(self, device, advertisement_data=None):
+        """bleak detection callback, also usable to feed the table directly"""
+        now = time.time()
+        for callback in self._detection_callbacks:
+            try:
+                callback(device, advertisement_data)
+            except Exception as e:
+                if self.log:
+                    self.log.error(traceback.format_exc())
+        if advertisement_data is not None:
+            name = advertisement_data.local_name or device.name
+            services = list(advertisement_data.service_uuids)
+            manufacturer_data = dict(advertisement_data.manufacturer_data)
+            service_data = dict(advertisement_data.service_data)
+        else:
+            name = device.name
+            metadata = getattr(device, 'metadata', None) or {}
+            services = list(metadata.get('uuids', []))
+            manufacturer_data = dict(metadata.get('manufacturer_data', {}))
+            service_data = {}
+        with self._lock:
+            entry = self.table.get(device.address)
+            if entry is None:
+                entry = self.table[device.address] = ScanEntry(device.address, name=name,
+                                                               rssi=device.rssi)
+                self.cache.put(entry)
+                kind = NEW
+            else:
+                kind = None
+                entry.rssi_ewma += self.alpha * (device.rssi - entry.rssi_ewma)
+                entry.rssi = int(round(entry.rssi_ewma))
+                if name and name != entry.name:
+                    entry.name = name
+                    kind = UPDATE
+            entry.rssi_raw = device.rssi
+            entry.device = device
+            entry.last_seen = now
+            entry.count += 1
+            if services and services != entry.services:
+                entry.services = services
+                kind = kind or UPDATE
+            if manufacturer_data and manufacturer_data != entry.manufacturer_data:
+                entry.manufacturer_data = manufacturer_data
+                kind = kind or UPDATE
+            if service_data and service_data != entry.service_data:
+                entry.service_data = service_data
+                kind = kind or UPDATE
+            if kind is None:
+                if abs(entry.rssi - self._emitted_rssi[entry.address]) >= self.rssi_delta:
+                    kind = UPDATE
+            if kind is not None:
+                self._emitted_rssi[entry.address] = entry.rssi
+                event = ScanEvent(kind, entry.address, entry.copy())
+            for waiter in self._waiters:
+                if waiter.result is None and waiter.match(entry):
+                    waiter.result = entry.copy()
+                    waiter.found.set()
+        if kind is not None:
+            self._emit(event)
+        if now - self._last_sweep > 1:
+            self._last_sweep = now
+            self.expire(now)
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            lost = [address for address, entry in self.table.items()
+                    if now - max(entry.last_seen, self._scan_started) > self.expiry]
+            events = [ScanEvent(LOST, address, self.table.pop(address)) for address in lost]
+            for address in lost:
+                self._emitted_rssi.pop(address, None)
+        for event in events:
+            self._emit(event)
+
+    def _emit(self, event):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                if self.log:
+                    self.log.error(traceback.format_exc())
+
+    def devices(self):
+        """Snapshot of the table, strongest RSSI first"""
+        with self._lock:
+            entries = [entry.copy() for entry in self.table.values()]
+        return sorted(entries, key=lambda entry: entry.rssi, reverse=True)
+
+    def recent_devices(self):
+        """Devices in the table or seen recently (cache), strongest RSSI first"""
+        with self._lock:
+            entries = {address: entry.copy() for address, entry in self.table.items()}
+        for entry in self.cache.devices():
+            entries.setdefault(entry.address, entry)
+        return sorted(entries.values(), key=lambda entry: entry.rssi, reverse=True)
+
+    def get(self, address):
+        with self._lock:
+            entry = self.table.get(address)
+            return entry.copy() if entry is not None else None
+
+    def wait_for(self, address, timeout=None, since=None):
+        """
+        Wait until ``address`` advertises (after ``since`` if given),
+        returns its ScanEntry or `None` on timeout.
+        """
+        return self.wait_match(ScanFilter(address=address), timeout=timeout, since=since)
+
+    def wait_match(self, scan_filter, timeout=None, since=None):
+        """
+        Wait for a device matching ``scan_filter`` (seen after ``since``
+        if given), returns its ScanEntry or `None` on timeout.
+        Does not start scanning, see :meth:`find_first`.
+        """
+        waiter = _Waiter(scan_filter, since)
+        with self._lock:
+            for entry in self.table.values():
+                if waiter.match(entry):
+                    return entry.copy()
+            self._waiters.append(waiter)
+        try:
+            waiter.found.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters.remove(waiter)
+        return waiter.result
+
+    def find_first(self, scan_filter, timeout=10):
+        """
+        Scan until the first advertisement matching ``scan_filter``,
+        returns its ScanEntry or `None` after ``timeout`` seconds.
+        """
+        self.acquire()
+        try:
+            return self.wait_match(scan_filter, timeout=timeout, since=time.time())
+        finally:
+            # stop scanning before connecting
+            self.release()
+
+
+class _Waiter:
+    __slots__ = ('scan_filter', 'since', 'found', 'result')
+
+    def __init__(self, scan_filter, since=None):
+        self.scan_filter = scan_filter
+        self.since = since
+        self.found = threading.Event()
+        self.result = None
+
+    def match(self, entry):
+        if self.since is not None and entry.last_seen <= self.since:
+            return False
+        return self.scan_filter.match(entry)
+
+
+class ScanFilter:
+    """
+    Match advertising devices by address, name, advertised service and
+    minimum (smoothed) RSSI, any ``None`` criteria matches everything.
+
+    :param service: service uuid (16 bit ``'181a'`` or 128 bit) or SIG name
+    """
+
+    def __init__(self, address=None, name=None, service=None, min_rssi=None):
+        self.address = address.upper() if address else None
+        self.name = name
+        self.min_rssi = min_rssi
+        self.service = None
+        if service:
+            service = service.lower()
+            if len(service) == 4:
+                service = '0000{}-0000-1000-8000-00805f9b34fb'.format(service)
+            elif not UUID_RE.match(service):
+                # SIG service name
+                from bleak.uuids import uuid16_dict
+                service = {name.lower(): uuid for uuid, name in uuid16_dict.items()}.get(
+                    service, service)
+                if isinstance(service, int):
+                    service = '0000{:04x}-0000-1000-8000-00805f9b34fb'.format(service)
+            self.service = service
+
+    def match(self, entry):
+        if self.address is not None and entry.address.upper() != self.address:
+            return False
+        if self.name is not None and entry.name != self.name:
+            return False
+        if self.min_rssi is not None and (entry.rssi is None or entry.rssi < self.min_rssi):
+            return False
+        if self.service is not None:
+            if self.service not in [serv.lower() for serv in entry.services]:
+                return False
+        return True
+
+    def __str__(self):
+        criteria = [(key, getattr(self, key)) for key in ('address', 'name', 'service', 'min_rssi')]
+        return ', '.join(["{}: {}".format(key, val) for key, val in criteria if val is not None])
+
+
+ADDRESS_RE = re.compile(r'^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$')
+UUID_RE = re.compile(r'^[0-9A-Fa-f]{8}-([0-9A-Fa-f]{4}-){3}[0-9A-Fa-f]{12}$')
+
+
+def parse_target(target, service=None, min_rssi=None):
+    """
+    Target string --> ScanFilter, an address (MAC or macOS uuid) or
+    otherwise a device name.
+    """
+    if isinstance(target, ScanFilter):
+        return target
+    if target is not None and (ADDRESS_RE.match(target) or UUID_RE.match(target)):
+        return ScanFilter(address=target, service=service, min_rssi=min_rssi)
+    return ScanFilter(name=target, service=service, min_rssi=min_rssi)
+
+
+def connect_first(target, scan_service=None, timeout=10, log=None):
+    """
+    Scan for ``target`` (address, name or ScanFilter) and connect as soon
+    as the first matching advertisement arrives.
+
+    Returns the BLE_DEVICE, or `None` if not found. For address targets
+    not seen by the scan, a direct connection (bleak discovery) is tried.
+    """
+    scan_filter = parse_target(target)
+    if scan_service is None:
+        scan_service = get_scan_service(log=log)
+    t0 = time.time()
+    entry = scan_service.find_first(scan_filter, timeout=timeout)
+    if entry is None:
+        if log:
+            log.info("Target [{}] not seen in {} s".format(scan_filter, timeout))
+        if scan_filter.address is None:
+            return None
+        dev = BLE_DEVICE(scan_filter.address, init=True, log=log)
+    else:
+        t_found = time.time()
+        if log:
+            log.info("Target found: {} ({}), RSSI: {} dBm in {:.2f} s".format(
+                entry.name, entry.address, entry.rssi, t_found - t0))
+        dev = BLE_DEVICE(entry.device if entry.device is not None else entry,
+                         init=True, log=log)
+        if dev.connected and log:
+            log.info("Scan to connect: {:.2f} s (connect: {:.2f} s)".format(
+                dev.connect_time - t0, dev.connect_time - t_found))
+    return dev
+
+
+_scan_service = None
+
+
+def get_scan_service(log=None):
+    """Process wide ScanService"""
+    global _scan_service
+    if _scan_service is None:
+        _scan_service = ScanService(log=log)
+    elif _scan_service.log is None:
+        _scan_service.log = log
+    return _scan_service
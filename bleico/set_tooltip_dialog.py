@@ -23,6 +23,8 @@ from PyQt5 import QtWidgets, QtGui, QtCore
 
 
 class ChecklistDialog(QtWidgets.QDialog):
+    choices_changed = QtCore.pyqtSignal(list)
+
     def __init__(self,
                  name,
                  stringlist=None,
@@ -82,14 +84,17 @@ class ChecklistDialog(QtWidgets.QDialog):
                         range(self.model.rowCount())
                         if self.model.item(i).checkState()
                         == QtCore.Qt.Checked]
-        self.accept()
         self.log.info('Checklist Choices {}'.format(self.choices))
+        prev_check_list = self.check_list.copy()
         for ch in self.choices:
             if ch not in self.check_list:
                 self.check_list.append(ch)
         for ch in self.check_list.copy():
             if ch not in self.choices:
                 self.check_list.remove(ch)
+        if self.check_list != prev_check_list:
+            self.choices_changed.emit(self.check_list)
+        self.accept()
 
     def select(self):
         for i in range(self.model.rowCount()):
@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+import xml.etree.ElementTree as ET
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from bleak.exc import BleakError
+from bleak.uuids import uuidstr_to_str
+from bleico.gatt_profile import SIG_UUID_FMT
+
+CCCD_UUID = SIG_UUID_FMT.format(0x2902)
+
+# seconds per operation, before jitter
+DEFAULT_LATENCY = {'connect': 0.05, 'read': 0.01, 'write': 0.01,
+                   'notify': 0.0, 'rssi': 0.001}
+
+ESP32_ADDRESS = '5E:00:00:00:00:01'
+XML_ADDRESS = '5E:00:00:00:00:02'
+
+
+def sig_uuid(uuid):
+    """16 bit int or uuid string --> lower case 128 bit uuid string"""
+    if isinstance(uuid, int):
+        return SIG_UUID_FMT.format(uuid)
+    return uuid.lower()
+
+
+class SimDescriptor:
+    """Descriptor of a simulated characteristic, as bleak ``BleakGATTDescriptor``"""
+    __slots__ = ('uuid', 'handle', 'characteristic_handle', 'value')
+
+    def __init__(self, uuid, handle, characteristic_handle, value=b'\x00\x00'):
+        self.uuid = uuid
+        self.handle = handle
+        self.characteristic_handle = characteristic_handle
+        self.value = value
+
+    @property
+    def description(self):
+        return uuidstr_to_str(self.uuid)
+
+
+class SimCharacteristic:
+    """
+    Characteristic of a simulated GATT table.
+
+    value
+        stored value, returned by reads and set by writes
+    generator
+        optional ``generator(t) --> bytes``, ``t`` seconds since the
+        peripheral was created. If set, reads and notifications return
+        its value instead of the stored one, until a write.
+    notify_interval
+        seconds between notifications, while subscribed, `None` for
+        none (only :meth:`SimPeripheral.notify`)
+    """
+
+    def __init__(self, uuid, properties, value=b'', generator=None, notify_interval=1.0):
+        self.uuid = sig_uuid(uuid)
+        self.properties = list(properties)
+        self.value = bytes(value)
+        self.generator = generator
+        self.notify_interval = notify_interval
+        self.handle = None
+        self.service_uuid = None
+        self.descriptors = []
+
+    @property
+    def description(self):
+        return uuidstr_to_str(self.uuid)
+
+    @property
+    def notifiable(self):
+        return 'notify' in self.properties or 'indicate' in self.properties
+
+    def read(self, t):
+        if self.generator is not None:
+            return bytes(self.generator(t))
+        return self.value
+
+    def write(self, data):
+        self.value = bytes(data)
+        self.generator = None
+
+    def get_descriptor(self, specifier):
+        for descriptor in self.descriptors:
+            if specifier in (descriptor.handle, descriptor.uuid):
+                return descriptor
+        return None
+
+
+class SimService:
+    """Service of a simulated GATT table, as bleak ``BleakGATTService``"""
+
+    def __init__(self, uuid, characteristics=()):
+        self.uuid = sig_uuid(uuid)
+        self.characteristics = list(characteristics)
+        self.handle = None
+
+    @property
+    def description(self):
+        return uuidstr_to_str(self.uuid)
+
+    def get_characteristic(self, uuid):
+        for char in self.characteristics:
+            if char.uuid == sig_uuid(uuid):
+                return char
+        return None
+
+
+class SimServices:
+    """
+    GATT table of a simulated peripheral, as bleak
+    ``BleakGATTServiceCollection``: iterates over the services and
+    allocates handles the way BlueZ does (service, characteristic, CCCD),
+    handles already set (e.g. a recorded table) are kept.
+    """
+
+    def __init__(self, services):
+        self.services = {}
+        self.characteristics = {}
+        self.descriptors = {}
+        handle = 0
+        for service in services:
+            if service.handle is None:
+                service.handle = handle
+            handle = service.handle
+            self.services[service.uuid] = service
+            for char in service.characteristics:
+                if char.handle is None:
+                    char.handle = handle + 1
+                handle = char.handle
+                char.service_uuid = service.uuid
+                self.characteristics[handle] = char
+                if char.notifiable and not char.descriptors:
+                    char.descriptors.append(SimDescriptor(CCCD_UUID, handle + 1, char.handle))
+                for descriptor in char.descriptors:
+                    self.descriptors[descriptor.handle] = descriptor
+                    handle = max(handle, descriptor.handle)
+            handle += 1
+
+    def __iter__(self):
+        return iter(self.services.values())
+
+    def get_service(self, uuid):
+        return self.services.get(sig_uuid(uuid))
+
+    def get_characteristic(self, specifier):
+        """handle, uuid or characteristic --> SimCharacteristic or `None`"""
+        if isinstance(specifier, SimCharacteristic):
+            return specifier
+        if isinstance(specifier, int):
+            return self.characteristics.get(specifier)
+        uuid = sig_uuid(specifier)
+        for char in self.characteristics.values():
+            if char.uuid == uuid:
+                return char
+        return None
+
+    def get_descriptor(self, handle):
+        return self.descriptors.get(handle)
+
+
+class SimFaults:
+    """
+    Fault injection, probabilities per operation.
+
+    connect_fail
+        connection attempt fails
+    disconnect
+        the link drops during a read, write or notification
+    timeout
+        the operation fails after ``timeout_delay`` seconds
+    malformed
+        a read or notification returns a truncated payload
+    """
+    __slots__ = ('connect_fail', 'disconnect', 'timeout', 'malformed', 'timeout_delay')
+
+    def __init__(self, connect_fail=0.0, disconnect=0.0, timeout=0.0, malformed=0.0,
+                 timeout_delay=1.0):
+        self.connect_fail = connect_fail
+        self.disconnect = disconnect
+        self.timeout = timeout
+        self.malformed = malformed
+        self.timeout_delay = timeout_delay
+
+    def to_dict(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+
+class SimPeripheral:
+    """
+    In-memory BLE peripheral: GATT table, advertisement, link timing
+    and faults. One peripheral can be connected by several clients.
+
+    :param latency: `dict` operation --> seconds, see ``DEFAULT_LATENCY``
+    :param jitter: maximum random delay added to each operation
+    :param mtu: ATT MTU, notifications are truncated to ``mtu - 3``
+        and reads take one round trip per ``mtu - 1`` bytes
+    :param max_outstanding: notifications of :meth:`notify` waiting for
+        the client event loops before it blocks
+    """
+
+    def __init__(self, address, name, services, rssi=-60, adv_services=None,
+                 manufacturer_data=None, latency=None, jitter=0.002, mtu=23,
+                 faults=None, seed=None, max_outstanding=1024):
+        self.address = address.upper()
+        self.name = name
+        self.services = SimServices(services)
+        self.rssi = rssi
+        self.adv_services = [sig_uuid(uuid) for uuid in adv_services] if adv_services else [
+            service.uuid for service in self.services]
+        self.manufacturer_data = manufacturer_data or {}
+        self.latency = dict(DEFAULT_LATENCY)
+        if latency:
+            self.latency.update(latency)
+        self.jitter = jitter
+        self.mtu = mtu
+        self.faults = faults or SimFaults()
+        self.rng = random.Random(seed)
+        self.advertising = True
+        self.clients = set()
+        self.t0 = time.time()
+        self.stats = {'connects': 0, 'disconnects': 0, 'reads': 0, 'writes': 0,
+                      'notifications': 0, 'timeouts': 0, 'malformed': 0}
+        self._outstanding = threading.BoundedSemaphore(max_outstanding)
+
+    def now(self):
+        return time.time() - self.t0
+
+    def delay(self, op, rounds=1):
+        return rounds * self.latency.get(op, 0) + self.rng.uniform(0, self.jitter)
+
+    def fault(self, kind):
+        rate = getattr(self.faults, kind)
+        return rate > 0 and self.rng.random() < rate
+
+    def malform(self, raw):
+        if raw and self.fault('malformed'):
+            self.stats['malformed'] += 1
+            return raw[:self.rng.randrange(len(raw))]
+        return raw
+
+    def advertisement(self):
+        """(BLEDevice, AdvertisementData) as given by bleak detection callbacks"""
+        rssi = int(round(self.rssi + self.rng.gauss(0, 2)))
+        device = BLEDevice(self.address, self.name, details={'sim': True}, rssi=rssi,
+                           uuids=self.adv_services,
+                           manufacturer_data=self.manufacturer_data)
+        advertisement_data = AdvertisementData(local_name=self.name,
+                                               manufacturer_data=self.manufacturer_data,
+                                               service_uuids=self.adv_services)
+        return device, advertisement_data
+
+    def subscribed(self, handle):
+        """`True` if a connected client has notifications on ``handle``"""
+        return any(handle in client._subscriptions for client in list(self.clients))
+
+    def notify(self, handle, data, timeout=1.0):
+        """
+        Set the value of characteristic ``handle`` and notify it to the
+        subscribed clients, from any thread. Blocks while
+        ``max_outstanding`` notifications are waiting for the client
+        event loops (up to ``timeout`` seconds each, then it is dropped),
+        returns the number of clients notified.
+        """
+        char = self.services.characteristics.get(handle)
+        if char is not None:
+            char.value = bytes(data)
+        n_clients = 0
+        for client in list(self.clients):
+            subscription = client._subscriptions.get(handle)
+            if subscription is None:
+                continue
+            if not self._outstanding.acquire(timeout=timeout):
+                continue
+            loop, callback = subscription
+            try:
+                loop.call_soon_threadsafe(self._deliver, client, handle, callback,
+                                          bytearray(data))
+                n_clients += 1
+            except RuntimeError:  # loop closed
+                self._outstanding.release()
+        return n_clients
+
+    def _deliver(self, client, handle, callback, data):
+        try:
+            if client._subscriptions.get(handle, (None, None))[1] is callback:
+                self.stats['notifications'] += 1
+                callback(handle, data[:self.mtu - 3])
+        finally:
+            self._outstanding.release()
+
+    def drop(self):
+        """Drop every connection, as if the peripheral went out of range"""
+        for client in list(self.clients):
+            client.link_lost()
+
+    def set_advertising(self, advertising):
+        self.advertising = advertising
+        if not advertising:
+            self.drop()
+
+
+class SimDeviceInfo:
+    def __init__(self, peripheral):
+        self._peripheral = peripheral
+
+    def name(self):
+        return self._peripheral.name
+
+
+class SimClient:
+    """
+    Client of a :class:`SimPeripheral` with the bleak 0.10
+    ``BleakClient`` interface used by bleico. Notifications run as
+    tasks of the event loop that called :meth:`start_notify`, so as with
+    bleak they are delivered while that loop runs (also those of
+    :meth:`SimPeripheral.notify`).
+    """
+
+    def __init__(self, address_or_ble_device, backend):
+        if hasattr(address_or_ble_device, 'address'):
+            self.address = address_or_ble_device.address.upper()
+        else:
+            self.address = address_or_ble_device.upper()
+        self.backend = backend
+        self.peripheral = None
+        self.connected = False
+        self._device_info = None
+        self._disconnected_callback = None
+        self._notify_tasks = {}
+        self._subscriptions = {}  # handle --> (event loop, callback)
+
+    @property
+    def services(self):
+        if self.peripheral is None:
+            raise BleakError("Service discovery has not been performed yet")
+        return self.peripheral.services
+
+    async def connect(self, timeout=10.0, **kwargs):
+        peripheral = self.backend.find(self.address)
+        if peripheral is None or not peripheral.advertising:
+            await asyncio.sleep(timeout)
+            raise BleakError("Device with address {} was not found.".format(self.address))
+        await asyncio.sleep(peripheral.delay('connect'))
+        if peripheral.fault('connect_fail'):
+            raise BleakError("Connection to {} failed".format(self.address))
+        self.peripheral = peripheral
+        self._device_info = SimDeviceInfo(peripheral)
+        self.connected = True
+        peripheral.clients.add(self)
+        peripheral.stats['connects'] += 1
+        return True
+
+    async def is_connected(self):
+        return self.connected
+
+    async def disconnect(self):
+        if self.connected:
+            self._close()
+        return True
+
+    def _close(self):
+        self.connected = False
+        for task in self._notify_tasks.values():
+            task.cancel()
+        self._notify_tasks = {}
+        self._subscriptions = {}
+        if self.peripheral is not None:
+            self.peripheral.clients.discard(self)
+            self.peripheral.stats['disconnects'] += 1
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+    def link_lost(self):
+        if self.connected:
+            self._close()
+
+    def set_disconnected_callback(self, callback, **kwargs):
+        self._disconnected_callback = callback
+
+    async def _operation(self, op, rounds=1):
+        if not self.connected:
+            raise BleakError("Not connected")
+        peripheral = self.peripheral
+        if peripheral.fault('disconnect'):
+            self.link_lost()
+            raise BleakError("Not connected")
+        if peripheral.fault('timeout'):
+            peripheral.stats['timeouts'] += 1
+            await asyncio.sleep(peripheral.faults.timeout_delay)
+            raise BleakError("Operation timed out")
+        await asyncio.sleep(peripheral.delay(op, rounds=rounds))
+        if not self.connected:
+            raise BleakError("Not connected")
+
+    def _char(self, char_specifier):
+        char = self.services.get_characteristic(char_specifier)
+        if char is None:
+            raise BleakError("Characteristic {} was not found!".format(char_specifier))
+        return char
+
+    async def read_gatt_char(self, char_specifier, **kwargs):
+        char = self._char(char_specifier)
+        if 'read' not in char.properties:
+            raise BleakError("Characteristic {} is not readable".format(char.uuid))
+        raw = char.read(self.peripheral.now())
+        # long reads: one ATT Read Blob per mtu - 1 bytes
+        await self._operation('read', rounds=max(1, math.ceil(len(raw) / (self.peripheral.mtu - 1))))
+        self.peripheral.stats['reads'] += 1
+        return bytearray(self.peripheral.malform(raw))
+
+    async def write_gatt_char(self, char_specifier, data, response=False):
+        char = self._char(char_specifier)
+        if 'write' not in char.properties and 'write-without-response' not in char.properties:
+            raise BleakError("Characteristic {} is not writeable".format(char.uuid))
+        payload = self.peripheral.mtu - 3
+        if not response and len(data) > payload:
+            raise BleakError("Write without response longer than MTU - 3 ({} bytes)".format(payload))
+        await self._operation('write', rounds=max(1, math.ceil(len(data) / payload)))
+        char.write(data)
+        self.peripheral.stats['writes'] += 1
+
+    async def read_gatt_descriptor(self, handle, **kwargs):
+        descriptor = self.services.get_descriptor(handle)
+        if descriptor is None:
+            raise BleakError("Descriptor {} was not found!".format(handle))
+        await self._operation('read')
+        return bytearray(descriptor.value)
+
+    async def write_gatt_descriptor(self, handle, data):
+        descriptor = self.services.get_descriptor(handle)
+        if descriptor is None:
+            raise BleakError("Descriptor {} was not found!".format(handle))
+        await self._operation('write')
+        descriptor.value = bytes(data)
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        char = self._char(char_specifier)
+        if not char.notifiable:
+            raise BleakError("Characteristic {} does not support notifications".format(char.uuid))
+        await self._operation('write')
+        if char.handle in self._notify_tasks:
+            self._notify_tasks.pop(char.handle).cancel()
+        self._subscriptions[char.handle] = (asyncio.get_event_loop(), callback)
+        if char.notify_interval is not None:
+            self._notify_tasks[char.handle] = asyncio.ensure_future(self._notify(char, callback))
+
+    async def stop_notify(self, char_specifier):
+        char = self._char(char_specifier)
+        self._subscriptions.pop(char.handle, None)
+        task = self._notify_tasks.pop(char.handle, None)
+        if task is not None:
+            task.cancel()
+        await self._operation('write')
+
+    async def _notify(self, char, callback):
+        peripheral = self.peripheral
+        # fixed rate: a late notification is sent right away, not skipped
+        t_next = time.monotonic()
+        while self.connected:
+            t_next += char.notify_interval
+            await asyncio.sleep(max(0, t_next - time.monotonic()) + peripheral.delay('notify'))
+            if not self.connected:
+                break
+            if peripheral.fault('disconnect'):
+                self.link_lost()
+                break
+            raw = peripheral.malform(char.read(peripheral.now()))[:peripheral.mtu - 3]
+            peripheral.stats['notifications'] += 1
+            callback(char.handle, bytearray(raw))
+
+    async def get_rssi(self):
+        await self._operation('rssi')
+        return int(round(self.peripheral.rssi + self.peripheral.rng.gauss(0, 2)))
+
+
+class SimScanner:
+    """Scanner reporting the advertisements of the backend peripherals"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._callback = None
+        self._task = None
+
+    def register_detection_callback(self, callback):
+        self._callback = callback
+
+    async def start(self):
+        self._task = asyncio.ensure_future(self._advertise())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _advertise(self):
+        while True:
+            for peripheral in list(self.backend.peripherals.values()):
+                if peripheral.advertising and self._callback is not None:
+                    self._callback(*peripheral.advertisement())
+            await asyncio.sleep(self.backend.adv_interval)
+
+
+class SimBackend:
+    """
+    Simulated BLE backend, install it with
+    :func:`bleico.ble_device.set_backend`.
+
+    :param adv_interval: seconds between advertisements of each peripheral
+    """
+    name = 'sim'
+
+    def __init__(self, peripherals=(), adv_interval=0.1):
+        self.peripherals = {}
+        self.adv_interval = adv_interval
+        for peripheral in peripherals:
+            self.add(peripheral)
+
+    def add(self, peripheral):
+        self.peripherals[peripheral.address] = peripheral
+        return peripheral
+
+    def find(self, address):
+        return self.peripherals.get(address.upper())
+
+    def client(self, address_or_ble_device):
+        return SimClient(address_or_ble_device, self)
+
+    def scanner(self):
+        return SimScanner(self)
+
+    async def discover(self, timeout=5):
+        await asyncio.sleep(timeout)
+        return [peripheral.advertisement()[0] for peripheral in self.peripherals.values()
+                if peripheral.advertising]
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        ``'esp32'``, an nRF Connect server configuration ``.xml`` or a
+        ``.json`` configuration (see :func:`load_sim_config`) --> SimBackend
+        """
+        if spec.endswith('.json'):
+            return load_sim_config(spec)
+        if spec.endswith('.xml'):
+            return cls([load_nrf_connect_xml(spec)])
+        if spec == 'esp32':
+            return cls([esp32_batt_cputemp()])
+        raise ValueError("Unknown simulated device: {}, use esp32, a .xml or a .json file".format(spec))
+
+
+# GATT TABLES
+
+def mask_8bit(key0, key1, key2, key3):
+    """Battery Power State, as ``BLE_Battery_Temp._mask_8bit``"""
+    return struct.pack('B', (key0 << 6) + (key1 << 4) + (key2 << 2) + key3)
+
+
+def esp32_batt_cputemp(address=ESP32_ADDRESS, name='esp32-batt-temp', period=600,
+                       notify_interval=1.0, **kwargs):
+    """
+    SimPeripheral mirroring ``examples/micropython_esp32/ble_batt_cputemp.py``:
+    Device Information, Battery (level, power state) and Environmental
+    Sensing (temperature, temperature range) services.
+
+    The battery discharges from 100 to 0 % every ``period`` seconds and
+    the temperature oscillates around 55 C. Keyword arguments go to
+    :class:`SimPeripheral`.
+    """
+    def battery_level(t):
+        return struct.pack('B', int(100 - 100 * (t % period) / period))
+
+    def battery_power_state(t):
+        level = 100 - 100 * (t % period) / period
+        if level > 90:
+            return mask_8bit(2, 3, 3, 3)
+        if level < 10:
+            return mask_8bit(3, 3, 3, 3)
+        return mask_8bit(2, 2, 3, 3)
+
+    def temperature(t):
+        return struct.pack('h', int((55 + 8 * math.sin(2 * math.pi * t / 60)) * 100))
+
+    dev_info = SimService(0x180A, [
+        SimCharacteristic(0x2A01, ['read'], struct.pack('h', 768)),
+        SimCharacteristic(0x2A29, ['read'], b'Espressif Incorporated'),
+        SimCharacteristic(0x2A24, ['read'], b'ESP32 module with ESP32'),
+        SimCharacteristic(0x2A25, ['read'], b'30:AE:A4:00:00:01'),
+        SimCharacteristic(0x2A26, ['read'], b'micropython-1.13.0'),
+        SimCharacteristic(0x2A27, ['read'], b'esp32'),
+        SimCharacteristic(0x2A28, ['read'], b'3.4.0')])
+    battery = SimService(0x180F, [
+        SimCharacteristic(0x2A19, ['read'], generator=battery_level),
+        SimCharacteristic(0x2A1A, ['read', 'notify'], generator=battery_power_state,
+                          notify_interval=notify_interval)])
+    env_sensing = SimService(0x181A, [
+        SimCharacteristic(0x2A6E, ['read', 'notify'], generator=temperature,
+                          notify_interval=notify_interval),
+        SimCharacteristic(0x2B10, ['read', 'write'], struct.pack('hh', 5000, 6500))])
+    return SimPeripheral(address, name, [dev_info, battery, env_sensing],
+                         adv_services=[0x181A], **kwargs)
+
+
+def peripheral_from_table(address, name, table, **kwargs):
+    """
+    GATT table as stored in capture PROFILE records (see
+    :func:`bleico.gatt_capture.gatt_table`) --> SimPeripheral with the
+    recorded handles, empty values and no periodic notifications
+    (values are pushed with :meth:`SimPeripheral.notify`)
+    """
+    services = []
+    for service_entry in table:
+        chars = []
+        for char_entry in service_entry['chars']:
+            char = SimCharacteristic(char_entry['uuid'], char_entry['properties'],
+                                     notify_interval=None)
+            char.handle = char_entry['handle']
+            char.descriptors = [SimDescriptor(descriptor['uuid'], descriptor['handle'],
+                                              char.handle)
+                                for descriptor in char_entry['descriptors']]
+            chars.append(char)
+        service = SimService(service_entry['uuid'], chars)
+        service.handle = service_entry['handle']
+        services.append(service)
+    return SimPeripheral(address, name, services, **kwargs)
+
+
+def load_nrf_connect_xml(path, address=XML_ADDRESS, name=None, notify_interval=1.0,
+                         **kwargs):
+    """
+    nRF Connect GATT server configuration (e.g.
+    ``examples/nRF_Connect/bletag_profile.xml``) --> SimPeripheral with
+    its static values. Notifiable characteristics repeat their value.
+    """
+    root = ET.parse(path).getroot()
+    services = []
+    for service_el in root.iter('service'):
+        chars = []
+        for char_el in service_el.iter('characteristic'):
+            if char_el.get('value-string') is not None:
+                value = char_el.get('value-string').encode('utf8')
+            else:
+                value = bytes.fromhex(char_el.get('value', ''))
+            properties = [prop.get('name').lower().replace('_', '-')
+                          for prop in char_el.iter('property')]
+            chars.append(SimCharacteristic(char_el.get('uuid'), properties, value,
+                                           notify_interval=notify_interval))
+        services.append(SimService(service_el.get('uuid'), chars))
+    if name is None:
+        name = root.get('name', os.path.basename(path)).replace('_profile', '')
+    return SimPeripheral(address, name, services, **kwargs)
+
+
+def load_sim_config(path):
+    """
+    JSON configuration --> SimBackend::
+
+        {"adv_interval": 0.1,
+         "peripherals": [{"profile": "esp32", "latency": {"read": 0.02},
+                          "jitter": 0.005, "mtu": 23, "seed": 1,
+                          "faults": {"disconnect": 0.01, "malformed": 0.05}},
+                         {"profile": "bletag_profile.xml",
+                          "address": "5E:00:00:00:00:03"}]}
+
+    ``profile`` is ``esp32`` or an nRF Connect ``.xml`` path, relative
+    to the configuration file. The other keys go to the table builder.
+    """
+    with open(path, 'r') as config_file:
+        config = json.load(config_file)
+    backend = SimBackend(adv_interval=config.get('adv_interval', 0.1))
+    for peripheral_conf in config.get('peripherals', []):
+        kwargs = dict(peripheral_conf)
+        profile = kwargs.pop('profile', 'esp32')
+        if 'faults' in kwargs:
+            kwargs['faults'] = SimFaults(**kwargs['faults'])
+        if profile == 'esp32':
+            backend.add(esp32_batt_cputemp(**kwargs))
+        else:
+            xml_path = os.path.join(os.path.dirname(os.path.abspath(path)), profile)
+            backend.add(load_nrf_connect_xml(xml_path, **kwargs))
+    return backend
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+
+# value update stages, in pipeline order
+GATT_READ = 'gatt_read'
+NOTIFY_CALLBACK = 'notify_callback'
+DECODE = 'decode'
+FORMAT = 'format'
+DELIVER = 'deliver'
+SET_TEXT = 'set_text'
+POLL_CYCLE = 'poll_cycle'
+REFRESH_MENU = 'refresh_menu'
+RECEIVE_NOTIFICATION = 'receive_notification'
+STAGES = (GATT_READ, NOTIFY_CALLBACK, DECODE, FORMAT, DELIVER, SET_TEXT,
+          POLL_CYCLE, REFRESH_MENU, RECEIVE_NOTIFICATION)
+
+
+class StageHistogram:
+    """
+    Durations of one stage in nanoseconds, counted in log-linear buckets:
+    four per power of two, i.e. percentiles within 25 %.
+    """
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 256
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket(ns):
+        bits = ns.bit_length()
+        if bits < 3:
+            return ns
+        return (bits << 2) | ((ns >> (bits - 3)) & 3)
+
+    @staticmethod
+    def upper_bound(index):
+        if index < 12:
+            return index + 1
+        bits, sub = index >> 2, index & 3
+        return (5 + sub) << (bits - 3)
+
+    def record(self, ns):
+        self.buckets[self.bucket(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        """Upper bound in ns of the bucket holding the ``q`` (0-1) percentile"""
+        target = q * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        """Summary in microseconds"""
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean_us': round(self.total / self.count / 1000, 2),
+                'min_us': round(self.min / 1000, 2),
+                'p50_us': round(self.percentile(0.5) / 1000, 2),
+                'p95_us': round(self.percentile(0.95) / 1000, 2),
+                'p99_us': round(self.percentile(0.99) / 1000, 2),
+                'max_us': round(self.max / 1000, 2)}
+
+
+class StageTimer:
+    """
+    Per stage and characteristic timing of the value update hot path.
+
+    Instrumented code calls ``t0 = timer.start()``, which returns ``0``
+    while disabled, and ``timer.stop(stage, key, t0)`` only if ``t0``,
+    so a disabled timer costs one attribute check per stage. Histograms
+    are updated without locks: concurrent threads may rarely lose a
+    count, never block.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}  # (stage, key) --> StageHistogram
+        self.t_enabled = time.time() if enabled else None
+
+    def enable(self):
+        if not self.enabled:
+            self.t_enabled = time.time()
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.histograms = {}
+        if self.enabled:
+            self.t_enabled = time.time()
+
+    def start(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def stop(self, stage, key, t0):
+        self.record(stage, key, time.perf_counter_ns() - t0)
+
+    def record(self, stage, key, ns):
+        histogram = self.histograms.get((stage, key))
+        if histogram is None:
+            histogram = self.histograms.setdefault((stage, key), StageHistogram())
+        histogram.record(ns)
+
+    def snapshot(self):
+        """`dict` stage --> {key: summary}"""
+        stages = {}
+        for (stage, key), histogram in sorted(self.histograms.items(), key=self._order):
+            stages.setdefault(stage, {})[str(key)] = histogram.to_dict()
+        return stages
+
+    def report(self):
+        """Summary lines, one per stage and key"""
+        lines = []
+        for (stage, key), histogram in sorted(self.histograms.items(), key=self._order):
+            summary = histogram.to_dict()
+            lines.append("{} [{}]: n: {}, mean: {} us, p50: {} us, p95: {} us, max: {} us".format(
+                stage, key, summary['count'], summary['mean_us'], summary['p50_us'],
+                summary['p95_us'], summary['max_us']))
+        return lines
+
+    @staticmethod
+    def _order(item):
+        (stage, key), _ = item
+        return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage, str(key))
+
+
+# process wide timer, see the -timings option
+TIMINGS = StageTimer()
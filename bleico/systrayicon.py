@@ -21,12 +21,24 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import sys
 import threading
 from bleico.socket_client_server import socket_server
-from bleak_sigspec.utils import get_char_value, pformat_char_value
 import os
 from bleico.ble_device import BLE_DEVICE  # get own ble_device
+from bleico.char_formatter import CharFormatter
+from bleico.char_state import build_char_states, poll_char_states, AVOID_CHARS
+from bleico.value_pipeline import ValuePipeline
+from bleico.device_poller import DevicePoller
 from bleico.set_value_dialog import SetValueDialog
 from bleico.set_tooltip_dialog import ChecklistDialog
+from bleico.tooltip_template import ToolTipTemplate
+from bleico.stage_timer import (TIMINGS, DELIVER, SET_TEXT, NOTIFY_CALLBACK,
+                                REFRESH_MENU, RECEIVE_NOTIFICATION)
+from bleico.metrics import METRICS, NOTIFICATIONS
+from bleico.link_health import LinkHealth
+from bleico.gatt_trace import TRACE
 from bleico.ble_scanner_widget import BleScanner
+from bleico.scan_service import get_scan_service, connect_first
+from bleico.adv_monitor_widget import AdvMonitorWidget
+from bleico.worker import Worker
 from bleico.characteristic_metadata_widget import CharacteristicViewer
 # from bleico.console_log import QPlainTextEditLogger
 from PyQt5.QtCore import QCoreApplication
@@ -36,96 +48,12 @@ import struct
 from PyQt5.QtGui import QIcon, QPixmap, QDesktopServices
 from PyQt5.QtWidgets import (QSystemTrayIcon, QMenu, QAction,
                              QSplashScreen)
-from PyQt5.QtCore import (QObject, QRunnable, QThreadPool, pyqtSignal,
-                          pyqtSlot, Qt, QUrl)
-from PyQt5.QtMultimedia import QSound
+from PyQt5.QtCore import QThreadPool, Qt, QUrl, QTimer
 import traceback
 import asyncio
 from array import array
 
 
-class DisconnectionError(Exception):
-    def __init__(self, *args):
-        if args:
-            self.message = args[0]
-        else:
-            self.message = None
-
-    def __str__(self):
-        if self.message:
-            return 'DisconnectionError, {0} '.format(self.message)
-        else:
-            return 'DisconnectionError has been raised'
-
-
-# THREAD WORKERS
-class WorkerSignals(QObject):
-    '''
-    Defines the signals available from a running worker thread.
-
-    Supported signals are:
-
-    finished
-        No data
-
-    error
-        `tuple` (exctype, value, traceback.format_exc() )
-
-    result
-        `object` data returned from processing, anything
-
-    progress
-        `int` indicating % progress
-
-    '''
-    finished = pyqtSignal()
-    error = pyqtSignal(tuple)
-    result = pyqtSignal(object)
-    progress = pyqtSignal(object)
-
-
-class Worker(QRunnable):
-    '''
-    Worker thread
-
-    Inherits from QRunnable to handler worker thread setup, signals and wrap-up.
-
-    :param callback: The function callback to run on this worker thread. Supplied args and
-                     kwargs will be passed through to the runner.
-    :type callback: function
-    :param args: Arguments to pass to the callback function
-    :param kwargs: Keywords to pass to the callback function
-
-    '''
-
-    def __init__(self, fn, *args, **kwargs):
-        super(Worker, self).__init__()
-
-        # Store constructor arguments (re-used for processing)
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-        self.signals = WorkerSignals()
-        self.kwargs['progress_callback'] = self.signals.progress
-
-    @pyqtSlot()
-    def run(self):
-        '''
-        Initialise the runner function with passed args, kwargs.
-        '''
-
-        # Retrieve args/kwargs here; and fire processing using them
-        try:
-            self.fn(*self.args, **self.kwargs)
-        except:
-            traceback.print_exc()
-            exctype, value = sys.exc_info()[:2]
-            self.signals.error.emit((exctype, value, traceback.format_exc()))
-        # Return the result of the processing
-        finally:
-            self.signals.finished.emit()
-
-
 class SystemTrayIcon(QSystemTrayIcon):
     def __init__(self, icon, parent=None, device_uuid=None,
                  logger=None, max_tries=0, read_timeout=1,
@@ -138,8 +66,9 @@ class SystemTrayIcon(QSystemTrayIcon):
         # self.log.addHandler(self.console_logger)
         self._ntries = 0
         self._read_timeout = read_timeout
-        self._timeout_count = read_timeout - 1
         self._rssi_buffer = array('h', (0 for _ in range(10)))
+        # SHARED SCAN (reconnection)
+        self.scan_service = get_scan_service(log=self.log)
         # SPLASH SCREEN
         self.splash_pix = QPixmap(os.path.join(SRC_PATH, "bleico.png"), 'PNG')
         self.scaled_splash = self.splash_pix.scaled(
@@ -152,11 +81,13 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.splash.show()
         self.splash.showMessage("Scanning for device...",
                                 Qt.AlignHCenter | Qt.AlignBottom, Qt.white)
-        # Bledevice
-        self.esp32_device = BLE_DEVICE(device_uuid, init=True, log=self.log)
-        while not self.esp32_device.connected:
+        # Bledevice (address, name or ScanFilter target), connect on first advertisement
+        self.esp32_device = connect_first(device_uuid, scan_service=self.scan_service,
+                                          log=self.log)
+        while self.esp32_device is None or not self.esp32_device.connected:
             if self._ntries <= max_tries:
-                self.esp32_device = BLE_DEVICE(device_uuid, init=True, log=self.log)
+                self.esp32_device = connect_first(device_uuid, scan_service=self.scan_service,
+                                                  log=self.log)
                 time.sleep(0.5)
                 self._ntries += 1
             else:
@@ -168,7 +99,7 @@ class SystemTrayIcon(QSystemTrayIcon):
                 self.splash.clearMessage()
                 self.splash.close()
                 Scanner = BleScanner(SRC_PATH=SRC_PATH, log=self.log)
-                while not self.esp32_device.connected:
+                while self.esp32_device is None or not self.esp32_device.connected:
                     Scanner.show()
                     Scanner.raise_()
                     while Scanner.device_to_connect is None:
@@ -215,11 +146,7 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.menu.addAction(self.separator)
         # SERVICES & CHARS
         # AVOID READ CHARS
-        self.avoid_chars = ['Appearance', 'Manufacturer Name String',
-                            'Battery Power State', 'Model Number String',
-                            'Firmware Revision String', 'Serial Number String',
-                            'Hardware Revision String',
-                            'Software Revision String']
+        self.avoid_chars = list(AVOID_CHARS)
         self.avoid_field_strings = ['Measurement', 'Value', 'String',
                                     '(uint8)', '(uint16)', 'Compound']
 
@@ -248,19 +175,10 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.menu.addAction(self.servs_separator)
         self.serv_actions_dict = {serv: QAction(serv) for serv in self.esp32_device.services_rsum.keys()}
         self.serv_separator_dict = {}
-        self.char_actions_dict = {}
-        self.notify_char_menu_dict = {}
-        self.notify_char_actions_dict = {}
-        self.toggle_desktop_notify_char_actions_dict = {}
-        self.do_desktop_notify_char_dict = {}
-        self.write_char_menu_dict = {}
-        self.write_char_actions_dict = {}
-        self.battery_power_state_actions_dict = {}
-        self.char_fields_actions_dict = {}
-        self.char_fields_bitfields_actions_dict = {}
+        # CHARACTERISTICS STATE (HANDLE --> CharacteristicState)
+        self.char_states = build_char_states(self.esp32_device)
         self.checklist_fields = []
         self.checklist_choices = []
-        self.tooltip_h_ch_field_values_dict = {}
         for key, serv in self.serv_actions_dict.items():
             if key == 'Device Information':
                 self.log.info('Device: {}, UUID: {}'.format(self.esp32_device.name,
@@ -270,8 +188,9 @@ class SystemTrayIcon(QSystemTrayIcon):
                 for char_handle in self.esp32_device.services_rsum_handles[key]:
                     char = self.esp32_device.readables_handles[char_handle]
                     try:
-                        self.char_actions_dict[char_handle] = self.devinfo_menu.addAction("{}: {}".format(char.replace('String', ''), self.esp32_device.device_info[char]))
-                        self.char_actions_dict[char_handle].setEnabled(False)
+                        char_state = self.char_states[char_handle]
+                        char_state.action = self.devinfo_menu.addAction("{}: {}".format(char.replace('String', ''), self.esp32_device.device_info[char]))
+                        char_state.action.setEnabled(False)
                         self.log.info("    - {}: {}".format(char.replace('String', ''), self.esp32_device.device_info[char]))
                     except Exception as e:
                         self.log.error(traceback.format_exc())
@@ -285,122 +204,126 @@ class SystemTrayIcon(QSystemTrayIcon):
                 serv.setEnabled(False)
                 self.menu.addAction(serv)
                 for char_handle in self.esp32_device.services_rsum_handles[key]:
-                    if char_handle in self.esp32_device.readables_handles.keys() or char_handle in self.esp32_device.notifiables_handles.keys():
-                        try:
-                            char = self.esp32_device.readables_handles[char_handle]
-                        except Exception as e:
-                            char = self.esp32_device.notifiables_handles[char_handle]
+                    if char_handle not in self.char_states:
+                        continue
+                    char_state = self.char_states[char_handle]
+                    char = char_state.char
+                    if char_state.readable or char_state.notifiable:
                         if char in self.avoid_chars:
                             if char == 'Battery Power State':
-                                self.char_actions_dict[char_handle] = self.menu.addMenu(char)
+                                char_state.action = self.menu.addMenu(char)
                                 for state, value in self.esp32_device.batt_power_state.items():
-                                    self.battery_power_state_actions_dict[state]=self.char_actions_dict[char_handle].addAction("{}: {}".format(state,value))  # store actions in dict to update
+                                    char_state.field_actions[state] = char_state.action.addAction("{}: {}".format(state, value))  # store actions to update
                             else:
-                                self.char_actions_dict[char_handle] = self.menu.addMenu(char)
-                                self.char_actions_dict[char_handle].addAction(self.esp32_device.device_info[char])
+                                char_state.action = self.menu.addMenu(char)
+                                char_state.action.addAction(self.esp32_device.device_info[char])
                         else:
-                            self.tooltip_h_ch_field_values_dict[char_handle] = {char: {}}
+                            xml_char = char_state.xml_char
                             # HERE DIVIDE CHARS INTO SINGLE/FEATURES/MULTIPLE
                             # SINGLE FIELD CHARACTERISTIC
-                            if len(self.esp32_device.chars_xml[char].fields) == 1:
+                            if len(xml_char.fields) == 1:
                                 bfield = False
-                                for field in self.esp32_device.chars_xml[char].fields:
-                                    if 'BitField' in self.esp32_device.chars_xml[char].fields[field]:
+                                for field in xml_char.fields:
+                                    if 'BitField' in xml_char.fields[field]:
                                         bfield = True
                                 if not bfield:
-                                    self.char_actions_dict[char_handle] = QAction("{}: ? ua".format(char))
-                                    self.menu.addAction(self.char_actions_dict[char_handle])
+                                    char_state.action = QAction("{}: ? ua".format(char))
+                                    self.menu.addAction(char_state.action)
                                     # ADD TO CHECKLIST
-                                    for field in self.esp32_device.chars_xml[char].fields:
+                                    for field in xml_char.fields:
                                         self.checklist_fields.append("{}:{}:{}".format(char, field, char_handle))
-                                        self.tooltip_h_ch_field_values_dict[char_handle][char][field] = ''
+                                        char_state.texts[field] = ''
                                 else:
-                                    self.char_actions_dict[char_handle] = self.menu.addMenu(char)
-                                    self.char_fields_actions_dict[char_handle] = {}
-                                    for field in self.esp32_device.chars_xml[char].fields:
-                                        if 'BitField' in self.esp32_device.chars_xml[char].fields[field]:
-                                            for _bitfield in self.esp32_device.chars_xml[char].fields[field]['BitField']:
-                                                self.char_fields_actions_dict[char_handle][_bitfield] = self.char_actions_dict[char_handle].addAction(_bitfield)
+                                    char_state.action = self.menu.addMenu(char)
+                                    for field in xml_char.fields:
+                                        if 'BitField' in xml_char.fields[field]:
+                                            for _bitfield in xml_char.fields[field]['BitField']:
+                                                char_state.field_actions[_bitfield] = char_state.action.addAction(_bitfield)
                                                 # ADD TO CHECKLIST
                                                 self.checklist_fields.append("{}:{}:{}".format(char, _bitfield, char_handle))
-                                                self.tooltip_h_ch_field_values_dict[char_handle][char][_bitfield] = ''
+                                                char_state.texts[_bitfield] = ''
 
                             # MULTIPLE FIELDS CHARACTERISTIC
-                            elif len(self.esp32_device.chars_xml[char].fields) > 1:
-                                self.char_actions_dict[char_handle] = self.menu.addMenu(char)
-                                self.char_fields_actions_dict[char_handle] = {}
-                                self.char_fields_bitfields_actions_dict[char_handle] = {}
-                                for field in self.esp32_device.chars_xml[char].fields:
+                            elif len(xml_char.fields) > 1:
+                                char_state.action = self.menu.addMenu(char)
+                                for field in xml_char.fields:
                                     bfield = False
-                                    if 'BitField' in self.esp32_device.chars_xml[char].fields[field]:
+                                    if 'BitField' in xml_char.fields[field]:
                                             if field != 'Flags':
                                                 bfield = True
                                     if not bfield:
-                                        self.char_fields_actions_dict[char_handle][field] = self.char_actions_dict[char_handle].addAction(field)
+                                        char_state.field_actions[field] = char_state.action.addAction(field)
                                         # ADD TO CHECKLIST
                                         self.checklist_fields.append("{}:{}:{}".format(char, field, char_handle))
-                                        self.tooltip_h_ch_field_values_dict[char_handle][char][field] = ''
+                                        char_state.texts[field] = ''
                                     else:
-                                        self.char_fields_actions_dict[char_handle][field] = self.char_actions_dict[char_handle].addMenu(field)
-                                        self.char_fields_bitfields_actions_dict[char_handle][field] = {}
-                                        for _bitfield in self.esp32_device.chars_xml[char].fields[field]['BitField']:
-                                            self.char_fields_bitfields_actions_dict[char_handle][field][_bitfield] = self.char_fields_actions_dict[char_handle][field].addAction(_bitfield)
+                                        char_state.field_actions[field] = char_state.action.addMenu(field)
+                                        char_state.bitfield_actions[field] = {}
+                                        for _bitfield in xml_char.fields[field]['BitField']:
+                                            char_state.bitfield_actions[field][_bitfield] = char_state.field_actions[field].addAction(_bitfield)
                                             # ADD TO CHECKLIST
                                             self.checklist_fields.append("{}:{}:{}".format(char, _bitfield, char_handle))
-                                            self.tooltip_h_ch_field_values_dict[char_handle][char][_bitfield] = ''
+                                            char_state.texts[_bitfield] = ''
+                            # COMPILE FORMATTER
+                            char_state.formatter = CharFormatter(char, xml_char, service=key,
+                                                                 actions=char_state.slot_actions())
 
-                    if char_handle in self.esp32_device.writeables_handles.keys():
-                        char = self.esp32_device.writeables_handles[char_handle]
-                        xml_char = self.esp32_device.chars_xml[char]
+                    if char_state.writeable:
+                        xml_char = char_state.xml_char
                         if len(xml_char.fields) == 1:
-                            self.write_char_menu_dict[char_handle] = self.menu.addMenu("Set {}".format(char))
+                            char_state.write_menu = self.menu.addMenu("Set {}".format(char))
                             for field in xml_char.fields:
                                 if 'Enumerations' in xml_char.fields[field].keys() and 'BitField' not in xml_char.fields[field].keys():
-                                    self.write_char_actions_dict[char_handle] = {}
                                     for k, v in xml_char.fields[field]['Enumerations'].items():
-                                        self.write_char_actions_dict[char_handle][v] = self.write_char_menu_dict[char_handle].addAction(v)
-                                        self.write_char_actions_dict[char_handle][v].triggered.connect(self.check_which_triggered_write)
+                                        char_state.write_actions[v] = char_state.write_menu.addAction(v)
+                                        char_state.write_actions[v].triggered.connect(self.check_which_triggered_write)
                                 else:
                                     # SET VALUE
-                                    self.write_char_actions_dict[char_handle] = {}
-                                    self.write_char_actions_dict[char_handle]["set_value"] = self.write_char_menu_dict[char_handle].addAction(
+                                    char_state.write_actions["set_value"] = char_state.write_menu.addAction(
                                         "Set Value")
-                                    self.write_char_actions_dict[char_handle]["set_value"].triggered.connect(
+                                    char_state.write_actions["set_value"].triggered.connect(
                                         self.check_which_triggered_write)
-                                    self.write_char_actions_dict[char_handle]["set_value_box"] = SetValueDialog(
+                                    char_state.set_value_box = SetValueDialog(
                                         char=xml_char, char_handle=char_handle, log=self.log, dev=self.esp32_device)
                         else:
                             # SET VALUE
-                            self.write_char_actions_dict[char_handle] = {}
-                            if char_handle in self.char_actions_dict:
-                                self.char_actions_dict[char_handle].addSeparator()
-                                self.write_char_actions_dict[char_handle]["set_value"] = self.char_actions_dict[char_handle].addAction(
+                            if char_state.action is not None:
+                                char_state.action.addSeparator()
+                                char_state.write_actions["set_value"] = char_state.action.addAction(
                                     "Set Value")
                             else:
-                                self.write_char_menu_dict[char_handle] = self.menu.addMenu(char)
-                                self.write_char_actions_dict[char_handle]["set_value"] = self.write_char_menu_dict[char_handle].addAction(
+                                char_state.write_menu = self.menu.addMenu(char)
+                                char_state.write_actions["set_value"] = char_state.write_menu.addAction(
                                     "Set Value")
-                            self.write_char_actions_dict[char_handle]["set_value"].triggered.connect(
+                            char_state.write_actions["set_value"].triggered.connect(
                                 self.check_which_triggered_write)
-                            self.write_char_actions_dict[char_handle]["set_value_box"] = SetValueDialog(
+                            char_state.set_value_box = SetValueDialog(
                                 char=xml_char, char_handle=char_handle, log=self.log, dev=self.esp32_device)
 
                 self.serv_separator_dict[key] = QAction()
                 self.serv_separator_dict[key].setSeparator(True)
                 self.menu.addAction(self.serv_separator_dict[key])
+        self.poll_char_states = poll_char_states(self.char_states)
+        # DECODE AND FORMAT IN BLE THREADS
+        self.value_pipeline = ValuePipeline(self.char_states, dev=self.esp32_device,
+                                            log=self.log)
+        # POLL AND RECONNECT LOOP (BleDevThread)
+        self.device_poller = DevicePoller(self.esp32_device, self.poll_char_states,
+                                          self.poll_value, read_timeout=self._read_timeout,
+                                          scan_service=self.scan_service, log=self.log)
         self.separator_etc = QAction()
         self.separator_etc.setSeparator(True)
         self.menu.addAction(self.separator_etc)
         # NOTIFY
         self.notify_menu = self.menu.addMenu("Notify")
         for char_handle in self.esp32_device.notifiables_handles.keys():
-            char = self.esp32_device.notifiables_handles[char_handle]
-            self.notify_char_menu_dict[char_handle] = self.notify_menu.addMenu(char)
-            self.notify_char_actions_dict[char_handle] = self.notify_char_menu_dict[char_handle].addAction('Notify')
-            self.notify_char_actions_dict[char_handle].triggered.connect(self.check_which_triggered)
-            self.toggle_desktop_notify_char_actions_dict[char_handle] = self.notify_char_menu_dict[char_handle].addAction('Desktop Notification: On')
-            self.do_desktop_notify_char_dict[char_handle] = True
-            self.toggle_desktop_notify_char_actions_dict[char_handle].triggered.connect(self.toggle_desktop_notify)
+            char_state = self.char_states[char_handle]
+            char_state.notify_menu = self.notify_menu.addMenu(char_state.char)
+            char_state.notify_action = char_state.notify_menu.addAction('Notify')
+            char_state.notify_action.triggered.connect(self.check_which_triggered)
+            char_state.desktop_notify_action = char_state.notify_menu.addAction('Desktop Notification: On')
+            char_state.desktop_notify = True
+            char_state.desktop_notify_action.triggered.connect(self.toggle_desktop_notify)
             # here trigger action --> set flag notify True, start Thread, callback notify ...
         self.notify_menu.addSeparator()
         self.notify_sound_act = QAction("Sound: Disabled")
@@ -416,9 +339,37 @@ class SystemTrayIcon(QSystemTrayIcon):
                                                    self.checklist_fields,
                                                    checked=False, log=self.log,
                                                    check_list=self.checklist_choices)
+        self.set_tool_tip_dialog.choices_changed.connect(self.compile_tool_tip)
+        self.tool_tip_template = ToolTipTemplate(self.avoid_field_strings)
         self.set_tool_tip_action = QAction("Set Tool Tip")
         self.set_tool_tip_action.triggered.connect(self.show_checklist_dialog)
         self.menu.addAction(self.set_tool_tip_action)
+        # ADVERTISEMENT MONITOR (connectionless, other devices)
+        self.adv_monitor_widget = None
+        self.adv_monitor_action = QAction("Advertisement Monitor")
+        self.adv_monitor_action.triggered.connect(self.show_adv_monitor)
+        self.menu.addAction(self.adv_monitor_action)
+        # HOT PATH TIMINGS (logged when disabled and on exit)
+        self.timings_action = QAction("Timings: {}".format(
+            "Enabled" if TIMINGS.enabled else "Disabled"))
+        self.timings_action.triggered.connect(self.toggle_timings)
+        self.menu.addAction(self.timings_action)
+        # PERFORMANCE (link health, refreshed every 2 s once the metrics are enabled)
+        self.link_health = LinkHealth(self.value_pipeline, self.char_states)
+        self.performance_menu = self.menu.addMenu("Performance")
+        self.performance_menu.aboutToShow.connect(self.show_performance)
+        self.performance_actions = []
+        for line in LinkHealth.format_lines(self.link_health.sample()):
+            action = self.performance_menu.addAction(line)
+            action.setEnabled(False)
+            self.performance_actions.append(action)
+        if TRACE.enabled and TRACE.path:
+            self.performance_menu.addSeparator()
+            self.save_trace_action = self.performance_menu.addAction("Save GATT Trace")
+            self.save_trace_action.triggered.connect(self.save_trace)
+        self.performance_timer = QTimer()
+        self.performance_timer.timeout.connect(self.refresh_performance)
+        self.performance_timer.start(2000)
         # TIME LAST UPDATE
         self.menu.addSeparator()
         self.last_update_action = QAction()
@@ -451,6 +402,8 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.setContextMenu(self.menu)
         # Workers
         self.threadpool = QThreadPool()
+        # BleDevThread and NotifyThread run until exit, even on one core
+        self.threadpool.setMaxThreadCount(max(2, self.threadpool.maxThreadCount()))
         self.quit_thread = False
         self.main_server = None
         self.log.info("Multithreading with maximum %d threads" % self.threadpool.maxThreadCount())
@@ -460,15 +413,15 @@ class SystemTrayIcon(QSystemTrayIcon):
 
         # NOTIFIABLE
         self.char_to_notify = None
-        self.chars_to_notify = []
-        self.chars_to_notify_handles = []
         self.notify_is_on = False
         self.notify_sound_is_on = False
         self.notify_loop = asyncio.new_event_loop()
         self.notify_type_icon = {'Info': QSystemTrayIcon.Information,
                                  'Warning': QSystemTrayIcon.Warning,
                                  'Critical': QSystemTrayIcon.Critical}
-        self.notify_sound = QSound(os.path.join(SRC_PATH_SOUND, "definite.wav"))
+        # QtMultimedia is loaded when the sound is enabled
+        self.notify_sound = None
+        self.notify_sound_path = os.path.join(SRC_PATH_SOUND, "definite.wav")
         self.notify_status_is_on = True
 
         # Disconnection callback
@@ -478,15 +431,99 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.menu_thread_done = False
         self.notify_thread_done = True
 
+    def get_notifying_handles(self):
+        return [char_handle for char_handle, char_state in self.char_states.items()
+                if char_state.notifying]
+
+    def notify_chars(self, handles):
+        """Enable notifications on ``handles`` (e.g. a replay), as their Notify actions"""
+        if self.main_server:
+            return
+        char_states = [self.char_states[handle] for handle in handles
+                       if handle in self.char_states and
+                       self.char_states[handle].notify_action is not None]
+        if not char_states:
+            return
+        for char_state in char_states:
+            self.log.info("Char: {} Notification Enabled".format(char_state.char))
+            char_state.notifying = True
+            char_state.notify_action.setText('Stop Notification')
+        self.char_to_notify = char_states[0].char
+        self.start_notify_char()
+        self.notify_is_on = True
+
+    def apply_formatted_value(self, char_state, fvalue):
+        t0 = TIMINGS.start()
+        for action, text in fvalue.updates:
+            action.setText(text)
+        if t0:
+            TIMINGS.stop(SET_TEXT, char_state.char, t0)
+        # SAVE FOR TOOLTIP
+        for field, text in fvalue.tooltip:
+            char_state.texts[field] = text
+            self.tool_tip_template.update(char_state.handle, field, text)
+
+    def apply_value_updates(self):
+        # GUI THREAD: only set texts already formatted by the pipeline
+        for update in self.value_pipeline.drain():
+            char_state = self.char_states[update.handle]
+            if update.t_ready:
+                TIMINGS.stop(DELIVER, char_state.char, update.t_ready)
+            self.apply_formatted_value(char_state, update.fvalue)
+            if update.notify_title:
+                self.notify(update.notify_title, update.notify_message,
+                            typeicon=update.notify_typeicon)
+        self.format_tool_tip()
+
     def toggle_notify_sound(self):
         self.notify_sound_is_on = not self.notify_sound_is_on
         if self.notify_sound_is_on:
+            if self.notify_sound is None:
+                from PyQt5.QtMultimedia import QSound
+                self.notify_sound = QSound(self.notify_sound_path)
             self.notify_sound_act.setText("Sound: Enabled")
             self.log.info('Notification Sound: Enabled')
         else:
             self.notify_sound_act.setText("Sound: Disabled")
             self.log.info('Notification Sound: Disabled')
 
+    def toggle_timings(self):
+        if TIMINGS.enabled:
+            TIMINGS.disable()
+            self.timings_action.setText("Timings: Disabled")
+            self.log_timings()
+        else:
+            TIMINGS.reset()
+            TIMINGS.enable()
+            self.timings_action.setText("Timings: Enabled")
+            self.log.info('Hot path timings: Enabled')
+
+    def log_timings(self):
+        for line in TIMINGS.report():
+            self.log.info("Timings: {}".format(line))
+
+    def show_performance(self):
+        if not METRICS.enabled:
+            METRICS.enable()
+            self.log.info('Metrics: Enabled')
+            self.refresh_performance()
+
+    def refresh_performance(self):
+        if not METRICS.enabled:
+            return
+        try:
+            lines = LinkHealth.format_lines(self.link_health.sample())
+            for action, line in zip(self.performance_actions, lines):
+                action.setText(line)
+        except Exception as e:
+            self.log.error(traceback.format_exc())
+
+    def save_trace(self):
+        try:
+            self.log.info("GATT trace saved to: {}".format(TRACE.save()))
+        except Exception as e:
+            self.log.error(traceback.format_exc())
+
     def toggle_notify_status(self):
         self.notify_status_is_on = not self.notify_status_is_on
         if self.notify_status_is_on:
@@ -498,14 +535,13 @@ class SystemTrayIcon(QSystemTrayIcon):
 
     def check_which_triggered(self, checked):
         action = self.sender()
-        for char_handle in self.notify_char_actions_dict.keys():
-            char = self.esp32_device.notifiables_handles[char_handle]
-            if action == self.notify_char_actions_dict[char_handle]:
-                if char_handle not in self.chars_to_notify_handles:
+        for char_handle, char_state in self.char_states.items():
+            char = char_state.char
+            if action == char_state.notify_action:
+                if not char_state.notifying:
                     self.log.info("Char: {} Notification Enabled".format(char))
                     self.char_to_notify = char
-                    self.chars_to_notify.append(char)
-                    self.chars_to_notify_handles.append(char_handle)
+                    char_state.notifying = True
                     action.setText('Stop Notification')
                     if self.main_server:
                         self.main_server.send_message("start:{}:{}".format(char_handle, char))
@@ -514,18 +550,22 @@ class SystemTrayIcon(QSystemTrayIcon):
                         self.notify_is_on = True
                 else:
                     self.log.info("Char: {} Notification Disabled".format(char))
-                    self.chars_to_notify.remove(char)
-                    self.chars_to_notify_handles.remove(char_handle)
+                    char_state.notifying = False
                     self.main_server.send_message("stop:{}:{}".format(char_handle, char))
                     action.setText('Notify')
 
+    def show_set_value_box(self, char_state):
+        self.log.info('Showing {} Set Value Control'.format(char_state.char))
+        char_state.set_value_box.show()
+        char_state.set_value_box.raise_()
+
     def check_which_triggered_write(self, checked):
         action = self.sender()
-        for char_handle in self.write_char_actions_dict.keys():
-            char = self.esp32_device.writeables_handles[char_handle]
-            for write_action_key in self.write_char_actions_dict[char_handle].keys():
-                if action == self.write_char_actions_dict[char_handle][write_action_key]:
-                    xml_char = self.esp32_device.chars_xml[char]
+        for char_handle, char_state in self.char_states.items():
+            char = char_state.char
+            for write_action_key in char_state.write_actions.keys():
+                if action == char_state.write_actions[write_action_key]:
+                    xml_char = char_state.xml_char
                     self.log.info('Writing to {}'.format(char))
                     if len(xml_char.fields) == 1:
                         format = ""
@@ -548,17 +588,11 @@ class SystemTrayIcon(QSystemTrayIcon):
                                     except Exception as e:
                                         self.log.error(e)
                                 else:
-                                    self.log.info('Showing {} Set Value Control'.format(char))
-                                    self.write_char_actions_dict[char_handle]["set_value_box"].show()
-                                    self.write_char_actions_dict[char_handle]["set_value_box"].raise_()
+                                    self.show_set_value_box(char_state)
                             else:
-                                self.log.info('Showing {} Set Value Control'.format(char))
-                                self.write_char_actions_dict[char_handle]["set_value_box"].show()
-                                self.write_char_actions_dict[char_handle]["set_value_box"].raise_()
+                                self.show_set_value_box(char_state)
                     else:
-                        self.log.info('Showing {} Set Value Control'.format(char))
-                        self.write_char_actions_dict[char_handle]["set_value_box"].show()
-                        self.write_char_actions_dict[char_handle]["set_value_box"].raise_()
+                        self.show_set_value_box(char_state)
 
     def check_which_triggered_view(self, checked):
         action = self.sender()
@@ -570,20 +604,19 @@ class SystemTrayIcon(QSystemTrayIcon):
 
     def toggle_desktop_notify(self, checked):
         action = self.sender()
-        for char_handle in self.notify_char_actions_dict.keys():
-            char = self.esp32_device.notifiables_handles[char_handle]
-            if action == self.toggle_desktop_notify_char_actions_dict[char_handle]:
-                value = not self.do_desktop_notify_char_dict[char_handle]
-                self.do_desktop_notify_char_dict[char_handle] = value
-                if value:
+        for char_state in self.char_states.values():
+            char = char_state.char
+            if action == char_state.desktop_notify_action:
+                char_state.desktop_notify = not char_state.desktop_notify
+                if char_state.desktop_notify:
                     self.log.info("Char: {} Desktop Notification Enabled".format(char))
-                    self.toggle_desktop_notify_char_actions_dict[char_handle].setText('Desktop Notification: On')
+                    char_state.desktop_notify_action.setText('Desktop Notification: On')
                 else:
                     self.log.info("Char: {} Desktop Notification Disabled".format(char))
-                    self.toggle_desktop_notify_char_actions_dict[char_handle].setText('Desktop Notification: Off')
+                    char_state.desktop_notify_action.setText('Desktop Notification: Off')
 
     def refresh_menu(self, response):
-
+        t0 = TIMINGS.start()
         data = response
         if data == 'finished':
             self.log.info("MENU CALLBACK: THREAD FINISH RECEIVED")
@@ -591,18 +624,14 @@ class SystemTrayIcon(QSystemTrayIcon):
         elif data == 'disconnected':
             if self.notify_status_is_on:
                 self.notify("Disconnection event", 'Device {} is now disconnected'.format(self.esp32_device.name))
-            for char_handle in self.esp32_device.notifiables_handles:
-                char = self.esp32_device.notifiables_handles[char_handle]
-                self.notify_char_actions_dict[char_handle].setEnabled(False)
-                self.log.info("Char: {} Notification Actions Disabled".format(char))
-                # self.chars_to_notify.remove(char)
-                # self.chars_to_notify_handles.remove(char_handle)
-            for char_handle in self.write_char_actions_dict:
-                for action in self.write_char_actions_dict[char_handle]:
-                    if action != 'set_value_box':
-                        self.write_char_actions_dict[char_handle][action].setEnabled(False)
-                    else:
-                        self.write_char_actions_dict[char_handle][action].hide()
+            for char_state in self.char_states.values():
+                if char_state.notify_action is not None:
+                    char_state.notify_action.setEnabled(False)
+                    self.log.info("Char: {} Notification Actions Disabled".format(char_state.char))
+                for action in char_state.write_actions.values():
+                    action.setEnabled(False)
+                if char_state.set_value_box is not None:
+                    char_state.set_value_box.hide()
             self.device_status_action.setText('Status: Disconnected')
         elif data == 'disconnecting':
             self.device_status_action.setText('Status: Disconnecting...')
@@ -618,17 +647,15 @@ class SystemTrayIcon(QSystemTrayIcon):
                             'Device {} is now connected'.format(self.esp32_device.name),
                             typeicon='Info')
             self.device_status_action.setText('Status: Connected')
-            for char_handle in self.esp32_device.notifiables_handles:
-                char = self.esp32_device.notifiables_handles[char_handle]
-                if char_handle in self.chars_to_notify_handles:
-                    self.main_server.send_message("start:{}:{}".format(char_handle, char))
-                    time.sleep(1)
-                self.notify_char_actions_dict[char_handle].setEnabled(True)
-                self.log.info("Char: {} Notification Actions Enabled".format(char))
-            for char_handle in self.write_char_actions_dict:
-                for action in self.write_char_actions_dict[char_handle]:
-                    if action != 'set_value_box':
-                        self.write_char_actions_dict[char_handle][action].setEnabled(True)
+            for char_handle, char_state in self.char_states.items():
+                if char_state.notify_action is not None:
+                    if char_state.notifying:
+                        self.main_server.send_message("start:{}:{}".format(char_handle, char_state.char))
+                        time.sleep(1)
+                    char_state.notify_action.setEnabled(True)
+                    self.log.info("Char: {} Notification Actions Enabled".format(char_state.char))
+                for action in char_state.write_actions.values():
+                    action.setEnabled(True)
         elif data == 'timeupdate':
             self.last_update_action.setText("Last Update: {}".format(datetime.strftime(datetime.now(), "%H:%M:%S")))
 
@@ -637,93 +664,8 @@ class SystemTrayIcon(QSystemTrayIcon):
                 pass
             else:
                 try:
-                    for char_handle in data.keys():
-                        if isinstance(char_handle, int):
-                            char = self.esp32_device.readables_handles[char_handle]
-                            # HANDLE SINGLE VALUES
-                            if len(self.esp32_device.chars_xml[char].fields) == 1:
-                                # CHECK IF BITFIELD
-                                _bfield = False
-                                for field in self.esp32_device.chars_xml[char].fields:
-                                    if 'BitField' in self.esp32_device.chars_xml[char].fields[field]:
-                                        _bfield = True
-                                if not _bfield:
-                                    char_text = self.esp32_device.pformat_char_value(data[char_handle],
-                                                                                     char=char,
-                                                                                     rtn=True,
-                                                                                     prnt=False,
-                                                                                     one_line=True,
-                                                                                     only_val=True)
-
-                                    self.char_actions_dict[char_handle].setText(char_text)
-                                    for serv in self.esp32_device.services_rsum.keys():
-                                        if char in self.esp32_device.services_rsum[serv]:
-                                            self.log.info("[{}] {}".format(serv, char_text))
-                                    # SAVE FOR TOOLTIP
-                                    for field in self.esp32_device.chars_xml[char].fields:
-                                        self.tooltip_h_ch_field_values_dict[char_handle][char][field] = char_text
-                                else:
-                                    # HANDLE BITFLAGS
-                                    bitflagdict = data[char_handle][char]['Value']
-                                    for _bitfield in bitflagdict:
-                                        bitfield_text = "{}: {}".format(_bitfield, bitflagdict[_bitfield])
-                                        self.char_fields_actions_dict[char_handle][_bitfield].setText(bitfield_text)
-                                        # SAVE FOR TOOLTIP
-                                        self.tooltip_h_ch_field_values_dict[char_handle][char][_bitfield] = bitfield_text
-                                        for serv in self.esp32_device.services_rsum.keys():
-                                            if char in self.esp32_device.services_rsum[serv]:
-                                                self.log.info("[{}] {} {}".format(serv, char, bitfield_text))
-
-                            elif len(self.esp32_device.chars_xml[char].fields) > 1:
-                                for field in self.esp32_device.chars_xml[char].fields:
-                                    # NORMAL FIELD
-                                    if field in data[char_handle]:
-                                        if 'BitField' not in self.esp32_device.chars_xml[char].fields[field]:
-                                            if "Reference" not in self.esp32_device.chars_xml[char].fields[field]:
-                                                field_val = self.esp32_device.pformat_field_value(data[char_handle][field],
-                                                                                                 rtn=True,
-                                                                                                 prnt=False)
-                                            else:
-                                                # REFERENCE FIELD
-                                                reference = self.esp32_device.chars_xml[char].fields[field]["Reference"]
-                                                if reference in data[char_handle][field][reference]:
-                                                    field_val = self.esp32_device.pformat_field_value(data[char_handle][field][reference][reference],
-                                                                                                     rtn=True,
-                                                                                                     prnt=False)
-                                                elif field in data[char_handle][field][reference]:
-                                                    field_val = self.esp32_device.pformat_field_value(data[char_handle][field][reference][field],
-                                                                                                     rtn=True,
-                                                                                                     prnt=False)
-                                                else:
-                                                    if reference == 'Date Time':
-                                                        field_val = self.esp32_device.pformat_field_value(data[char_handle][field][reference],
-                                                                                                             rtn=True,
-                                                                                                             prnt=False,
-                                                                                                             timestamp=True)
-                                                    else:
-                                                        field_val = self.esp32_device.pformat_ref_char_value(data[char_handle][field], rtn=True)
-                                            field_text = "{}: {}".format(field, field_val)
-                                            self.char_fields_actions_dict[char_handle][field].setText(field_text)
-                                            # SAVE FOR TOOLTIP
-                                            self.tooltip_h_ch_field_values_dict[char_handle][char][field] = field_text
-                                            for serv in self.esp32_device.services_rsum.keys():
-                                                if char in self.esp32_device.services_rsum[serv]:
-                                                    self.log.info("[{}] {} {}".format(serv, char, field_text))
-                                        else:
-                                            # HANDLE BITFLAGS
-                                            bitflagdict = data[char_handle][field]['Value']
-                                            for _bitfield in bitflagdict:
-                                                bitfield_text = "{}: {}".format(_bitfield, bitflagdict[_bitfield])
-                                                self.char_fields_bitfields_actions_dict[char_handle][field][_bitfield].setText(bitfield_text)
-                                                # SAVE FOR TOOLTIP
-                                                self.tooltip_h_ch_field_values_dict[char_handle][char][_bitfield] = bitfield_text
-                                                for serv in self.esp32_device.services_rsum.keys():
-                                                    if char in self.esp32_device.services_rsum[serv]:
-                                                        self.log.info("[{}] {} ({}) {}".format(serv, char, field, bitfield_text))
-                    # SET TOOLTIP
-                    if self.checklist_choices:
-                        self.log.info("Tool Tip Fields: {}".format(self.checklist_choices))
-                    self.format_tool_tip()
+                    # VALUES AND TOOLTIP
+                    self.apply_value_updates()
                     # LAST UPDATE
                     self.last_update_action.setText("Last Update: {}".format(datetime.strftime(datetime.now(), "%H:%M:%S")))
                     self.device_status_action.setText('Status: Connected')
@@ -734,101 +676,18 @@ class SystemTrayIcon(QSystemTrayIcon):
                         self.device_rssi_action.setText('RSSI: {} dBm'.format(_av_rssi_val))
                 except Exception as e:
                     self.log.error(traceback.format_exc())
+        if t0:
+            TIMINGS.stop(REFRESH_MENU, data[0] if isinstance(data, list) else
+                         'values' if isinstance(data, dict) else data, t0)
 
-    def update_menu(self, progress_callback):  # define the notify callback inside that takes progress_callback as variable
-        connect_loop = False
+    def poll_value(self, char_state, raw):
+        self.value_pipeline.submit(self.value_pipeline.process(char_state, raw))
+
+    def update_menu(self, progress_callback):
         qthread = threading.current_thread()
         qthread.name = 'BleDevThread'
-        self.esp32_device.break_flag = self.quit_thread
-        while not self.quit_thread:
-            if self.quit_thread:
-                break
-            else:
-                if not connect_loop:
-                    self._timeout_count += 1
-                    try:
-                        if self._read_timeout == self._timeout_count:
-                            data = {}
-                            for char_handle in self.esp32_device.readables_handles.keys():
-                                char = self.esp32_device.readables_handles[char_handle]
-                                if char not in self.avoid_chars and char_handle not in self.chars_to_notify_handles:
-                                    if self.quit_thread:
-                                        break
-                                    else:
-                                        try:
-                                            data[char_handle] = (self.esp32_device.get_char_value(char, handle=char_handle))
-                                        except struct.error:
-                                            self.log.error("Char: {}, Error: Wrong encoding format".format(char))
-                                            data[char_handle] = {char: {"Value": " ", "Symbol":"?"}}
-                            data['DEVICE_RSSI'] = self.esp32_device.get_RSSI()
-                            progress_callback.emit(data)
-                            self._timeout_count = 0
-                        else:
-                            if self.esp32_device.is_connected():
-                                progress_callback.emit('timeupdate')
-                            else:
-                                raise DisconnectionError('Device {} disconnected'.format(self.esp32_device.name))
-                    except (TypeError, DisconnectionError) as e:
-                        self.log.error("Char: {}, Error: {}".format(char, e))
-                        if self.esp32_device.is_connected():
-                            self.log.info('Disconnecting...')
-                            progress_callback.emit('disconnecting')
-                            status = self.esp32_device.is_connected()
-                            self.log.info('Connected: {}'.format(status))
-                            if self.quit_thread:
-                                break
-                            while True:
-                                if self.quit_thread:
-                                    break
-                                self.log.info('Assert Disconnection...')
-                                try:
-                                    self.esp32_device.disconnect(timeout=1)
-                                    time.sleep(1)
-                                    break
-                                except Exception as e:
-                                    self.log.error('Disconnection timeout')
-                                    time.sleep(5)
-
-                        else:
-                            self.log.info("Device disconnected")
-                            progress_callback.emit('disconnected')
-                            self.esp32_device.connected = False
-                            connect_loop = True
-                            time.sleep(4)
-                    except Exception as e:
-                        self.log.error("Char: {}, Error: {}".format(char, traceback.format_exc()))
-                        progress_callback.emit(False)
-                        if self.esp32_device.is_connected():
-                            self._timeout_count = 0
-                        else:
-                            self.log.info("Device disconnected")
-                            progress_callback.emit('disconnected')
-                            self.esp32_device.connected = False
-                            connect_loop = True
-                            time.sleep(4)
-                else:
-                    self._timeout_count = 0
-                    self.log.info("Trying to reconnect...")
-                    progress_callback.emit('reconnecting')
-                    self.esp32_device.connect()
-                    if self.esp32_device.connected:
-                        self.log.info("Device reconnected...")
-                        progress_callback.emit('connected')
-                        connect_loop = False
-                    else:
-                        self.log.info("Device unreachable...")
-                        self.log.info("Trying again in 30 seconds")
-                        for i in range(29):
-                            progress_callback.emit(['reconnect', i])
-                            time.sleep(1)
-                            if self.quit_thread:
-                                break
-                        if self.quit_thread:
-                            break
-            time.sleep(1)
-        progress_callback.emit("finished")
+        self.device_poller.run(progress_callback.emit)
         self.menu_thread_done = True
-        self.log.info("FINISHED")
 
     def start_update_menu(self):
         # Pass the function to execute
@@ -842,124 +701,14 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.threadpool.start(worker_menu)
 
     def receive_notification(self, response):
-
-        data = response
-        try:
-            for char_handle in data.keys():
-                char = self.esp32_device.notifiables_handles[char_handle]
-                if char != 'Battery Power State':
-                    try:
-                        data_value = get_char_value(data[char_handle], self.esp32_device.chars_xml[char])
-                    except struct.error:
-                        self.log.error("Notification Char: {}, Error: Wrong encoding format".format(char))
-                        data_value = {char: {"Value": " ", "Symbol":"?"}}
-                    if len(self.esp32_device.chars_xml[char].fields) == 1:
-                        # CHECK IF BITFIELD
-                        _bfield = False
-                        for field in self.esp32_device.chars_xml[char].fields:
-                            if 'BitField' in self.esp32_device.chars_xml[char].fields[field]:
-                                _bfield = True
-                        if not _bfield:
-                            data_value_string = pformat_char_value(data_value,
-                                                                   rtn=True,
-                                                                   prnt=False,
-                                                                   one_line=True,
-                                                                   only_val=True)
-                            self.char_actions_dict[char_handle].setText(
-                                "{}: {}".format(char, data_value_string))
-                            # SAVE FOR TOOLTIP
-                            for field in self.esp32_device.chars_xml[char].fields:
-                                self.tooltip_h_ch_field_values_dict[char_handle][char][field] = "{}: {}".format(field, data_value_string)
-                        else:
-                            # HANDLE BITFLAGS
-                            for field in self.esp32_device.chars_xml[char].fields:
-                                bitflagdict = data_value[field]['Value']
-                            data_value_string = '\n'.join(list(bitflagdict.values()))
-                            for _bitfield in bitflagdict:
-                                bitfield_text = "{}: {}".format(_bitfield, bitflagdict[_bitfield])
-                                self.char_fields_actions_dict[char_handle][_bitfield].setText(bitfield_text)
-                                # SAVE FOR TOOLTIP
-                                self.tooltip_h_ch_field_values_dict[char_handle][char][_bitfield] = bitfield_text
-                    else:
-                        field_strings = []
-                        for field in self.esp32_device.chars_xml[char].fields:
-                            # NORMAL FIELD
-                            if field in data_value:
-                                if 'BitField' not in self.esp32_device.chars_xml[char].fields[field]:
-                                    if "Reference" not in self.esp32_device.chars_xml[char].fields[field]:
-                                        field_val = self.esp32_device.pformat_field_value(data_value[field],
-                                                                                         rtn=True,
-                                                                                         prnt=False)
-                                    else:
-                                        # REFERENCE FIELD
-                                        reference = self.esp32_device.chars_xml[char].fields[field]["Reference"]
-                                        if field in data_value[field][reference]:
-                                            field_val = self.esp32_device.pformat_field_value(data_value[field][reference][field],
-                                                                                             rtn=True,
-                                                                                             prnt=False)
-                                        else:
-                                            if reference == 'Date Time':
-                                                field_val = self.esp32_device.pformat_field_value(data_value[field][reference],
-                                                                                                     rtn=True,
-                                                                                                     prnt=False,
-                                                                                                     timestamp=True)
-                                            else:
-                                                field_val = self.esp32_device.pformat_ref_char_value(data_value[field], rtn=True)
-
-                                    field_text = "{}: {}".format(field, field_val)
-                                    self.char_fields_actions_dict[char_handle][field].setText(field_text)
-                                    # SAVE FOR TOOLTIP
-                                    self.tooltip_h_ch_field_values_dict[char_handle][char][field] = field_text
-                                    field_strings.append(field_val)
-                                else:
-                                    # HANDLE BITFLAGS
-                                    bitflagdict = bitflagdict = data_value[field]['Value']
-                                    for _bitfield in bitflagdict:
-                                        field_strings.append(bitflagdict[_bitfield])
-                                        bitfield_text = "{}: {}".format(_bitfield, bitflagdict[_bitfield])
-                                        self.char_fields_bitfields_actions_dict[char_handle][field][_bitfield].setText(bitfield_text)
-                                        # SAVE FOR TOOLTIP
-                                        self.tooltip_h_ch_field_values_dict[char_handle][char][_bitfield] = bitfield_text
-
-                        data_value_string = ', '.join(field_strings)
-
-                    for serv in self.esp32_device.services_rsum.keys():
-                        if char in self.esp32_device.services_rsum[serv]:
-                            nservice = serv
-                    if self.do_desktop_notify_char_dict[char_handle]:
-                        self.notify("{}@{}:".format(self.esp32_device.name, nservice), "{} Is now: {}".format(
-                            char, data_value_string))
-
-                    for serv in self.esp32_device.services_rsum.keys():
-                        if char in self.esp32_device.services_rsum[serv]:
-                            self.log.info("Notification: [{}] {} : {}".format(serv, char, data_value_string))
-                else:
-                    try:
-                        data_value = get_char_value(data[char_handle], self.esp32_device.chars_xml[char])
-                    except struct.error:
-                        self.log.error("Notification Char: {}, Error: Wrong encoding format".format(char))
-                        data_value = {char: {"Value": " ", "Symbol":"?"}}
-                    self.esp32_device.batt_power_state = self.esp32_device.map_powstate(data_value['State']['Value'])
-                    for state, value in self.esp32_device.batt_power_state.items():
-                        self.battery_power_state_actions_dict[state].setText("{}: {}".format(state, value))
-                    for serv in self.esp32_device.services_rsum.keys():
-                        if char in self.esp32_device.services_rsum[serv]:
-                            nservice = serv
-                    if self.do_desktop_notify_char_dict[char_handle]:
-                        if self.esp32_device.batt_power_state['Level'] == 'Good Level':
-                            self.notify("{}@{}:".format(self.esp32_device.name, nservice), "{} Is now: {} {}".format(char, self.esp32_device.batt_power_state['Charging State'],
-                                                                                                              self.esp32_device.batt_power_state['Level']), typeicon='Info')
-                        else:
-                            self.notify("{}@{}:".format(self.esp32_device.name, nservice), "{} Is now: {} {}".format(char, self.esp32_device.batt_power_state['Charging State'],
-                                                                                                              self.esp32_device.batt_power_state['Level']))
-
-                    for serv in self.esp32_device.services_rsum.keys():
-                        if char in self.esp32_device.services_rsum[serv]:
-                            self.log.info("Notification: [{}] {} : {} {}".format(serv,
-                                                                                 char, self.esp32_device.batt_power_state['Charging State'],
-                                                                                 self.esp32_device.batt_power_state['Level']))
-        except Exception as e:
-            self.log.error(traceback.format_exc())
+        if response == 'values':
+            t0 = TIMINGS.start()
+            try:
+                self.apply_value_updates()
+            except Exception as e:
+                self.log.error(traceback.format_exc())
+            if t0:
+                TIMINGS.stop(RECEIVE_NOTIFICATION, response, t0)
 
     def subscribe_notify(self, progress_callback):  # run in thread
         qthread = threading.current_thread()
@@ -968,19 +717,29 @@ class SystemTrayIcon(QSystemTrayIcon):
         def readnotify_callback(sender_handle, data, callb=progress_callback):
 
             # char = uuidstr_to_str(cb_uuid_to_str(sender_uuid))
+            t0 = TIMINGS.start()
             try:
-                data_dict = {sender_handle: data}
-                callb.emit(data_dict)
+                char_state = self.char_states[sender_handle]
+                if METRICS.enabled:
+                    METRICS.inc(NOTIFICATIONS, char_state.char)
+                update = self.value_pipeline.process(char_state, bytes(data), notification=True)
+                if self.value_pipeline.submit(update):
+                    callb.emit('values')
+                if t0:
+                    TIMINGS.stop(NOTIFY_CALLBACK, char_state.char, t0)
             except Exception as e:
-                self.log.error(e)
+                self.log.error(traceback.format_exc())
 
         async def as_char_notify(notify_callback=readnotify_callback):
             aio_client_r, aio_client_w = await asyncio.open_connection('localhost', self.port)
             aio_client_w.write('started'.encode())
-            for char_handle in self.chars_to_notify_handles:
+            for char_handle in self.get_notifying_handles():
                 await self.esp32_device.ble_client.start_notify(char_handle, notify_callback)
                 self.log.info('Started Notification on: {}'.format(self.esp32_device.notifiables_handles[char_handle]))
+            t_trace = TRACE.start()
             await asyncio.sleep(1)
+            if t_trace:
+                TRACE.complete('sleep', t_trace)
             while True:
                 data = await aio_client_r.read(1024)
                 message = data.decode()
@@ -988,7 +747,7 @@ class SystemTrayIcon(QSystemTrayIcon):
                 if message == 'exit':
                     aio_client_w.write('ok'.encode())
                     self.log.info('{}'.format("Stopping notifications now..."))
-                    for char_handle in self.chars_to_notify_handles:
+                    for char_handle in self.get_notifying_handles():
                         if hasattr(self.esp32_device.ble_client, 'stop_notify'):
                             await self.esp32_device.ble_client.stop_notify(char_handle)
                     aio_client_w.close()
@@ -1005,7 +764,10 @@ class SystemTrayIcon(QSystemTrayIcon):
                     if action == 'stop':
                         await self.esp32_device.ble_client.stop_notify(char_handle)
                         self.log.info('Stopped Notification on: {}'.format(char))
+                    t_trace = TRACE.start()
                     await asyncio.sleep(1)
+                    if t_trace:
+                        TRACE.complete('sleep', t_trace)
 
         # GET NEW EVENT LOOP AND RUN
         try:
@@ -1046,20 +808,23 @@ class SystemTrayIcon(QSystemTrayIcon):
         self.set_tool_tip_dialog.show()
         self.set_tool_tip_dialog.raise_()
 
+    def show_adv_monitor(self):
+        if self.adv_monitor_widget is None:
+            self.adv_monitor_widget = AdvMonitorWidget(log=self.log,
+                                                       scan_service=self.scan_service)
+        self.adv_monitor_widget.show()
+        self.adv_monitor_widget.raise_()
+
+    def compile_tool_tip(self, choices):
+        self.log.info("Tool Tip Fields: {}".format(choices))
+        self.tool_tip_template.compile(choices, {char_handle: char_state.texts for char_handle, char_state
+                                                 in self.char_states.items()})
+        self.format_tool_tip()
+
     def format_tool_tip(self):
-        tooltip_string_list = []
-        for fld in self.checklist_choices:
-            _char, _field, _handle = *fld.split(':')[:-1], int(fld.split(':')[-1])
-            _field_value_string = self.tooltip_h_ch_field_values_dict[_handle][_char][_field]
-            for string_to_avoid in self.avoid_field_strings:
-                if string_to_avoid in _field_value_string:
-                    _field_value_string = _field_value_string.replace(string_to_avoid, '')
-            tooltip_string_list.append(_field_value_string)
-        if tooltip_string_list:
-            tool_tip_text = '\n'.join(tooltip_string_list)
+        tool_tip_text = self.tool_tip_template.render()
+        if tool_tip_text is not None:
             self.setToolTip(tool_tip_text)
-        else:
-            self.setToolTip('')
 
     def about_url(self):
         url = QUrl('https://github.com/Carglglz/bleico')
@@ -1102,11 +867,14 @@ class SystemTrayIcon(QSystemTrayIcon):
         # self.log.removeHandler(self.console_logger)
 
         self.log.info('Closing now...')
+        self.performance_timer.stop()
+        if TIMINGS.histograms:
+            self.log_timings()
         self.log.info('Done!')
         self.log.info('Shutdown pending tasks...')
         try:
             self.quit_thread = True
-            self.esp32_device.break_flag = self.quit_thread
+            self.device_poller.stop()
             if self.main_server:
                 self.main_server.send_message('exit')
                 self.main_server.recv_message()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+def parse_tool_tip_choice(choice):
+    """Split a ``"char:field:handle"`` checklist entry"""
+    char_field, handle = choice.rsplit(':', 1)
+    char, field = char_field.split(':', 1)
+    return char, field, int(handle)
+
+
+class ToolTipSlot:
+    """Cleaned text of one (handle, field) tooltip entry"""
+    __slots__ = ('raw', 'text')
+
+    def __init__(self):
+        self.raw = None
+        self.text = ''
+
+
+class ToolTipTemplate:
+    """
+    Tooltip compiled from the ``Set Tool Tip`` checklist selection.
+
+    :meth:`compile` parses the selection once into a list of slots,
+    :meth:`update` stores each field text already cleaned of
+    ``avoid_strings``, and :meth:`render` joins the slots, returning
+    ``None`` if nothing changed since the last render.
+    """
+
+    def __init__(self, avoid_strings=()):
+        self.avoid_strings = list(avoid_strings)
+        self.choices = []
+        self._slots = {}
+        self._template = []
+        self._dirty = True
+
+    def compile(self, choices, values=None):
+        """
+        :param choices: `list` of ``"char:field:handle"`` strings
+        :param values: current field texts, ``{handle: {field: text}}``
+        """
+        self.choices = list(choices)
+        self._slots = {}
+        self._template = []
+        for choice in self.choices:
+            char, field, handle = parse_tool_tip_choice(choice)
+            slot = self._slots.get((handle, field))
+            if slot is None:
+                slot = self._slots[(handle, field)] = ToolTipSlot()
+                if values is not None:
+                    try:
+                        self._set(slot, values[handle][field])
+                    except KeyError:
+                        pass
+            self._template.append(slot)
+        self._dirty = True
+
+    def clean(self, text):
+        for string_to_avoid in self.avoid_strings:
+            if string_to_avoid in text:
+                text = text.replace(string_to_avoid, '')
+        return text
+
+    def _set(self, slot, text):
+        if text != slot.raw:
+            slot.raw = text
+            slot.text = self.clean(text)
+            self._dirty = True
+
+    def update(self, handle, field, text):
+        slot = self._slots.get((handle, field))
+        if slot is not None:
+            self._set(slot, text)
+
+    def render(self):
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return '\n'.join([slot.text for slot in self._template])
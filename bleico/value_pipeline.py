@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import struct
+import threading
+import time
+from bleak_sigspec.utils import get_char_value
+from bleico.char_formatter import FormattedValue
+from bleico.stage_timer import TIMINGS, DECODE, FORMAT
+from bleico.metrics import METRICS, DECODE_ERRORS, NOTIFICATIONS_DROPPED
+from bleico.value_store import STORE
+from bleico.value_sinks import SINKS
+
+BATTERY_POWER_STATE = 'Battery Power State'
+
+
+class ValueUpdate:
+    """
+    Ready to apply update of one characteristic.
+
+    fvalue
+        :class:`bleico.char_formatter.FormattedValue`
+    notification
+        `True` if it comes from a notification
+    notify_title, notify_message, notify_typeicon
+        desktop notification, if any
+    t_ready
+        ``perf_counter_ns`` when it was queued, ``0`` unless timings are enabled
+    """
+    __slots__ = ('handle', 'fvalue', 'notification', 'timestamp',
+                 'notify_title', 'notify_message', 'notify_typeicon', 't_ready')
+
+    def __init__(self, handle, fvalue, notification=False):
+        self.handle = handle
+        self.fvalue = fvalue
+        self.notification = notification
+        self.timestamp = time.time()
+        self.notify_title = None
+        self.notify_message = None
+        self.notify_typeicon = 'Warning'
+        self.t_ready = 0
+
+
+class ValuePipeline:
+    """
+    Decode and format stage, run in the BLE worker threads.
+
+    :meth:`process` decodes a raw value and formats it with the
+    characteristic compiled formatter, :meth:`submit` queues the result
+    keeping only the latest update per handle, and the GUI thread
+    applies whatever is pending with :meth:`drain`.
+
+    :param char_states: handle --> CharacteristicState table
+    :param dev: BLE_DEVICE
+    """
+
+    def __init__(self, char_states, dev=None, log=None):
+        self.char_states = char_states
+        self.dev = dev
+        self.log = log
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.coalesced = 0
+        self.decode_errors = 0
+
+    def decode(self, char_state, raw, notification=False):
+        t0 = TIMINGS.start()
+        try:
+            value = get_char_value(raw, char_state.xml_char)
+            if t0:
+                TIMINGS.stop(DECODE, char_state.char, t0)
+            if STORE.enabled:
+                STORE.record(self.dev.UUID if self.dev is not None else None,
+                             char_state.char, value)
+            if SINKS.enabled:
+                SINKS.record({'t': time.time(),
+                              'address': self.dev.UUID if self.dev is not None else None,
+                              'service': char_state.service, 'char': char_state.char,
+                              'handle': char_state.handle, 'notify': notification,
+                              'value': value, 'raw': raw.hex()})
+            return value
+        except struct.error:
+            self.decode_errors += 1
+            METRICS.inc(DECODE_ERRORS, char_state.char)
+            if self.log:
+                self.log.error("Char: {}, Error: Wrong encoding format".format(char_state.char))
+            return {char_state.char: {"Value": " ", "Symbol": "?"}}
+
+    def process(self, char_state, raw, notification=False):
+        """Decode and format a raw value, returns a ValueUpdate"""
+        char_state.raw = raw
+        char_state.value = self.decode(char_state, raw, notification=notification)
+        if notification:
+            char_state.last_notify = time.time()
+        else:
+            char_state.last_read = time.time()
+        if char_state.char == BATTERY_POWER_STATE:
+            update = self._process_power_state(char_state)
+        else:
+            t0 = TIMINGS.start()
+            if char_state.formatter is not None:
+                fvalue = char_state.formatter.format(char_state.value,
+                                                     notification=notification)
+            else:
+                fvalue = FormattedValue()
+            if t0:
+                TIMINGS.stop(FORMAT, char_state.char, t0)
+            update = ValueUpdate(char_state.handle, fvalue, notification=notification)
+            if notification:
+                if char_state.desktop_notify:
+                    update.notify_title = "{}@{}:".format(self.dev.name, char_state.service)
+                    update.notify_message = "{} Is now: {}".format(char_state.char,
+                                                                   update.fvalue.summary)
+                if self.log:
+                    self.log.info("Notification: [{}] {} : {}".format(char_state.service,
+                                                                     char_state.char,
+                                                                     update.fvalue.summary))
+            elif self.log:
+                for line in update.fvalue.log_lines:
+                    self.log.info(line)
+        self.processed += 1
+        update.t_ready = TIMINGS.start()
+        return update
+
+    def _process_power_state(self, char_state):
+        fvalue = FormattedValue()
+        batt_power_state = self.dev.map_powstate(char_state.value['State']['Value'])
+        self.dev.batt_power_state = batt_power_state
+        for state, value in batt_power_state.items():
+            if state in char_state.field_actions:
+                fvalue.updates.append((char_state.field_actions[state],
+                                       "{}: {}".format(state, value)))
+        fvalue.summary = "{} {}".format(batt_power_state['Charging State'],
+                                        batt_power_state['Level'])
+        update = ValueUpdate(char_state.handle, fvalue, notification=True)
+        if char_state.desktop_notify:
+            update.notify_title = "{}@{}:".format(self.dev.name, char_state.service)
+            update.notify_message = "{} Is now: {}".format(char_state.char, fvalue.summary)
+            if batt_power_state['Level'] == 'Good Level':
+                update.notify_typeicon = 'Info'
+        if self.log:
+            self.log.info("Notification: [{}] {} : {}".format(char_state.service,
+                                                             char_state.char,
+                                                             fvalue.summary))
+        return update
+
+    def submit(self, update):
+        """
+        Queue an update, replacing a pending one for the same handle.
+        Returns `True` if the queue was empty, i.e. the GUI thread needs
+        to be signaled.
+        """
+        with self._lock:
+            was_empty = not self._pending
+            replaced = self._pending.get(update.handle)
+            if replaced is not None:
+                self.coalesced += 1
+            self._pending[update.handle] = update
+        if replaced is not None and replaced.notification:
+            METRICS.inc(NOTIFICATIONS_DROPPED, self.char_states[update.handle].char)
+        return was_empty
+
+    def drain(self):
+        with self._lock:
+            updates = list(self._pending.values())
+            self._pending = {}
+        return updates
+
+    def pending(self):
+        return len(self._pending)
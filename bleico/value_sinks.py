@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Output sinks of decoded values. Every value decoded by the value
+# pipeline is handed to each sink as a record, the daemon output line:
+#
+#   {"t": ..., "address": ..., "service": ..., "char": ..., "handle": ...,
+#    "notify": false, "value": {...}, "raw": "hex"}
+#
+# Each sink has its own bounded queue and worker thread: put() only
+# appends to the queue, the worker writes whatever is pending in
+# batches, and a full queue drops the new records, so a slow or
+# unreachable output never blocks the BLE threads nor the other sinks.
+
+import csv
+import json
+import os
+import select
+import socket
+import sys
+import time
+import traceback
+from urllib.parse import urlsplit, unquote
+from bleico.batch_writer import BatchWriter
+from bleico.metrics import METRICS, SINK_DROPPED
+from bleico.value_store import numeric_fields
+
+CSV_COLUMNS = ('t', 'address', 'char', 'field', 'value', 'unit')
+
+# MQTT 3.1.1 control packets (QoS 0 only)
+MQTT_CONNECT = 0x10
+MQTT_CONNACK = 0x20
+MQTT_PUBLISH = 0x30
+MQTT_PINGREQ = b'\xc0\x00'
+MQTT_DISCONNECT = b'\xe0\x00'
+MQTT_PORT = 1883
+
+
+class ValueSink(BatchWriter):
+    """
+    Base output sink, subclasses implement :meth:`write` and optionally
+    :meth:`open`, :meth:`close` and :meth:`idle`.
+
+    :meth:`put` queues a record (see :class:`bleico.batch_writer.BatchWriter`),
+    drops are also counted in the ``bleico_sink_dropped_total`` metric.
+    The worker thread calls :meth:`write` with up to ``batch_size``
+    records at a time. If opening or writing fails the batch is dropped,
+    the sink is closed and opened again after ``retry_interval`` seconds.
+    """
+    name = 'sink'
+
+    def __init__(self, max_pending=4096, batch_size=256, flush_interval=0.25,
+                 retry_interval=5, log=None):
+        super().__init__(flush_interval=flush_interval, batch_size=batch_size,
+                         max_pending=max_pending, log=log)
+        self.thread_name = 'SinkThread-{}'.format(self.name)
+        self.retry_interval = retry_interval
+        self.sent = 0
+        self.errors = 0
+        self._opened = False
+        self._t_retry = 0
+
+    def __repr__(self):
+        return '{} sink'.format(self.name)
+
+    def put(self, record):
+        self._queue(record)
+
+    def start(self):
+        self._start_thread()
+
+    def stop(self):
+        """Write what is pending (or drop it if the sink is failing) and close"""
+        if self._thread is None:
+            return
+        self._stop_thread()
+        if self.log:
+            self.log.info('{}: {} values sent, {} dropped'.format(self, self.sent,
+                                                                 self.dropped))
+
+    # SUBCLASSES
+
+    def open(self):
+        pass
+
+    def write(self, records):
+        """Write a batch, returns the number of records dropped, if any"""
+        raise NotImplementedError
+
+    def idle(self):
+        """Called by the worker when the queue is empty (e.g. keepalives)"""
+        pass
+
+    def close(self):
+        pass
+
+    # WORKER THREAD
+
+    def _finish(self):
+        if self.pending:
+            self._drop(len(self.pending))
+            self.pending.clear()
+        if self._opened:
+            self._close()
+
+    def _write_pending(self):
+        while self.pending:
+            if not self._opened and not self._open():
+                return
+            batch = []
+            while self.pending and len(batch) < self.batch_size:
+                batch.append(self.pending.popleft())
+            try:
+                self.sent += len(batch) - (self.write(batch) or 0)
+            except Exception as e:
+                self._drop(len(batch))
+                self._fail(e)
+                return
+        if self._opened:
+            try:
+                self.idle()
+            except Exception as e:
+                self._fail(e)
+
+    def _open(self):
+        if time.monotonic() < self._t_retry:
+            return False
+        try:
+            self.open()
+            self._opened = True
+            return True
+        except Exception as e:
+            self._fail(e)
+            return False
+
+    def _close(self):
+        self._opened = False
+        try:
+            self.close()
+        except Exception as e:
+            pass
+
+    def _fail(self, error):
+        self.error = error
+        self.errors += 1
+        if self.log:
+            if isinstance(error, OSError):
+                self.log.error('{}: {}'.format(self, error))
+            else:
+                self.log.error(traceback.format_exc())
+        self._close()
+        self._t_retry = time.monotonic() + self.retry_interval
+
+    def _drop(self, n_records):
+        self.dropped += n_records
+        METRICS.inc(SINK_DROPPED, self.name, amount=n_records)
+
+
+class JsonLinesSink(ValueSink):
+    """Records appended to a file as JSON lines, ``'-'`` for stdout"""
+    name = 'jsonl'
+
+    def __init__(self, path, **kwargs):
+        super().__init__(flush_interval=kwargs.pop('flush_interval', 1.0), **kwargs)
+        self.path = path if path == '-' else os.path.expanduser(path)
+        self._file = None
+        self._encode = json.JSONEncoder(separators=(',', ':'), default=str).encode
+
+    def open(self):
+        if self.path == '-':
+            self._file = open(sys.stdout.fileno(), 'w', closefd=False)
+        else:
+            self._file = open(self.path, 'a')
+
+    def write(self, records):
+        encode = self._encode
+        self._file.write(''.join([encode(record) + '\n' for record in records]))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink(ValueSink):
+    """
+    Numeric fields appended to a CSV file, one row per field value:
+    ``t, address, char, field, value, unit`` (see
+    :func:`bleico.value_store.numeric_fields`), with a header line if
+    the file is new.
+    """
+    name = 'csv'
+
+    def __init__(self, path, **kwargs):
+        super().__init__(flush_interval=kwargs.pop('flush_interval', 1.0), **kwargs)
+        self.path = os.path.expanduser(path)
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    def open(self):
+        new = not os.path.exists(self.path) or not os.path.getsize(self.path)
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(CSV_COLUMNS)
+
+    def write(self, records):
+        rows = [(record['t'], record['address'], record['char'], field, number, unit)
+                for record in records if isinstance(record['value'], dict)
+                for field, number, unit in numeric_fields(record['value'])]
+        self._writer.writerows(rows)
+        self._file.flush()
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class UdpSink(ValueSink):
+    """
+    Records sent as JSON lines in UDP datagrams to ``host:port``, as
+    many lines per datagram as fit in ``max_datagram`` bytes. Datagrams
+    the kernel does not take right away are dropped, not waited for.
+    """
+    name = 'udp'
+
+    def __init__(self, host, port, max_datagram=1400, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.max_datagram = max_datagram
+        self.datagrams = 0
+        self._address = None
+        self._socket = None
+        self._encode = json.JSONEncoder(separators=(',', ':'), default=str).encode
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if url.hostname is None or url.port is None:
+            raise ValueError('UDP sink needs a host and a port: udp://host:port')
+        return cls(url.hostname, url.port, **kwargs)
+
+    def open(self):
+        family, kind, proto, name, self._address = socket.getaddrinfo(
+            self.host, self.port, type=socket.SOCK_DGRAM)[0]
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def write(self, records):
+        datagram = b''
+        n_lines = 0
+        dropped = 0
+        for record in records:
+            line = self._encode(record).encode() + b'\n'
+            if datagram and len(datagram) + len(line) > self.max_datagram:
+                dropped += self._send(datagram, n_lines)
+                datagram = b''
+                n_lines = 0
+            datagram += line
+            n_lines += 1
+        if datagram:
+            dropped += self._send(datagram, n_lines)
+        if dropped:
+            self._drop(dropped)
+        return dropped
+
+    def _send(self, datagram, n_lines):
+        try:
+            self._socket.sendto(datagram, self._address)
+            self.datagrams += 1
+            return 0
+        except (BlockingIOError, ConnectionRefusedError):
+            return n_lines
+
+    def close(self):
+        self._socket.close()
+
+
+class MqttSink(ValueSink):
+    """
+    Records published to an MQTT broker (MQTT 3.1.1, QoS 0), one
+    message per value: topic ``<topic>/<address>/<char>``, payload the
+    record as JSON. Each batch goes out in one ``sendall``. A PINGREQ
+    is sent when nothing was published for half the ``keepalive``, and
+    the connection is opened again if the broker closes it.
+    """
+    name = 'mqtt'
+
+    def __init__(self, host, port=MQTT_PORT, topic='bleico', client_id=None,
+                 username=None, password=None, keepalive=60, timeout=5, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.topic = topic.strip('/')
+        self.client_id = client_id or 'bleico-{}'.format(os.getpid())
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.connections = 0
+        self._socket = None
+        self._topics = {}  # (address, char) --> encoded topic
+        self._t_sent = 0
+        self._encode = json.JSONEncoder(separators=(',', ':'), default=str).encode
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """``mqtt://[user:password@]host[:port][/topic]``"""
+        if url.hostname is None:
+            raise ValueError('MQTT sink needs a host: mqtt://host[:port][/topic]')
+        return cls(url.hostname, url.port or MQTT_PORT, topic=url.path.strip('/') or 'bleico',
+                   username=unquote(url.username) if url.username else None,
+                   password=unquote(url.password) if url.password else None, **kwargs)
+
+    @staticmethod
+    def packet(kind, body):
+        """Fixed header (``kind``, remaining length) + ``body``"""
+        header = bytearray([kind])
+        length = len(body)
+        while True:
+            byte = length & 0x7F
+            length >>= 7
+            header.append(byte | 0x80 if length else byte)
+            if not length:
+                return bytes(header) + body
+
+    @staticmethod
+    def string(text):
+        data = text.encode()
+        return len(data).to_bytes(2, 'big') + data
+
+    def open(self):
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        flags = 0x02  # clean session
+        payload = self.string(self.client_id)
+        if self.username is not None:
+            flags |= 0x80
+            payload += self.string(self.username)
+            if self.password is not None:
+                flags |= 0x40
+                payload += self.string(self.password)
+        self._socket.sendall(self.packet(MQTT_CONNECT, self.string('MQTT') + bytes([4, flags]) +
+                                         self.keepalive.to_bytes(2, 'big') + payload))
+        connack = b''
+        while len(connack) < 4:
+            data = self._socket.recv(4 - len(connack))
+            if not data:
+                raise ConnectionError('MQTT broker closed the connection')
+            connack += data
+        if connack[0] != MQTT_CONNACK or connack[3] != 0:
+            raise ConnectionError('MQTT connection refused, return code {}'.format(connack[3]))
+        self._t_sent = time.monotonic()
+        self.connections += 1
+        if self.log:
+            self.log.info('{}: connected to {}:{}'.format(self, self.host, self.port))
+
+    def topic_for(self, address, char):
+        key = (address, char)
+        topic = self._topics.get(key)
+        if topic is None:
+            levels = [str(level).replace('/', '_').replace('+', '_').replace('#', '_')
+                      for level in (address, char)]
+            topic = self._topics[key] = self.string('/'.join([self.topic] + levels))
+        return topic
+
+    def write(self, records):
+        encode = self._encode
+        self._socket.sendall(b''.join([
+            self.packet(MQTT_PUBLISH, self.topic_for(record['address'], record['char']) +
+                        encode(record).encode()) for record in records]))
+        self._t_sent = time.monotonic()
+
+    def idle(self):
+        # PINGRESP or the broker closing the connection
+        if select.select([self._socket], [], [], 0)[0] and not self._socket.recv(4096):
+            raise ConnectionError('MQTT broker closed the connection')
+        if self.keepalive and time.monotonic() - self._t_sent >= self.keepalive / 2:
+            self._socket.sendall(MQTT_PINGREQ)
+            self._t_sent = time.monotonic()
+
+    def close(self):
+        try:
+            self._socket.sendall(MQTT_DISCONNECT)
+        finally:
+            self._socket.close()
+
+
+# url scheme --> sink class (with a from_url classmethod)
+SINK_SCHEMES = {'udp': UdpSink, 'mqtt': MqttSink}
+
+
+def sink_from_spec(spec, log=None, **kwargs):
+    """
+    ``-sink`` option --> sink: ``udp://host:port``,
+    ``mqtt://[user:password@]host[:port][/topic]``, a ``.csv`` file or
+    else a JSON lines file (``-`` for stdout)
+    """
+    url = urlsplit(spec)
+    if url.scheme in SINK_SCHEMES:
+        return SINK_SCHEMES[url.scheme].from_url(url, log=log, **kwargs)
+    if '://' in spec:
+        raise ValueError('Unknown sink: {}, use a file, {}'.format(
+            spec, ', '.join('{}://'.format(scheme) for scheme in SINK_SCHEMES)))
+    if spec.endswith('.csv'):
+        return CsvSink(spec, log=log, **kwargs)
+    return JsonLinesSink(spec, log=log, **kwargs)
+
+
+class ValueSinks:
+    """Fan out of the pipeline records to every started sink"""
+
+    def __init__(self):
+        self.sinks = []
+        self.enabled = False
+
+    def add(self, sink):
+        sink.start()
+        self.sinks.append(sink)
+        self.enabled = True
+        if sink.log:
+            sink.log.info('Sending decoded values to {}'.format(sink))
+
+    def record(self, record):
+        for sink in self.sinks:
+            sink.put(record)
+
+    def stop(self):
+        self.enabled = False
+        for sink in self.sinks:
+            sink.stop()
+        self.sinks = []
+
+
+# process wide sinks, see the -sink option
+SINKS = ValueSinks()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2020 Carlos G. Gonzalez and others (see the AUTHORS file).
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Decoded value store, SQLite in WAL mode:
+#   series        one row per (address, characteristic, field), with its unit
+#   samples       (series, t, value), every numeric field value
+#   rollup_minute (series, t, n, sum_value, min_value, max_value) per minute
+#   rollup_hour   same, per hour
+# Rollups are merged (upsert) by the writer thread with each batch, so
+# they are always up to date and never computed from the samples.
+
+import os
+import sqlite3
+import time
+from bleico.batch_writer import BatchWriter
+
+# tier --> bucket seconds
+TIERS = {'raw': 0, 'minute': 60, 'hour': 3600}
+# tier --> seconds kept, 0 for ever
+RETENTION = {'raw': 7 * 86400, 'minute': 90 * 86400, 'hour': 0}
+# auto tier: the finest one with at most this span
+AUTO_SPAN = {'raw': 3600, 'minute': 7 * 86400, 'hour': 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY, address TEXT, char TEXT, field TEXT, unit TEXT,
+    UNIQUE (address, char, field));
+CREATE TABLE IF NOT EXISTS samples (series INTEGER, t REAL, value REAL);
+CREATE INDEX IF NOT EXISTS samples_series_t ON samples (series, t);
+CREATE TABLE IF NOT EXISTS rollup_minute (
+    series INTEGER, t INTEGER, n INTEGER, sum_value REAL, min_value REAL, max_value REAL,
+    PRIMARY KEY (series, t)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_hour (
+    series INTEGER, t INTEGER, n INTEGER, sum_value REAL, min_value REAL, max_value REAL,
+    PRIMARY KEY (series, t)) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO rollup_{} (series, t, n, sum_value, min_value, max_value) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (series, t) DO UPDATE SET
+    n = n + excluded.n, sum_value = sum_value + excluded.sum_value,
+    min_value = min(min_value, excluded.min_value),
+    max_value = max(max_value, excluded.max_value)
+"""
+
+
+def _leaves(field_value, key):
+    if 'Value' in field_value:
+        number = field_value['Value']
+        if isinstance(number, (int, float)) and not isinstance(number, bool):
+            yield key, number, field_value.get('Symbol') or field_value.get('Unit')
+        return
+    for sub_key, sub_value in field_value.items():
+        if isinstance(sub_value, dict):
+            yield from _leaves(sub_value, sub_key)
+
+
+def numeric_fields(value):
+    """
+    Decoded value (``get_char_value``) --> `list` of (field, number,
+    unit), fields without a numeric value are skipped. Values of
+    referenced characteristics (e.g. Temperature Range) are named after
+    the top level field, ``field/name`` if it has several.
+    """
+    fields = []
+    for field, field_value in value.items():
+        if not isinstance(field_value, dict):
+            continue
+        leaves = list(_leaves(field_value, field))
+        if len(leaves) == 1:
+            fields.append((field,) + leaves[0][1:])
+        else:
+            fields.extend(('{}/{}'.format(field, key), number, unit)
+                          for key, number, unit in leaves)
+    return fields
+
+
+class ValueStore(BatchWriter):
+    """
+    Time series of decoded field values in a local SQLite database.
+
+    :meth:`record` only queues the decoded value (see
+    :class:`bleico.batch_writer.BatchWriter`), each batch is inserted in
+    one transaction, one row per numeric field, and merged into the
+    per-minute and per-hour rollups (count, sum, min, max). Every
+    ``prune_interval`` seconds rows older than ``retention`` (tier -->
+    seconds, see ``RETENTION``) are deleted.
+
+    :meth:`query` picks the tier from the time span, so long spans are
+    answered from the rollups without scanning the samples.
+    """
+    thread_name = 'StoreThread'
+
+    def __init__(self, retention=None, flush_interval=1.0, batch_size=1024,
+                 max_pending=1 << 16, prune_interval=600, log=None):
+        super().__init__(flush_interval=flush_interval, batch_size=batch_size,
+                         max_pending=max_pending, log=log)
+        self.retention = dict(RETENTION)
+        if retention:
+            self.retention.update(retention)
+        self.prune_interval = prune_interval
+        self.path = None
+        self.enabled = False
+        self.values = 0
+        self.samples = 0
+        self._db = None
+        self._series = {}  # (address, char, field) --> series id
+        self._t_pruned = 0
+
+    def start(self, path):
+        self.path = os.path.expanduser(path)
+        self._db = self.connect()
+        self._db.executescript(SCHEMA)
+        self._series = {(address, char, field): series_id for series_id, address, char, field
+                        in self._db.execute('SELECT id, address, char, field FROM series')}
+        self._start_thread()
+        self.enabled = True
+        if self.log:
+            self.log.info('Storing decoded values in {}'.format(self.path))
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.enabled = False
+        self._stop_thread()
+        self._db.close()
+        self._db = None
+        if self.log:
+            self.log.info('Stored {} values ({} field samples), {} dropped'.format(
+                self.values, self.samples, self.dropped))
+
+    def connect(self):
+        """New connection to the database (one per thread)"""
+        db = sqlite3.connect(os.path.expanduser(self.path), check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def record(self, address, char, value, t=None):
+        """Queue a decoded value (``get_char_value`` result) of ``char``, at ``t`` or now"""
+        self._queue((time.time() if t is None else t, address, char, value))
+
+    # WRITER THREAD
+
+    def _flush(self, stopping):
+        self._write_pending()
+        if time.time() - self._t_pruned >= self.prune_interval or stopping:
+            self.prune()
+
+    def _series_id(self, address, char, field, unit):
+        key = (address, char, field)
+        series_id = self._series.get(key)
+        if series_id is None:
+            self._db.execute('INSERT OR IGNORE INTO series (address, char, field, unit) '
+                             'VALUES (?, ?, ?, ?)', (address, char, field, unit))
+            series_id, = self._db.execute(
+                'SELECT id FROM series WHERE address IS ? AND char = ? AND field = ?',
+                key).fetchone()
+            self._series[key] = series_id
+        return series_id
+
+    def _write_pending(self):
+        if not self.pending:
+            return
+        rows = []
+        rollups = {tier: {} for tier in TIERS if TIERS[tier]}
+        n_values = 0
+        with self._db:
+            while self.pending:
+                t, address, char, value = self.pending.popleft()
+                n_values += 1
+                for field, number, unit in numeric_fields(value):
+                    series_id = self._series_id(address, char, field, unit)
+                    rows.append((series_id, t, number))
+                    for tier, buckets in rollups.items():
+                        key = (series_id, int(t // TIERS[tier] * TIERS[tier]))
+                        bucket = buckets.get(key)
+                        if bucket is None:
+                            buckets[key] = [1, number, number, number]
+                        else:
+                            bucket[0] += 1
+                            bucket[1] += number
+                            if number < bucket[2]:
+                                bucket[2] = number
+                            if number > bucket[3]:
+                                bucket[3] = number
+            self._db.executemany('INSERT INTO samples (series, t, value) VALUES (?, ?, ?)',
+                                 rows)
+            for tier, buckets in rollups.items():
+                self._db.executemany(ROLLUP_UPSERT.format(tier),
+                                     [key + tuple(bucket) for key, bucket in buckets.items()])
+        self.values += n_values
+        self.samples += len(rows)
+
+    def prune(self):
+        """Delete the rows older than the retention of each tier"""
+        now = time.time()
+        series_ids = list(self._series.values())
+        with self._db:
+            for tier, seconds in self.retention.items():
+                if not seconds:
+                    continue
+                table = 'samples' if tier == 'raw' else 'rollup_' + tier
+                # per series, through the (series, t) index
+                self._db.executemany('DELETE FROM {} WHERE series = ? AND t < ?'.format(table),
+                                     [(series_id, now - seconds) for series_id in series_ids])
+        self._t_pruned = now
+
+    # QUERIES
+
+    def tier(self, since, until=None):
+        """Finest tier that keeps ``since`` and spans ``until - since``"""
+        until = time.time() if until is None else until
+        age = time.time() - since
+        for tier in TIERS:
+            kept = not self.retention[tier] or age <= self.retention[tier]
+            if kept and (not AUTO_SPAN[tier] or until - since <= AUTO_SPAN[tier]):
+                return tier
+        return 'hour'
+
+    def query(self, char, field=None, address=None, since=None, until=None, tier=None,
+              db=None):
+        """
+        Values of ``char`` (optionally one ``field`` and one device
+        ``address``) from ``since`` (default: 1 hour ago) to ``until``
+        (default: now), `list` of one `dict` per series::
+
+            {"address": ..., "char": ..., "field": ..., "unit": ...,
+             "tier": "raw", "points": [[t, value], ...]}
+
+        with ``[t, n, min, mean, max]`` points for the ``minute`` and
+        ``hour`` tiers (``t`` is the start of the bucket). ``tier``
+        defaults to :meth:`tier`. Runs on a new connection unless ``db``.
+        """
+        until = time.time() if until is None else until
+        since = until - 3600 if since is None else since
+        tier = tier or self.tier(since, until)
+        if tier not in TIERS:
+            raise ValueError('Unknown tier: {}, use {}'.format(tier, ', '.join(TIERS)))
+        own_db = db is None
+        db = self.connect() if own_db else db
+        try:
+            sql = 'SELECT id, address, char, field, unit FROM series WHERE char = ?'
+            params = [char]
+            if field is not None:
+                sql += ' AND field = ?'
+                params.append(field)
+            if address is not None:
+                sql += ' AND address = ?'
+                params.append(address)
+            result = []
+            for series_id, series_address, series_char, series_field, unit in db.execute(
+                    sql + ' ORDER BY id', params).fetchall():
+                if tier == 'raw':
+                    points = db.execute('SELECT t, value FROM samples WHERE series = ? AND '
+                                        't >= ? AND t < ? ORDER BY t',
+                                        (series_id, since, until)).fetchall()
+                else:
+                    width = TIERS[tier]
+                    points = db.execute(
+                        'SELECT t, n, min_value, sum_value / n, max_value FROM rollup_{} '
+                        'WHERE series = ? AND t >= ? AND t < ? ORDER BY t'.format(tier),
+                        (series_id, int(since // width * width), until)).fetchall()
+                result.append({'address': series_address, 'char': series_char,
+                               'field': series_field, 'unit': unit, 'tier': tier,
+                               'points': [list(point) for point in points]})
+            return result
+        finally:
+            if own_db:
+                db.close()
+
+
+# process wide store, see the -store option
+STORE = ValueStore()
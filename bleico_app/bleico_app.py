@@ -18,13 +18,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
 import sys
-from bleico.systrayicon import SystemTrayIcon
-from bleico.ble_scanner_widget import BleScanner
 import os
-from bleico.devtools import load_dev
-from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import QCoreApplication
 from bleico import version as bleico_version
 
 frozen = 'not'
@@ -53,50 +47,67 @@ $$ |  $$ |$$ |      $$ |        $$ |  $$ |  $$\ $$ |  $$ |
 $$$$$$$  |$$$$$$$$\ $$$$$$$$\ $$$$$$\ \$$$$$$  | $$$$$$  |
 \_______/ \________|\________|\______| \______/  \______/
     """
-print('*'*60)
-print(banner)
-print('*'*60)
-
-if '.bleico' not in os.listdir(os.environ['HOME']):
-    os.mkdir(os.path.join(os.environ['HOME'], ".bleico"))
 
 config_file_name = 'bleico_.config'
 config_file_path = os.path.join(os.environ['HOME'], ".bleico")
-device_is_configured = config_file_name in os.listdir(config_file_path)
-# Logging Setup
-
-log_levels = {'debug': logging.DEBUG, 'info': logging.INFO,
-              'warning': logging.WARNING, 'error': logging.ERROR,
-              'critical': logging.CRITICAL}
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(log_levels['info'])
-logging.basicConfig(
-    level=log_levels['debug'],
-    format="%(asctime)s [%(name)s] [%(threadName)s] [%(levelname)s] %(message)s",
-    # format="%(asctime)s [%(name)s] [%(process)d] [%(threadName)s] [%(levelname)s]  %(message)s",
-    handlers=[handler])
-
 log = logging.getLogger('bleico')
-# DEBUG TO LOG FILE
-# logfolder = 'logs'
-# logPath = os.path.join(config_file_path, logfolder)
-# if logfolder not in os.listdir(config_file_path):
-#     os.mkdir(logPath)
-# logfileName = 'bleico_debug.log'
-# # Filehandler for error
-# fh_err = logging.FileHandler(os.path.join(logPath, logfileName))
-# fh_err.setLevel(log_levels['info'])
-# # Formatter for errors
-# fmt_err = logging.Formatter("%(asctime)s [%(name)s] [%(threadName)s] [%(levelname)s]  %(message)s")
-# fh_err.setFormatter(fmt_err)
-# log.addHandler(fh_err)
-
-log.info('Running bleico {}'.format(bleico_version))
+
+
+def setup():
+    """Banner, ~/.bleico directory and logging, done on start, not on import"""
+    print('*'*60)
+    print(banner)
+    print('*'*60)
+
+    if '.bleico' not in os.listdir(os.environ['HOME']):
+        os.mkdir(config_file_path)
+
+    # Logging Setup
+
+    log_levels = {'debug': logging.DEBUG, 'info': logging.INFO,
+                  'warning': logging.WARNING, 'error': logging.ERROR,
+                  'critical': logging.CRITICAL}
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(log_levels['info'])
+    logging.basicConfig(
+        level=log_levels['debug'],
+        format="%(asctime)s [%(name)s] [%(threadName)s] [%(levelname)s] %(message)s",
+        # format="%(asctime)s [%(name)s] [%(process)d] [%(threadName)s] [%(levelname)s]  %(message)s",
+        handlers=[handler])
+
+    # DEBUG TO LOG FILE
+    # logfolder = 'logs'
+    # logPath = os.path.join(config_file_path, logfolder)
+    # if logfolder not in os.listdir(config_file_path):
+    #     os.mkdir(logPath)
+    # logfileName = 'bleico_debug.log'
+    # # Filehandler for error
+    # fh_err = logging.FileHandler(os.path.join(logPath, logfileName))
+    # fh_err.setLevel(log_levels['info'])
+    # # Formatter for errors
+    # fmt_err = logging.Formatter("%(asctime)s [%(name)s] [%(threadName)s] [%(levelname)s]  %(message)s")
+    # fh_err.setFormatter(fmt_err)
+    # log.addHandler(fh_err)
+
+    log.info('Running bleico {}'.format(bleico_version))
 
 
 def main():
+    setup()
+    from bleico.systrayicon import SystemTrayIcon
+    from bleico.ble_scanner_widget import BleScanner
+    from bleico.scan_cache import get_scan_cache
+    from bleico.devtools import load_dev
+    from PyQt5.QtGui import QIcon
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QCoreApplication
+    device_is_configured = config_file_name in os.listdir(config_file_path)
     app = QApplication([])
     app.setQuitOnLastWindowClosed(False)
+    # Last seen devices, persisted in ~/.bleico
+    scan_cache = get_scan_cache(path=os.path.join(config_file_path, 'scan_cache.json'),
+                                log=log)
+    app.aboutToQuit.connect(scan_cache.save)
 
     # Open Bledevice configuration
     if device_is_configured: